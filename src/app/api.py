@@ -0,0 +1,251 @@
+import hmac
+import gzip
+import json
+import base64
+from datetime import datetime as dt, date
+from flask import Blueprint, Response, current_app, request, session, url_for
+from sqlalchemy import select
+from db import Report, Rescue, Ong, Events
+from citycodes import cityClause
+from pagination import InvalidCursor
+from storage import readEngine
+
+
+class Resource:
+    """
+    Uma coleção da API: campos (nome na API -> coluna), filtros disponíveis
+    e se exige autenticação. Sem ?fields= saem todos menos os restritos
+    (contato de quem fez o caso e a localização exata), que só tokens de
+    API_CONTACT_TOKENS podem pedir. Campos de foto saem como URL.
+    """
+
+    def __init__(self, model, fields, status=None, since=None, ong=None, photo=None,
+                 private=False, restricted=()):
+        self.model = model
+        self.fields = fields
+        self.id_col = fields['id']
+        self.status = status
+        self.since = since
+        self.ong = ong
+        self.photo = photo
+        self.private = private
+        self.restricted = frozenset(restricted)
+        self.defaults = [name for name in fields if name not in self.restricted]
+
+
+RESOURCES = {
+    'reports': Resource(Report, {
+        'id': Report.rep_id, 'title': Report.rep_title, 'description': Report.rep_desc,
+        'city': Report.rep_city, 'city_id': Report.rep_city_id, 'address': Report.rep_address,
+        'date': Report.rep_date, 'status': Report.rep_status, 'phone': Report.rep_phone,
+        'email': Report.rep_email, 'photo': Report.rep_photo, 'ong_id': Report.rep_ong_id,
+        'lat': Report.rep_lat, 'lon': Report.rep_lon, 'created_at': Report.rep_created_at,
+    }, status=Report.rep_status, since=Report.rep_created_at, ong=Report.rep_ong_id, photo='photo', private=True,
+       restricted=('phone', 'email', 'lat', 'lon')),
+    'rescues': Resource(Rescue, {
+        'id': Rescue.resc_id, 'author': Rescue.resc_author, 'description': Rescue.resc_desc,
+        'city': Rescue.resc_city, 'city_id': Rescue.resc_city_id, 'address': Rescue.resc_addr,
+        'number': Rescue.resc_num, 'cep': Rescue.resc_cep, 'date': Rescue.resc_date,
+        'status': Rescue.resc_status, 'phone': Rescue.resc_phone, 'photo': Rescue.resc_photo,
+        'ong_id': Rescue.resc_ong_id, 'lat': Rescue.resc_lat, 'lon': Rescue.resc_lon,
+        'created_at': Rescue.resc_created_at,
+    }, status=Rescue.resc_status, since=Rescue.resc_created_at, ong=Rescue.resc_ong_id, photo='photo', private=True,
+       restricted=('author', 'phone', 'lat', 'lon')),
+    'ongs': Resource(Ong, {
+        'id': Ong.ong_id, 'name': Ong.ong_name, 'email': Ong.ong_email, 'phone': Ong.ong_phone,
+        'city': Ong.ong_city, 'city_id': Ong.ong_city_id, 'hood': Ong.ong_hood,
+        'address': Ong.ong_address, 'number': Ong.ong_num, 'cep': Ong.ong_cep,
+        'description': Ong.ong_desc, 'reports_resolved': Ong.ong_reportsResolved,
+        'rescues_resolved': Ong.ong_rescuesResolved, 'photo': Ong.ong_profile_photo,
+        'lat': Ong.ong_lat, 'lon': Ong.ong_lon, 'radius_km': Ong.ong_radius_km,
+    }, photo='photo'),
+    'events': Resource(Events, {
+        'id': Events.event_id, 'title': Events.event_title, 'description': Events.event_description,
+        'date': Events.event_date, 'location': Events.event_location, 'city': Events.event_city,
+        'city_id': Events.event_city_id, 'photo': Events.event_photo, 'ong_id': Events.event_ong_id,
+        'created_at': Events.event_created_at,
+    }, since=Events.event_created_at, ong=Events.event_ong_id, photo='photo'),
+}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+# Parâmetros da listagem repetidos no next_url
+LISTING_PARAMS = ('fields', 'city', 'status', 'since', 'ong', 'limit')
+
+
+def _encodeCursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+def _decodeCursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+def _plain(value):
+    if isinstance(value, (dt, date)):
+        return value.isoformat()
+    raise TypeError(type(value).__name__)
+
+
+def _bearer():
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None
+    return header.removeprefix('Bearer ').strip()
+
+def _knownToken(given, setting):
+    tokens = [t.strip() for t in current_app.config.get(setting, '').split(',') if t.strip()]
+    return any(hmac.compare_digest(given.encode(), t.encode()) for t in tokens)
+
+def authorized():
+    """
+    Parceiros mandam Authorization: Bearer <token>, com um dos tokens de
+    API_TOKENS ou API_CONTACT_TOKENS (separados por vírgula); painéis usam
+    a sessão da ONG. Outros esquemas de Authorization são ignorados.
+    """
+    given = _bearer()
+    if given:
+        return _knownToken(given, 'API_TOKENS') or _knownToken(given, 'API_CONTACT_TOKENS')
+    return bool(session.get('ong_logged'))
+
+def contactAuthorized():
+    given = _bearer()
+    return bool(given) and _knownToken(given, 'API_CONTACT_TOKENS')
+
+def _resource(name):
+    resource = RESOURCES.get(name)
+    if resource is None:
+        raise ApiError('Coleção inválida', 404)
+    if resource.private and not authorized():
+        raise ApiError('Não autorizado', 401)
+    return resource
+
+def _fields(resource):
+    """
+    Campos pedidos em ?fields=a,b (os públicos se ausente). O id vai sempre.
+    """
+    names = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    if not names:
+        return list(resource.defaults)
+    unknown = [f for f in names if f not in resource.fields]
+    if unknown:
+        raise ApiError(f"Campo inválido: {', '.join(unknown)}")
+    restricted = [f for f in names if f in resource.restricted]
+    if restricted and not contactAuthorized():
+        raise ApiError(f"Campo restrito: {', '.join(restricted)}", 403)
+    return ['id'] + [f for f in dict.fromkeys(names) if f != 'id']
+
+def _filters(resource, query):
+    args = request.args
+    if args.get('city', '').strip():
+        query = query.where(cityClause(resource.model, args['city'].strip()))
+    for name, column in (('status', resource.status), ('since', resource.since), ('ong', resource.ong)):
+        if name not in args:
+            continue
+        if column is None:
+            raise ApiError(f'Filtro indisponível: {name}')
+        if name == 'status':
+            query = query.where(column == args['status'])
+        elif name == 'since':
+            try:
+                query = query.where(column >= dt.fromisoformat(args['since']))
+            except ValueError:
+                raise ApiError('Data inválida em since')
+        else:
+            ong_id = args.get('ong', type=int)
+            if ong_id is None:
+                raise ApiError('ONG inválida')
+            query = query.where(column == ong_id)
+    return query
+
+def _serialize(resource, names, rows):
+    photo = names.index(resource.photo) if resource.photo in names else None
+    if photo is None:
+        return [dict(zip(names, row)) for row in rows]
+    from images import image_pipeline
+    items = []
+    for row in rows:
+        item = dict(zip(names, row))
+        item[resource.photo] = image_pipeline.url(row[photo]) or None
+        items.append(item)
+    return items
+
+def _json(payload, status=200):
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=_plain)
+    return Response(body, status=status, content_type='application/json')
+
+
+@api_v1.errorhandler(ApiError)
+def _apiError(error):
+    return _json({'success': False, 'message': error.message}, error.status)
+
+@api_v1.errorhandler(InvalidCursor)
+def _invalidCursor(error):
+    return _json({'success': False, 'message': 'Cursor inválido'}, 400)
+
+@api_v1.after_request
+def _compress(response):
+    """
+    gzip para respostas maiores que API_GZIP_MIN_BYTES, se o cliente aceitar.
+    """
+    response.vary.add('Accept-Encoding')
+    if (response.direct_passthrough or response.content_encoding
+            or request.accept_encodings['gzip'] <= 0
+            or (response.content_length or 0) < current_app.config.get('API_GZIP_MIN_BYTES', 1024)):
+        return response
+    response.set_data(gzip.compress(response.get_data(), current_app.config.get('API_GZIP_LEVEL', 5)))
+    response.content_encoding = 'gzip'
+    return response
+
+
+@api_v1.route('/<name>')
+def listing(name):
+    """
+    Uma página da coleção, mais recentes primeiro, com ?fields=, ?city=,
+    ?status=, ?since= (data ISO), ?ong=, ?limit= e ?cursor= (o next_cursor
+    da página anterior).
+    """
+    resource = _resource(name)
+    names = _fields(resource)
+    config = current_app.config
+    limit = max(1, min(request.args.get('limit', config.get('API_PAGE_SIZE', 50), type=int) or 1,
+                       config.get('API_MAX_PAGE_SIZE', 200)))
+
+    query = _filters(resource, select(*(resource.fields[n] for n in names)))
+    cursor = request.args.get('cursor')
+    if cursor:
+        query = query.where(resource.id_col < _decodeCursor(cursor))
+    query = query.order_by(resource.id_col.desc()).limit(limit + 1)
+
+    # Core direto no engine de leitura: tuplas, sem objetos do ORM
+    with readEngine().connect() as conn:
+        rows = conn.execute(query).all()
+
+    next_cursor = next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encodeCursor(rows[-1][0])
+        params = {key: request.args[key] for key in LISTING_PARAMS if key in request.args}
+        next_url = url_for('api_v1.listing', name=name, cursor=next_cursor, **params)
+    return _json({'success': True, 'data': _serialize(resource, names, rows),
+                  'next_cursor': next_cursor, 'next_url': next_url})
+
+@api_v1.route('/<name>/<int:item_id>')
+def item(name, item_id):
+    resource = _resource(name)
+    names = _fields(resource)
+    query = select(*(resource.fields[n] for n in names)).where(resource.id_col == item_id)
+    with readEngine().connect() as conn:
+        row = conn.execute(query).first()
+    if row is None:
+        raise ApiError('Não encontrado', 404)
+    return _json({'success': True, 'data': _serialize(resource, names, [row])[0]})
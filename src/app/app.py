@@ -1,38 +1,83 @@
 import os
-import uuid
+import hmac
 import logging
-import secrets
-import requests
 from datetime import timedelta
 from sqlalchemy import and_
 from flask import (
     Flask, request, render_template, session,
-    redirect, url_for, flash, jsonify
+    redirect, url_for, flash, jsonify, Response
 )
 from extensions import db
 from db import *
+from http_client import http_client
+from cities import city_registry
+from cep import cep_resolver
+from claims import *
+from geo import ong_index, parseCoords, pendingCasesNear, MAX_RADIUS_KM
+from migrations import upgradeSchema
+from pagination import keysetPage, InvalidCursor
+from session_store import ServerSideSessionInterface, loadSecretKey
+from images import image_pipeline
+from blobstore import blob_store
+from uploads_gc import upload_gc
+from live import case_broker
+from auth import auth_service, AuthBusy
+from search import searchCases
+from export import exporter, EXPORT_TABLES, EXPORT_FORMATS
+from importer import importer, IMPORT_KINDS
+from profiling import request_profiler
+from metrics import metrics_registry
+from storage import sqlite_storage
+from directory import ong_directory
+from fragments import fragment_cache
+from api import api_v1
+from validators import page_validators, areaCounters, ongCounters, userCounters, eventCounters
+from citycodes import city_backfill
 
 
 UPLOAD_FOLDER = 'src/static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
-random_key = secrets.token_hex(16)
 app = Flask(__name__, template_folder="../templates", static_folder="../static")
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///animal_aider.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///animal_aider.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = random_key
+app.config['SECRET_KEY'] = loadSecretKey(app)
+app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', 'sql')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')
+app.config['API_TOKENS'] = os.environ.get('API_TOKENS', '')
+app.config['API_CONTACT_TOKENS'] = os.environ.get('API_CONTACT_TOKENS', '')
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR')
+app.config['SQLITE_MODE'] = os.environ.get('SQLITE_MODE', 'wal')
 
+sqlite_storage.configure(app)
 db.init_app(app)
+sqlite_storage.init_app(app)
 
 with app.app_context():
     db.create_all()
-
-url_ibge = "https://servicodados.ibge.gov.br/api/v1/localidades/estados/SP/municipios"
-res = requests.get(url_ibge)
-data = res.json()
-cities = [cidade['nome'] for cidade in data]
+    upgradeSchema()
+
+http_client.init_app(app)
+city_registry.init_app(app)
+city_backfill.init_app(app)
+cep_resolver.init_app(app)
+ong_index.init_app(app)
+ong_directory.init_app(app)
+page_validators.init_app(app)
+blob_store.init_app(app)
+image_pipeline.init_app(app)
+fragment_cache.init_app(app)
+upload_gc.init_app(app)
+case_broker.init_app(app)
+auth_service.init_app(app)
+exporter.init_app(app)
+importer.init_app(app)
+request_profiler.init_app(app)
+metrics_registry.init_app(app)
+app.register_blueprint(api_v1)
+app.session_interface = ServerSideSessionInterface.from_app(app)
 
 def checkExtension(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -40,30 +85,228 @@ def checkExtension(filename):
 @app.route("/")
 def index():
     if session.get('ong_logged') and request.method == 'GET':
-        city = session.get('ong_city')
+        area = ong_index.area(session.get('ong_id'), session.get('ong_city'))
+        etag, not_modified = page_validators.conditional(
+            areaCounters(area), area.city_key, area.lat, area.lon, area.radius_km)
+        if not_modified:
+            return not_modified
+
+        reports, reports_cursor = pendingCasesNear(Report, area)
+        rescues, rescues_cursor = pendingCasesNear(Rescue, area)
+
+        return page_validators.tagged(render_template(
+            "ong_index.html", reports=reports, rescues=rescues,
+            reports_cursor=reports_cursor, rescues_cursor=rescues_cursor), etag)
+
+    city = session.get('user_city') if session.get('logged') and request.method == 'GET' else None
+    # O diretório já está em memória: a versão que ele serve é o validador
+    etag, not_modified = page_validators.conditional((), city, ong_directory.version())
+    if not_modified:
+        return not_modified
+
+    ongs = ong_directory.listing(city)
+    return page_validators.tagged(
+        render_template("index.html", ongs=ongs.cards, ongs_data=ongs.data, ongs_key=ongs.key), etag)
+
+CLAIM_ERRORS = {
+    CLAIM_NOT_FOUND: ('{} não encontrada', 404),
+    CLAIM_WRONG_CITY: ('{} não pertence à sua cidade', 403),
+    CLAIM_TAKEN: ('{} já foi assumida por outra ONG ou não está mais pendente', 409),
+}
+
+def claim_response(result, noun, success_message):
+    if result == CLAIM_OK:
+        return jsonify({'success': True, 'message': success_message})
+    message, status = CLAIM_ERRORS[result]
+    return jsonify({'success': False, 'message': message.format(noun)}), status
+
+def batch_claim_response(results):
+    accepted = [i for i, r in results.items() if r == CLAIM_OK]
+    failed = {i: r for i, r in results.items() if r != CLAIM_OK}
+    return jsonify({'success': bool(accepted), 'accepted': accepted, 'failed': failed})
+
+def ong_area():
+    return ong_index.area(session.get('ong_id'), session.get('ong_city'))
+
+def claim_ids():
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids or len(ids) > MAX_BATCH:
+        return None
+    try:
+        return [int(i) for i in ids]
+    except (ValueError, TypeError):
+        return None
 
-        reports = Report.query.filter(
-            and_(
-                Report.rep_city == city,
-                Report.rep_status == 'pendente')
-            ).all()
-        
-        rescues = Rescue.query.filter(
-            and_(
-                Rescue.resc_city == city,
-                Rescue.resc_status == 'pendente'
-            )
-        ).all()  
+CASE_KINDS = {'report': Report, 'rescue': Rescue}
 
-        return render_template("ong_index.html", reports=reports, rescues=rescues)
+@app.route("/ong_cases/<kind>")
+def ong_cases(kind):
+    if not session.get('ong_logged'):
+        return jsonify({'success': False, 'message': 'Não autorizado'}), 401
 
-    if session.get('logged') and request.method == 'GET':
-        city = session.get('user_city')
-        ongs = Ong.query.filter(Ong.ong_city.ilike(f'%{city}%')).all()
-    else:
-        ongs = Ong.query.all()
+    model = CASE_KINDS.get(kind)
+    if model is None:
+        return jsonify({'success': False, 'message': 'Tipo inválido'}), 404
+
+    try:
+        rows, next_cursor = pendingCasesNear(model, ong_area(), request.args.get('cursor'))
+    except InvalidCursor:
+        return jsonify({'success': False, 'message': 'Cursor inválido'}), 400
+
+    html = render_template(f'partials/ong_{kind}_cards.html', **{f'{kind}s': rows})
+    next_url = url_for('ong_cases', kind=kind, cursor=next_cursor) if next_cursor else None
+    return jsonify({'success': True, 'html': html, 'next_url': next_url})
+
+@app.route("/ong_stream")
+def ong_stream():
+    """
+    Eventos (SSE) de casos novos, aceitos e rejeitados na área da ONG.
+    """
+    if not session.get('ong_logged'):
+        return jsonify({'success': False, 'message': 'Não autorizado'}), 401
+
+    stream = case_broker.stream(ong_area(), request.headers.get('Last-Event-ID'))
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+SEARCH_STATUSES = ('pendente', 'andamento', 'finalizado', 'rejeitado')
+
+def date_range_args():
+    """
+    Lê date_from e date_to (AAAA-MM-DD) da query string. A data final entra
+    no intervalo, então o limite devolvido é o dia seguinte (exclusivo).
+    """
+    args = request.args
+    try:
+        date_from = datetime.strptime(args['date_from'], '%Y-%m-%d') if args.get('date_from') else None
+        date_to = datetime.strptime(args['date_to'], '%Y-%m-%d') + timedelta(days=1) if args.get('date_to') else None
+    except ValueError:
+        return None, None
+    return date_from, date_to
+
+def search_args():
+    """
+    Lê os filtros da busca da query string.
+    """
+    args = request.args
+    kind = args.get('kind') if args.get('kind') in CASE_KINDS else None
+    status = args.get('status') if args.get('status') in SEARCH_STATUSES else None
+    date_from, date_to = date_range_args()
+    return {
+        'terms': args.get('q', '').strip(),
+        'kind': kind,
+        'city': args.get('city', '').strip() or None,
+        'status': status,
+        'date_from': date_from,
+        'date_to': date_to,
+        'page': args.get('page', 1, type=int),
+    }
+
+@app.route("/search_cases")
+def search_cases():
+    """
+    Busca textual de denúncias e resgates (JSON), por relevância.
+    """
+    if not session.get('ong_logged'):
+        return jsonify({'success': False, 'message': 'Não autorizado'}), 401
+
+    filters = search_args()
+    cases, has_next = searchCases(**filters, area=ong_area())
+    results = []
+    for case in cases:
+        if isinstance(case, Report):
+            results.append({'kind': 'report', 'id': case.rep_id, 'title': case.rep_title,
+                            'description': case.rep_desc, 'address': case.rep_address,
+                            'city': case.rep_city, 'status': case.rep_status,
+                            'date': case.rep_date.isoformat()})
+        else:
+            results.append({'kind': 'rescue', 'id': case.resc_id, 'title': None,
+                            'description': case.resc_desc, 'address': case.resc_addr,
+                            'city': case.resc_city, 'status': case.resc_status,
+                            'date': case.resc_date.isoformat() if case.resc_date else None})
+    return jsonify({'success': True, 'results': results, 'page': max(1, filters['page']), 'has_next': has_next})
+
+@app.route("/ong_search")
+def ong_search():
+    if not session.get('ong_logged'):
+        return redirect(url_for('ong_login'))
 
-    return render_template("index.html", ongs=ongs)
+    filters = search_args()
+    cases, has_next = searchCases(**filters, area=ong_area())
+    return render_template('ong_search.html', cases=cases, has_next=has_next,
+                           page=max(1, filters['page']), statuses=SEARCH_STATUSES,
+                           cities=city_registry.cities)
+
+@app.route("/export/<table>")
+def export_table(table):
+    """
+    Exporta denúncias, resgates ou eventos da área da ONG em CSV ou NDJSON
+    (?format=), com filtros de cidade, status e datas. A resposta é enviada
+    em partes.
+    """
+    if not session.get('ong_logged'):
+        return jsonify({'success': False, 'message': 'Não autorizado'}), 401
+
+    fmt = request.args.get('format', 'csv')
+    if table not in EXPORT_TABLES or fmt not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'message': 'Tabela ou formato inválido'}), 404
+
+    date_from, date_to = date_range_args()
+    stream = exporter.stream(table, fmt, area=ong_area(),
+                             city=request.args.get('city', '').strip() or None,
+                             status=request.args.get('status') or None,
+                             date_from=date_from, date_to=date_to)
+    return Response(stream, content_type=EXPORT_FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename={table}.{fmt}',
+        'X-Accel-Buffering': 'no',
+    })
+
+def admin_authorized():
+    """
+    Rotas administrativas exigem o cabeçalho Authorization: Bearer <ADMIN_TOKEN>.
+    Sem ADMIN_TOKEN configurado, ficam desligadas.
+    """
+    token = app.config.get('ADMIN_TOKEN')
+    given = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    return bool(token) and hmac.compare_digest(given.encode(), token.encode())
+
+@app.route("/metrics")
+def metrics():
+    """
+    Métricas no formato texto do Prometheus (somando os workers se
+    METRICS_DIR estiver configurado). Com ?format=json, as medidas por
+    endpoint do profiler (SQL, templates, HTTP, bytes, N+1).
+    """
+    if not admin_authorized():
+        return jsonify({'success': False, 'message': 'Não autorizado'}), 401
+    if request.args.get('format') == 'json':
+        return jsonify(request_profiler.snapshot())
+    return Response(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route("/admin/import/<kind>", methods=['POST'])
+def admin_import(kind):
+    """
+    Importação em lote (ONGs, denúncias ou resgates) de um arquivo CSV ou
+    NDJSON enviado no campo 'file'. Com ?dry_run=1 só valida.
+    """
+    if not admin_authorized():
+        return jsonify({'success': False, 'message': 'Não autorizado'}), 401
+    if kind not in IMPORT_KINDS:
+        return jsonify({'success': False, 'message': 'Tipo inválido'}), 404
+
+    file = request.files.get('file')
+    if not file:
+        return jsonify({'success': False, 'message': 'Arquivo não enviado'}), 400
+
+    fmt = request.args.get('format') or ('ndjson' if file.filename.endswith(('.ndjson', '.jsonl')) else 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'message': 'Formato inválido'}), 400
+
+    stats = importer.run_upload(kind, file.stream, fmt, dry_run=request.args.get('dry_run') == '1')
+    return jsonify({'success': stats['complete'], **stats}), 200 if stats['complete'] else 500
 
 @app.route("/accept_report/<int:report_id>", methods=['POST'])
 def accept_report(report_id):
@@ -71,39 +314,37 @@ def accept_report(report_id):
         return jsonify({'success': False, 'message': 'Não autorizado'}), 401
     
     try:
-        report = Report.query.get_or_404(report_id)
-        
-        if report.rep_city != session.get('ong_city'):
-            return jsonify({'success': False, 'message': 'Denúncia não pertence à sua cidade'}), 403
-        
-        report.rep_status = 'andamento'
-        report.rep_ong_id = session.get('ong_id')
-        db.session.commit()
-        
-        return jsonify({'success': True, 'message': 'Denúncia aceita com sucesso!'})
+        result = claimReport(report_id, session.get('ong_id'), ong_area())
+        return claim_response(result, 'Denúncia', 'Denúncia aceita com sucesso!')
     
     except Exception as e:
-        db.session.rollback()
         return jsonify({'success': False, 'message': f'Erro ao aceitar denúncia: {str(e)}'}), 500
 
+@app.route("/accept_reports", methods=['POST'])
+def accept_reports():
+    if not session.get('ong_logged'):
+        return jsonify({'success': False, 'message': 'Não autorizado'}), 401
+
+    ids = claim_ids()
+    if ids is None:
+        return jsonify({'success': False, 'message': 'Lista de denúncias inválida'}), 400
+
+    try:
+        return batch_claim_response(claimReports(ids, session.get('ong_id'), ong_area()))
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Erro ao aceitar denúncias: {str(e)}'}), 500
+
 @app.route("/reject_report/<int:report_id>", methods=['POST'])
 def reject_report(report_id):
     if not session.get('ong_logged'):
         return jsonify({'success': False, 'message': 'Não autorizado'}), 401
     
     try:
-        report = Report.query.get_or_404(report_id)
-        
-        if report.rep_city != session.get('ong_city'):
-            return jsonify({'success': False, 'message': 'Denúncia não pertence à sua cidade'}), 403
-        
-        report.rep_status = 'rejeitado'
-        db.session.commit()
-        
-        return jsonify({'success': True, 'message': 'Denúncia rejeitada com sucesso!'})
+        result = rejectReport(report_id, ong_area())
+        return claim_response(result, 'Denúncia', 'Denúncia rejeitada com sucesso!')
     
     except Exception as e:
-        db.session.rollback()
         return jsonify({'success': False, 'message': f'Erro ao rejeitar denúncia: {str(e)}'}), 500
 
 @app.route("/accept_rescue/<int:rescue_id>", methods=['POST'])
@@ -112,39 +353,37 @@ def accept_rescue(rescue_id):
         return jsonify({'success': False, 'message': 'Não autorizado'}), 401
     
     try:
-        rescue = Rescue.query.get_or_404(rescue_id)
-        
-        if rescue.resc_city != session.get('ong_city'):
-            return jsonify({'success': False, 'message': 'Resgate não pertence à sua cidade'}), 403
-        
-        rescue.resc_status = 'andamento'
-        rescue.resc_ong_id = session.get('ong_id')
-        db.session.commit()
-        
-        return jsonify({'success': True, 'message': 'Resgate aceito com sucesso!'})
+        result = claimRescue(rescue_id, session.get('ong_id'), ong_area())
+        return claim_response(result, 'Solicitação de resgate', 'Resgate aceito com sucesso!')
     
     except Exception as e:
-        db.session.rollback()
         return jsonify({'success': False, 'message': f'Erro ao aceitar resgate: {str(e)}'}), 500
 
+@app.route("/accept_rescues", methods=['POST'])
+def accept_rescues():
+    if not session.get('ong_logged'):
+        return jsonify({'success': False, 'message': 'Não autorizado'}), 401
+
+    ids = claim_ids()
+    if ids is None:
+        return jsonify({'success': False, 'message': 'Lista de resgates inválida'}), 400
+
+    try:
+        return batch_claim_response(claimRescues(ids, session.get('ong_id'), ong_area()))
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Erro ao aceitar resgates: {str(e)}'}), 500
+
 @app.route("/reject_rescue/<int:rescue_id>", methods=['POST'])
 def reject_rescue(rescue_id):
     if not session.get('ong_logged'):
         return jsonify({'success': False, 'message': 'Não autorizado'}), 401
     
     try:
-        rescue = Rescue.query.get_or_404(rescue_id)
-        
-        if rescue.resc_city != session.get('ong_city'):
-            return jsonify({'success': False, 'message': 'Resgate não pertence à sua cidade'}), 403
-        
-        rescue.resc_status = 'rejeitado'
-        db.session.commit()
-        
-        return jsonify({'success': True, 'message': 'Resgate rejeitado com sucesso!'})
+        result = rejectRescue(rescue_id, ong_area())
+        return claim_response(result, 'Solicitação de resgate', 'Resgate rejeitado com sucesso!')
     
     except Exception as e:
-        db.session.rollback()
         return jsonify({'success': False, 'message': f'Erro ao rejeitar resgate: {str(e)}'}), 500
     
 @app.route('/delReport/<int:id>', methods=['POST'])
@@ -165,8 +404,11 @@ def delReport(id):
     ).first()
 
     if report:
+        photo = report.rep_photo
         db.session.delete(report)
         db.session.commit()
+        if photo:
+            image_pipeline.remove(photo)
         message = 'Denúncia deletada com sucesso!'
         
         if request.is_json or request.headers.get('Content-Type') == 'application/json':
@@ -201,8 +443,11 @@ def delRescue(id):
     ).first()
 
     if rescue:
+        photo = rescue.resc_photo
         db.session.delete(rescue)
         db.session.commit()
+        if photo:
+            image_pipeline.remove(photo)
         message = 'Resgate deletado com sucesso!'
         
         if request.is_json or request.headers.get('Content-Type') == 'application/json':
@@ -231,9 +476,14 @@ def login():
             email = request.form.get('email')
             password = request.form.get('password')
 
-            if checkUser(email, password):
-                user = getUser(email)
+            try:
+                user = auth_service.authenticate(User, email, password)
+            except AuthBusy:
+                flash('Muitas tentativas de login no momento. Tente novamente em instantes.', 'error')
+                return render_template('login.html'), 503
 
+            if user:
+                session.regenerate()
                 session['logged'] = 1
                 session['user_id'] = user.user_id
                 session['user_name'] = user.user_name
@@ -266,7 +516,7 @@ def register():
         if request.form.get('email') and request.form.get('password') and request.form.get('city') and request.form.get('name') and request.form.get('phone'):
             email = request.form.get('email')
             password = request.form.get('password')
-            city = request.form.get('city')
+            city = request.form.get('city').strip()
             name = request.form.get('name')
             phone = request.form.get('phone')
             cep = request.form.get('cep')
@@ -278,26 +528,41 @@ def register():
                 flash('Usuário já existe!', 'error')
                 return redirect(url_for('register'))
 
+            if not city_registry.is_valid(city):
+                flash('Cidade inválida.', 'error')
+                return render_template('register.html', cities=city_registry.cities)
+
             if not photo:
                 new_filename = 'default_profile.jpg'
             elif photo and checkExtension(photo.filename):
 
                 extension = photo.filename.rsplit('.', 1)[1].lower()  
-                new_filename = str(uuid.uuid4()) + '.' + extension  
                 try:
-                    photo.save(os.path.join(app.config['UPLOAD_FOLDER'], new_filename))
+                    new_filename = image_pipeline.save(photo, extension)
                 except Exception as e:
                     flash('Houve um erro. Tente Novamente', 'error')
                     print(e)
                     return redirect(url_for('register'))
                     
-            if saveUser(name, email, password, phone, cep, city, addr, num, new_filename):
+            try:
+                saved = saveUser(name, email, password, phone, cep, city, addr, num, new_filename)
+            except AuthBusy:
+                saved = None
+
+            if not saved and new_filename != 'default_profile.jpg':
+                image_pipeline.remove(new_filename)
+
+            if saved is None:
+                flash('Muitos acessos no momento. Tente novamente em instantes.', 'error')
+                return render_template('register.html', cities=city_registry.cities), 503
+
+            if saved:
                 flash('Usuário registrado com sucesso!', 'success')
                 return redirect(url_for('login'))
 
         else:
             flash('Erro ao registrar usuário. Verifique os dados.', 'error')
-    return render_template('register.html', cities=cities)
+    return render_template('register.html', cities=city_registry.cities)
 
 @app.route("/report", methods=['POST', 'GET'])
 def report():
@@ -315,7 +580,7 @@ def report():
         return render_template('report.html', 
                              min_data=min_data_str, 
                              max_data=max_data_str, 
-                             cities=cities)
+                             cities=city_registry.cities)
     
     try:
         required_fields = ['title', 'desc', 'date', 'city']
@@ -333,14 +598,28 @@ def report():
             return render_template('report.html', 
                                  min_data=min_data_str, 
                                  max_data=max_data_str, 
-                                 cities=cities)
+                                 cities=city_registry.cities)
         
         if missing_fields:
             flash('Preencha todos os campos obrigatórios.', 'error')
             return render_template('report.html', 
                                  min_data=min_data_str, 
                                  max_data=max_data_str, 
-                                 cities=cities)
+                                 cities=city_registry.cities)
+
+        if not city_registry.loaded:
+            flash('A lista de cidades ainda não foi carregada. Tente novamente em instantes.', 'error')
+            return render_template('report.html', 
+                                 min_data=min_data_str, 
+                                 max_data=max_data_str, 
+                                 cities=city_registry.cities), 503
+
+        if not city_registry.is_valid(request.form.get('city').strip()):
+            flash('Cidade inválida.', 'error')
+            return render_template('report.html', 
+                                 min_data=min_data_str, 
+                                 max_data=max_data_str, 
+                                 cities=city_registry.cities)
         
         data = {
             'title': request.form.get('title').strip(),
@@ -349,6 +628,7 @@ def report():
             'city': request.form.get('city').strip(),
             'addr': request.form.get('addr', '').strip() or None,
         }
+        data['lat'], data['lon'] = parseCoords(request.form.get('lat'), request.form.get('lon'))
         
         if user_logged:
             data['email'] = session.get('user_email')
@@ -363,24 +643,21 @@ def report():
         if photo and checkExtension(photo.filename):
             try:
                 extension = photo.filename.rsplit('.', 1)[1].lower()
-                photo_filename = str(uuid.uuid4()) + '.' + extension
-                
-                os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-                
-                photo.save(os.path.join(app.config['UPLOAD_FOLDER'], photo_filename))
+
+                photo_filename = image_pipeline.save(photo, extension)
             except Exception as e:
                 logging.error(f"Erro no upload: {e}")
                 flash('Erro ao fazer upload da imagem.', 'error')
                 return render_template('report.html', 
                                      min_data=min_data_str, 
                                      max_data=max_data_str, 
-                                     cities=cities)
+                                     cities=city_registry.cities)
         else:
             flash('Formato de imagem inválido. Use apenas PNG, JPG, JPEG ou GIF.', 'error')
             return render_template('report.html', 
                                  min_data=min_data_str, 
                                  max_data=max_data_str, 
-                                 cities=cities)
+                                 cities=city_registry.cities)
         
         if saveReport(
             title=data['title'],
@@ -391,7 +668,9 @@ def report():
             photo=photo_filename,
             email=data['email'],
             addr=data['addr'],
-            userId=data['userId']
+            userId=data['userId'],
+            lat=data['lat'],
+            lon=data['lon']
         ):
             if user_logged:
                 flash('Relatório enviado com sucesso!', 'success')
@@ -400,10 +679,7 @@ def report():
             return redirect(url_for('index'))
         else:
             if photo_filename:
-                try:
-                    os.remove(os.path.join(app.config['UPLOAD_FOLDER'], photo_filename))
-                except:
-                    pass
+                image_pipeline.remove(photo_filename)
             flash('Erro ao salvar relatório. Tente novamente.', 'error')
     
     except Exception as e:
@@ -413,7 +689,7 @@ def report():
     return render_template('report.html', 
                          min_data=min_data_str, 
                          max_data=max_data_str, 
-                         cities=cities)
+                         cities=city_registry.cities)
 
 @app.route('/ver_dados')
 def ver_dados():
@@ -455,6 +731,12 @@ def user():
                 flash('Nenhum dado foi fornecido para atualização.', 'warning')
                 return redirect(url_for('user'))
             
+            if 'user_city' in form_data:
+                form_data['user_city'] = form_data['user_city'].strip()
+                if not city_registry.is_valid(form_data['user_city']):
+                    flash('Cidade inválida.', 'error')
+                    return redirect(url_for('user'))
+
             if 'user_email' in form_data and form_data['user_email'] != user.user_email:
                 existing_user = User.query.filter_by(user_email=form_data['user_email']).first()
                 if existing_user:
@@ -466,26 +748,20 @@ def user():
                 photo = request.files['photo']
                 if photo and photo.filename and checkExtension(photo.filename):
                     extension = photo.filename.rsplit('.', 1)[1].lower()
-                    new_filename = str(uuid.uuid4()) + '.' + extension
                     
-                    photo.save(os.path.join(app.config['UPLOAD_FOLDER'], new_filename))
+                    new_filename = image_pipeline.save(photo, extension)
                     form_data['user_profile_photo'] = new_filename
                     
-                    if user.user_profile_photo:
-                        old_photo_path = os.path.join(app.config['UPLOAD_FOLDER'], user.user_profile_photo)
-                        if os.path.exists(old_photo_path):
-                            try:
-                                os.remove(old_photo_path)
-                            except:
-                                pass  
-                    
                 elif photo and photo.filename: 
                     flash('Extensão de arquivo não suportada.', 'error')
                     return redirect(url_for('user'))
             
+            old_photo = user.user_profile_photo
             result = updateUser(user_id, **form_data)
             
             if result['success']:
+                if new_filename and old_photo:
+                    image_pipeline.remove(old_photo)
                 if result.get('updated_fields'):
                     flash(f'Dados atualizados com sucesso! {result["message"]}', 'success')
                     
@@ -499,6 +775,8 @@ def user():
                 else:
                     flash('Nenhuma alteração foi necessária.', 'info')
             else:
+                if new_filename:
+                    image_pipeline.remove(new_filename)
                 flash(f'Erro ao atualizar dados: {result.get("error", "Erro desconhecido")}', 'error')
                 
         except Exception as e:
@@ -506,7 +784,7 @@ def user():
             
         return redirect(url_for('user'))
 
-    return render_template('user.html', user=user, cidades=cities)
+    return render_template('user.html', user=user, cidades=city_registry.cities)
 
 @app.route('/ong_register', methods=['GET', 'POST'])
 def ong_register():
@@ -521,10 +799,11 @@ def ong_register():
         addr = request.form.get('addr')
         cep = request.form.get('cep')
         desc = request.form.get('desc')
-        city = request.form.get('city')
+        city = (request.form.get('city') or '').strip()
         hood = request.form.get('hood')
         num = request.form.get('num')
         cpf = request.form.get('cpf')
+        lat, lon = parseCoords(request.form.get('lat'), request.form.get('lon'))
         photo = request.files['photo']
 
         if not photo:
@@ -533,16 +812,35 @@ def ong_register():
         if getOng(email):
             flash('Ong já existente', 'info')
             return redirect(url_for('index'))
+
+        if not city_registry.is_valid(city):
+            flash('Cidade inválida.', 'error')
+            return render_template('ong_register.html', cities=city_registry.cities)
         
         if not photo:
             new_filename = 'default_profile.jpg'
         elif photo and checkExtension(photo.filename):
-            extension = photo.filename.rsplit('.', 1)[1].lower()  
-            new_filename = str(uuid.uuid4()) + '.' + extension  
+            extension = photo.filename.rsplit('.', 1)[1].lower()
+            try:
+                new_filename = image_pipeline.save(photo, extension)
+            except Exception as e:
+                logging.error(f"Erro no upload da foto da ONG: {e}")
+                flash('Erro ao fazer upload da imagem.', 'error')
+                return redirect(url_for('ong_register'))
+
+        try:
+            saved = saveOng(name, phone, email, password, cpf, cep, city, hood, addr, num, new_filename, desc, lat, lon)
+        except AuthBusy:
+            saved = None
+
+        if not saved and new_filename != 'default_profile.jpg':
+            image_pipeline.remove(new_filename)
 
-            photo.save(os.path.join(app.config['UPLOAD_FOLDER'], new_filename))
+        if saved is None:
+            flash('Muitos acessos no momento. Tente novamente em instantes.', 'error')
+            return render_template('ong_register.html', cities=city_registry.cities), 503
 
-        if saveOng(name, phone, email, password, cpf, cep, city, hood, addr, num, new_filename, desc):
+        if saved:
             flash('Sucesso no cadastro.', 'info')
             return redirect(url_for('ong_login'))
         
@@ -550,17 +848,34 @@ def ong_register():
             flash('Erro no cadastro.', 'info')
             return redirect(url_for('ong_register'))    
         
-    return render_template('ong_register.html', cities=cities)
+    return render_template('ong_register.html', cities=city_registry.cities)
 
 @app.route('/get_address/<cep>')
 def get_address(cep):
-    res = requests.get(f'https://viacep.com.br/ws/{cep}/json/')
-    if res.status_code == 200:
-        data = res.json()
-        if 'erro' in data:
-            return jsonify({'erro': True})
-        return jsonify(data)
-    return jsonify({'erro': True})
+    data = cep_resolver.lookup(cep)
+    if data is None:
+        return jsonify({'erro': True})
+    return jsonify(data)
+
+@app.route('/nearby_ongs')
+def nearby_ongs():
+    lat, lon = parseCoords(request.args.get('lat'), request.args.get('lon'))
+    if lat is None:
+        return jsonify({'success': False, 'message': 'Coordenadas inválidas'}), 400
+
+    km = min(request.args.get('km', 10, type=float) or 10, MAX_RADIUS_KM)
+    found = ong_index.nearby(lat, lon, km)[:50]
+    ongs = {o.ong_id: o for o in Ong.query.filter(Ong.ong_id.in_([i for _, i in found]))}
+
+    return jsonify({'success': True, 'ongs': [
+        {
+            'ong_id': ong_id,
+            'ong_name': ongs[ong_id].ong_name,
+            'ong_city': ongs[ong_id].ong_city,
+            'distance_km': round(dist, 2),
+        }
+        for dist, ong_id in found if ong_id in ongs
+    ]})
 
 @app.route('/ong_login', methods=['GET', 'POST'])
 def ong_login():
@@ -573,16 +888,20 @@ def ong_login():
             email = request.form.get('email')
             password = request.form.get('password')
 
-            if checkOng(email, password):
-                ong = getOng(email)
-                
-                if ong: 
-                    session['ong_logged'] = 1
-                    session['ong_id'] = ong.ong_id
-                    session['ong_email'] = ong.ong_email
-                    session['ong_city'] = ong.ong_city
+            try:
+                ong = auth_service.authenticate(Ong, email, password)
+            except AuthBusy:
+                flash('Muitas tentativas de login no momento. Tente novamente em instantes.', 'error')
+                return render_template('ong_login.html'), 503
+
+            if ong:
+                session.regenerate()
+                session['ong_logged'] = 1
+                session['ong_id'] = ong.ong_id
+                session['ong_email'] = ong.ong_email
+                session['ong_city'] = ong.ong_city
 
-                    flash('Login bem-sucedido!', 'success')
+                flash('Login bem-sucedido!', 'success')
                 return redirect(url_for('index'))
             else:
                 flash('email e/ou senha inválidos', 'error')
@@ -620,11 +939,26 @@ def ong_profile():
             }
             
             form_data = {k: v for k, v in form_data.items() if v and v.strip()}
+
+            lat, lon = parseCoords(request.form.get('lat'), request.form.get('lon'))
+            if lat is not None:
+                form_data['ong_lat'] = lat
+                form_data['ong_lon'] = lon
+
+            radius = request.form.get('radius', '').strip()
+            if radius.isdigit() and 1 <= int(radius) <= MAX_RADIUS_KM:
+                form_data['ong_radius_km'] = int(radius)
             
             if not form_data and 'photo' not in request.files:
                 flash('Nenhum dado foi fornecido para atualização.', 'warning')
                 return redirect(url_for('ong_profile'))
             
+            if 'ong_city' in form_data:
+                form_data['ong_city'] = form_data['ong_city'].strip()
+                if not city_registry.is_valid(form_data['ong_city']):
+                    flash('Cidade inválida.', 'error')
+                    return redirect(url_for('ong_profile'))
+
             if 'ong_email' in form_data and form_data['ong_email'] != ong.ong_email:
                 existing_ong = Ong.query.filter_by(ong_email=form_data['ong_email']).first()
                 if existing_ong:
@@ -636,28 +970,22 @@ def ong_profile():
                 photo = request.files['photo']
                 if photo and photo.filename and checkExtension(photo.filename):
                     extension = photo.filename.rsplit('.', 1)[1].lower()
-                    new_filename = str(uuid.uuid4()) + '.' + extension
                     
-                    photo.save(os.path.join(app.config['UPLOAD_FOLDER'], new_filename))
+                    new_filename = image_pipeline.save(photo, extension)
                     form_data['ong_profile_photo'] = new_filename
                     
-                    if ong.ong_profile_photo:
-                        old_photo_path = os.path.join(app.config['UPLOAD_FOLDER'], ong.ong_profile_photo)
-                        if os.path.exists(old_photo_path):
-                            try:
-                                os.remove(old_photo_path)
-                            except:
-                                pass  
-                    
                 elif photo and photo.filename:  
                     flash('Extensão de arquivo não suportada.', 'error')
                     return redirect(url_for('ong_profile'))
             
            
+            old_photo = ong.ong_profile_photo
             result = ong.safe_update(form_data)
             
             if result['success']:
                 db.session.commit()
+                if new_filename and old_photo:
+                    image_pipeline.remove(old_photo)
                 
                 if result.get('updated_fields'):
                     flash(f'Dados atualizados com sucesso! {result["total_changes"]} campo(s) alterado(s).', 'success')
@@ -680,7 +1008,7 @@ def ong_profile():
             
         return redirect(url_for('ong_profile'))
 
-    return render_template('ong_profile.html', cities=cities, ong=ong)
+    return render_template('ong_profile.html', cities=city_registry.cities, ong=ong)
 
 @app.route('/rescue', methods=['GET', 'POST'])
 def rescue():
@@ -688,7 +1016,7 @@ def rescue():
         return redirect(url_for('index'))
     
     if request.method == 'GET':
-        return render_template('rescue.html', cities=cities)
+        return render_template('rescue.html', cities=city_registry.cities)
     
     try:
         required_fields = ['desc', 'city', 'author']
@@ -704,7 +1032,15 @@ def rescue():
         
         if missing_fields:
             flash('Preencha todos os campos obrigatórios.', 'error')
-            return render_template('rescue.html', cities=cities)
+            return render_template('rescue.html', cities=city_registry.cities)
+
+        if not city_registry.loaded:
+            flash('A lista de cidades ainda não foi carregada. Tente novamente em instantes.', 'error')
+            return render_template('rescue.html', cities=city_registry.cities), 503
+
+        if not city_registry.is_valid(request.form.get('city').strip()):
+            flash('Cidade inválida.', 'error')
+            return render_template('rescue.html', cities=city_registry.cities)
         
         data = {
             'desc': request.form.get('desc').strip(),
@@ -713,6 +1049,7 @@ def rescue():
             'num': request.form.get('num', '').strip() or None,
             'cep': request.form.get('cep', '').strip() or None,
         }
+        data['lat'], data['lon'] = parseCoords(request.form.get('lat'), request.form.get('lon'))
         
         if user_logged:
             data['author'] = session.get('user_name') or session.get('user_email', 'Usuário Logado')
@@ -729,15 +1066,12 @@ def rescue():
         if photo and photo.filename and checkExtension(photo.filename):
             try:
                 extension = photo.filename.rsplit('.', 1)[1].lower()
-                photo_filename = str(uuid.uuid4()) + '.' + extension
-                
-                os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-                
-                photo.save(os.path.join(app.config['UPLOAD_FOLDER'], photo_filename))
+
+                photo_filename = image_pipeline.save(photo, extension)
             except Exception as e:
                 logging.error(f"Erro no upload de foto do resgate: {e}")
                 flash('Erro ao fazer upload da imagem.', 'error')
-                return render_template('rescue.html', cities=cities)
+                return render_template('rescue.html', cities=city_registry.cities)
         
         if saveRescue(
             desc=data['desc'],
@@ -748,7 +1082,9 @@ def rescue():
             addr=data['addr'],
             num=data['num'],
             photo=photo_filename,
-            userId=data['userId']
+            userId=data['userId'],
+            lat=data['lat'],
+            lon=data['lon']
         ):
             if user_logged:
                 flash('Resgate registrado com sucesso!', 'success')
@@ -757,17 +1093,14 @@ def rescue():
             return redirect(url_for('index'))
         else:
             if photo_filename:
-                try:
-                    os.remove(os.path.join(app.config['UPLOAD_FOLDER'], photo_filename))
-                except:
-                    pass
+                image_pipeline.remove(photo_filename)
             flash('Erro ao registrar resgate. Tente novamente.', 'error')
     
     except Exception as e:
         logging.error(f"Erro na rota rescue: {e}")
         flash('Erro interno. Tente novamente.', 'error')
     
-    return render_template('rescue.html', cities=cities)
+    return render_template('rescue.html', cities=city_registry.cities)
 
 @app.route('/user_reports')
 def user_reports():
@@ -780,12 +1113,15 @@ def user_reports():
     
     try:
         user_id = session.get('user_id')
+        etag, not_modified = page_validators.conditional(userCounters(user_id))
+        if not_modified:
+            return not_modified
         
-        reports = Report.query.filter_by(rep_user_id=user_id)\
-                             .order_by(Report.rep_created_at.desc())\
-                             .all()
+        reports, next_cursor = keysetPage(Report.query.filter_by(rep_user_id=user_id), Report)
         
-        return render_template('user_reports.html', reports=reports)
+        return page_validators.tagged(render_template(
+            'user_reports.html', reports=reports, next_cursor=next_cursor,
+            stats=caseStats(Report, user_id)), etag)
     
     except Exception as e:
         logging.error(f"Erro ao carregar denúncias do usuário: {e}")
@@ -803,18 +1139,41 @@ def user_rescues():
     
     try:
         user_id = session.get('user_id')
+        etag, not_modified = page_validators.conditional(userCounters(user_id))
+        if not_modified:
+            return not_modified
         
-        rescues = Rescue.query.filter_by(resc_user_id=user_id)\
-                             .order_by(Rescue.resc_created_at.desc())\
-                             .all()
+        rescues, next_cursor = keysetPage(Rescue.query.filter_by(resc_user_id=user_id), Rescue)
         
-        return render_template('user_rescues.html', rescues=rescues)
+        return page_validators.tagged(render_template(
+            'user_rescues.html', rescues=rescues, next_cursor=next_cursor,
+            stats=caseStats(Rescue, user_id)), etag)
     
     except Exception as e:
         logging.error(f"Erro ao carregar resgates do usuário: {e}")
         flash('Erro ao carregar seus resgates.', 'error')
         return redirect(url_for('index'))
 
+@app.route('/user_cases/<kind>')
+def user_cases(kind):
+    if not session.get('logged'):
+        return jsonify({'success': False, 'message': 'Usuário não autenticado.'}), 401
+
+    model = CASE_KINDS.get(kind)
+    if model is None:
+        return jsonify({'success': False, 'message': 'Tipo inválido'}), 404
+
+    user_col = Report.rep_user_id if model is Report else Rescue.resc_user_id
+    try:
+        rows, next_cursor = keysetPage(model.query.filter(user_col == session.get('user_id')),
+                                       model, request.args.get('cursor'))
+    except InvalidCursor:
+        return jsonify({'success': False, 'message': 'Cursor inválido'}), 400
+
+    html = render_template(f'partials/user_{kind}_cards.html', **{f'{kind}s': rows})
+    next_url = url_for('user_cases', kind=kind, cursor=next_cursor) if next_cursor else None
+    return jsonify({'success': True, 'html': html, 'next_url': next_url})
+
 @app.route('/ong_ongoing/<int:id>', methods=['GET', 'POST'])
 def ong_ongoing(id):
     if session.get('logged'):
@@ -823,23 +1182,27 @@ def ong_ongoing(id):
     
     if not session.get('ong_logged'):
         return redirect(url_for('ong_login'))
+
+    etag, not_modified = page_validators.conditional(ongCounters(id))
+    if not_modified:
+        return not_modified
     
     rescues = Rescue.query.filter(
         and_(
             Rescue.resc_ong_id == id,
             Rescue.resc_status == 'andamento'
         )
-    )
+    ).all()
     
     reports = Report.query.filter(
         and_(
             Report.rep_ong_id == id,
             Report.rep_status == 'andamento'
         )
-    )
+    ).all()
 
     if request.method == 'GET':
-        return render_template('ong_ongoing.html', rescues=rescues, reports=reports)
+        return page_validators.tagged(render_template('ong_ongoing.html', rescues=rescues, reports=reports), etag)
     
 @app.route('/finish_report/<int:id>', methods=['POST'])
 def finish_report(id):
@@ -861,9 +1224,9 @@ def finish_report(id):
     ).first()
 
     if report:
-        ong = Ong.query.get(ong_id)
-        if ong:
-            ong.ong_reportsResolved += 1
+        Ong.query.filter_by(ong_id=ong_id).update(
+            {Ong.ong_reportsResolved: Ong.ong_reportsResolved + 1}, synchronize_session=False
+        )
 
         report.rep_status = 'finalizado'
         db.session.commit()
@@ -902,8 +1265,11 @@ def finish_rescue(id):
     ).first()
 
     if rescue:
+        Ong.query.filter_by(ong_id=ong_id).update(
+            {Ong.ong_rescuesResolved: Ong.ong_rescuesResolved + 1}, synchronize_session=False
+        )
+
         rescue.resc_status = 'finalizado'
-        Ong.ong_rescuesResolved += 1
         db.session.commit()
         message = 'Resgate finalizado com sucesso!'
         if request.is_json or request.headers.get('Content-Type') == 'application/json':
@@ -924,13 +1290,16 @@ def ong_events(id):
         return redirect(url_for('index')) 
     if not session.get('ong_logged'): 
         return redirect(url_for('ong_login')) 
+    etag, not_modified = page_validators.conditional(eventCounters(id))
+    if not_modified:
+        return not_modified
     events = Events.query.filter(
         and_(
             Events.event_ong_id == id 
         )).all()
         
     if request.method == 'GET': 
-        return render_template('ong_events.html', events=events) 
+        return page_validators.tagged(render_template('ong_events.html', events=events), etag)
     
     if request.method == 'POST': 
         return render_template('ong_events.html', events=events)
@@ -946,32 +1315,34 @@ def create_event(id):
         description = request.form.get('event_description')
         date_str = request.form.get('event_date')
         location = request.form.get('event_location')
-        city = request.form.get('event_city')
+        city = (request.form.get('event_city') or '').strip() or None
         photo = request.files.get('event_photo')
 
         if not title or not date_str or not location:
             flash('Título, data e localização são obrigatórios.', 'error')
-            return render_template('create_event.html', cities=cities)
+            return render_template('create_event.html', cities=city_registry.cities)
 
         try:
             event_date = datetime.strptime(date_str, '%Y-%m-%d')
         except ValueError:
             flash('Data inválida. Use o formato YYYY-MM-DD.', 'error')
-            return render_template('create_event.html', cities=cities)
+            return render_template('create_event.html', cities=city_registry.cities)
+
+        if city is not None and not city_registry.is_valid(city):
+            flash('Cidade inválida.', 'error')
+            return render_template('create_event.html', cities=city_registry.cities)
 
         photo_filename = None
 
         if photo and photo.filename and checkExtension(photo.filename):
             try:
                 extension = photo.filename.rsplit('.', 1)[1].lower()
-                photo_filename = f"{uuid.uuid4()}.{extension}"
 
-                os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-                photo.save(os.path.join(app.config['UPLOAD_FOLDER'], photo_filename))
+                photo_filename = image_pipeline.save(photo, extension)
             except Exception as e:
                 logging.error(f"Erro no upload da foto do evento: {e}")
                 flash('Erro ao fazer upload da imagem.', 'error')
-                return render_template('create_event.html', cities=cities)
+                return render_template('create_event.html', cities=city_registry.cities)
 
         try:
             new_event = Events(
@@ -989,17 +1360,14 @@ def create_event(id):
         except Exception as e:
             logging.error(f"Erro ao salvar evento no banco: {e}")
             if photo_filename:
-                try:
-                    os.remove(os.path.join(app.config['UPLOAD_FOLDER'], photo_filename))
-                except Exception as ex:
-                    logging.error(f"Erro ao remover arquivo após falha no DB: {ex}")
+                image_pipeline.remove(photo_filename)
             flash('Erro ao registrar evento. Tente novamente.', 'error')
-            return render_template('create_event.html', cities=cities)
+            return render_template('create_event.html', cities=city_registry.cities)
 
         flash('Evento criado com sucesso!', 'success')
-        return redirect(url_for('ong_events', id=id, cities=cities))
+        return redirect(url_for('ong_events', id=id, cities=city_registry.cities))
 
-    return render_template('create_event.html', cities=cities)
+    return render_template('create_event.html', cities=city_registry.cities)
 
 @app.route('/delete_event/<int:event_id>', methods=['POST'])
 def delete_event(event_id):
@@ -1014,12 +1382,7 @@ def delete_event(event_id):
         return redirect(url_for('ong_events', id=session.get('ong_id')))
 
     if event.event_photo:
-        try:
-            photo_path = os.path.join(app.config['UPLOAD_FOLDER'], event.event_photo)
-            if os.path.exists(photo_path):
-                os.remove(photo_path)
-        except Exception as e:
-            logging.error(f'Erro ao remover imagem do evento: {e}')
+        image_pipeline.remove(event.event_photo)
 
     try:
         db.session.delete(event)
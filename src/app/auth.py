@@ -0,0 +1,154 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from db import db, User, Ong
+from metrics import LOGINS
+
+
+# Coluna de email e de senha de cada tipo de conta
+_ACCOUNT_COLUMNS = {
+    User: (User.user_email, User.user_pass),
+    Ong: (Ong.ong_email, Ong.ong_pass),
+}
+
+
+def _nativeExecutor():
+    """
+    Pool de threads de verdade. Nos workers gevent (gunicorn.conf.py) o
+    threading vira greenlets e o Argon2 travaria o loop de todas as conexões;
+    aí usa o pool de threads nativas do próprio gevent.
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return ThreadPoolExecutor
+    if not monkey.is_module_patched('threading'):
+        return ThreadPoolExecutor
+    from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+    return NativeThreadPoolExecutor
+
+
+class AuthBusy(Exception):
+    """
+    Fila de verificação cheia ou espera longa demais.
+    """
+
+
+class AuthService:
+    """
+    Verificação de senhas com um único PasswordHasher de custo configurável.
+    O Argon2 roda em um pool de threads limitado (a biblioteca libera o GIL),
+    com uma fila de tamanho máximo; acima disso as tentativas são recusadas
+    em vez de acumular requisições presas. Hashes com parâmetros antigos são
+    refeitos no login.
+    """
+
+    def __init__(self, time_cost=3, memory_cost=65536, parallelism=4,
+                 workers=None, queue_size=64, timeout=10):
+        self.timeout = timeout
+        self._pool = None
+        self.resize(workers or os.cpu_count() or 1, queue_size)
+        self.configure(time_cost, memory_cost, parallelism)
+
+    def resize(self, workers, queue_size):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def configure(self, time_cost, memory_cost, parallelism):
+        self.hasher = PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+        # Usado quando o email não existe, para a resposta levar o mesmo tempo
+        self._dummy_hash = self.hasher.hash('animal-aider')
+
+    def init_app(self, app):
+        self.timeout = app.config.get('AUTH_TIMEOUT', self.timeout)
+        self.resize(app.config.get('AUTH_WORKERS', self.workers),
+                    app.config.get('AUTH_QUEUE_SIZE', self.queue_size))
+        self.configure(
+            app.config.get('AUTH_TIME_COST', self.hasher.time_cost),
+            app.config.get('AUTH_MEMORY_COST', self.hasher.memory_cost),
+            app.config.get('AUTH_PARALLELISM', self.hasher.parallelism),
+        )
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = _nativeExecutor()(max_workers=self.workers, thread_name_prefix='argon2')
+        return self._pool
+
+    def _run(self, fn, *args):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise AuthBusy()
+        try:
+            future = self.pool.submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # O slot só volta quando o Argon2 termina (ou é cancelado antes de
+        # começar), não quando quem esperava desiste
+        future.add_done_callback(lambda f: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise AuthBusy()
+
+    def hash(self, password):
+        return self._run(self.hasher.hash, password)
+
+    def hash_many(self, passwords):
+        """
+        Vários hashes de uma vez, espalhados pelo pool (importação em lote).
+        Não passa pela fila dos logins: quem chama espera todos terminarem.
+        """
+        return list(self.pool.map(self.hasher.hash, passwords))
+
+    def _verify(self, stored, password):
+        try:
+            return self.hasher.verify(stored, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    def authenticate(self, model, email, password):
+        """
+        Busca a conta uma única vez e confere a senha. Retorna a conta ou None.
+        Pode levantar AuthBusy.
+        """
+        account_type = 'user' if model is User else 'ong'
+        try:
+            account = self._authenticate(model, email, password)
+        except AuthBusy:
+            LOGINS.inc(account=account_type, result='busy')
+            raise
+        LOGINS.inc(account=account_type, result='ok' if account is not None else 'fail')
+        return account
+
+    def _authenticate(self, model, email, password):
+        email_col, pass_col = _ACCOUNT_COLUMNS[model]
+        account = model.query.filter(email_col == email).first()
+        if account is None:
+            self._run(self._verify, self._dummy_hash, password)
+            return None
+
+        stored = getattr(account, pass_col.key)
+        if not self._run(self._verify, stored, password):
+            return None
+
+        if self.hasher.check_needs_rehash(stored):
+            try:
+                setattr(account, pass_col.key, self.hash(password))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Erro ao atualizar hash de senha: {e}")
+        return account
+
+
+auth_service = AuthService()
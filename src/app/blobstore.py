@@ -0,0 +1,141 @@
+import os
+import hashlib
+import logging
+import tempfile
+from datetime import datetime as dt
+from sqlalchemy import update, delete
+from sqlalchemy.dialects.sqlite import insert
+from db import db, Blob
+from metrics import UPLOADS, UPLOAD_BYTES
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def blobKey(digest, ext):
+    """
+    Caminho relativo do blob: dois níveis de pastas pelo início do hash.
+    """
+    return f'{digest[:2]}/{digest[2:4]}/{digest}.{ext}'
+
+def isBlobKey(name):
+    return bool(name) and name.count('/') == 2
+
+
+class BlobStore:
+    """
+    Arquivos enviados guardados pelo sha256 do conteúdo. Fotos iguais ocupam
+    um único arquivo; tbBlobs conta quantos registros apontam para cada um e
+    o arquivo só é apagado quando a contagem chega a zero.
+    """
+
+    def __init__(self, root=None):
+        self.root = root
+
+    def init_app(self, app):
+        self.root = app.config['UPLOAD_FOLDER']
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def put(self, stream, ext):
+        """
+        Grava o conteúdo de stream e retorna (chave, se o arquivo é novo).
+        O hash é calculado enquanto o arquivo temporário é escrito; se o blob
+        já existe, o temporário é descartado e só a contagem aumenta.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+
+            key = blobKey(digest.hexdigest(), ext.lower())
+            self._incref(key, size)
+
+            path = self.path(key)
+            dedup = os.path.exists(path)
+            UPLOADS.inc(dedup=str(dedup).lower())
+            UPLOAD_BYTES.inc(size, dedup=str(dedup).lower())
+            if dedup:
+                os.remove(tmp_path)
+                # Renova o mtime para o coletor de órfãos respeitar a carência
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                return key, True
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return key, False
+
+    def _incref(self, key, size):
+        stmt = insert(Blob).values(
+            blob_key=key, blob_refs=1, blob_size=size,
+            blob_created_at=dt.utcnow(), blob_updated_at=dt.utcnow()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Blob.blob_key],
+            set_={'blob_refs': Blob.blob_refs + 1, 'blob_updated_at': dt.utcnow()}
+        )
+        with db.engine.begin() as conn:
+            conn.execute(stmt)
+
+    def release(self, key):
+        """
+        Remove uma referência. Retorna True se o arquivo foi apagado.
+
+        Quando a contagem zera, o arquivo é renomeado para .deleted ainda
+        dentro da transação que apaga a linha: um put() do mesmo conteúdo
+        fica esperando essa transação no _incref e, ao ver que o arquivo não
+        existe, grava um novo. Se o commit falhar, o arquivo volta ao lugar.
+        """
+        path = self.path(key)
+        tombstone = f'{path}.deleted'
+        moved = False
+        try:
+            with db.engine.begin() as conn:
+                refs = conn.execute(
+                    update(Blob)
+                    .where(Blob.blob_key == key, Blob.blob_refs > 0)
+                    .values(blob_refs=Blob.blob_refs - 1, blob_updated_at=dt.utcnow())
+                    .returning(Blob.blob_refs)
+                ).scalar()
+                if refs is None or refs > 0:
+                    return False
+                # Só apaga se ninguém incrementou a contagem nesse meio tempo
+                removed = conn.execute(
+                    delete(Blob).where(Blob.blob_key == key, Blob.blob_refs == 0)
+                ).rowcount
+                if not removed:
+                    return False
+                try:
+                    os.replace(path, tombstone)
+                    moved = True
+                except FileNotFoundError:
+                    pass
+        except Exception:
+            if moved:
+                os.replace(tombstone, path)
+            raise
+
+        if moved:
+            try:
+                os.remove(tombstone)
+            except OSError as e:
+                logging.error(f"Erro ao remover blob {key}: {e}")
+        return True
+
+blob_store = BlobStore()
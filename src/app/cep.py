@@ -0,0 +1,158 @@
+import re
+import json
+import logging
+import threading
+import requests
+from collections import OrderedDict
+from datetime import datetime as dt, timedelta
+from sqlalchemy.exc import SQLAlchemyError
+from db import db, CepCache
+from http_client import http_client
+
+
+VIACEP_URL = 'https://viacep.com.br/ws/{cep}/json/'
+
+
+class CepResolver:
+    """
+    Resolve CEPs usando, nesta ordem: cache LRU em memória, tabela tbCeps
+    e por último o ViaCEP. Consultas simultâneas ao mesmo CEP esperam a
+    primeira em vez de gerar várias chamadas externas.
+    """
+
+    def __init__(self, url=VIACEP_URL, maxsize=10000, ttl=timedelta(days=30),
+                 negative_ttl=timedelta(hours=1), timeout=5):
+        self.url = url
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def init_app(self, app):
+        self.url = app.config.get('CEP_URL', self.url)
+        self.maxsize = app.config.get('CEP_CACHE_SIZE', self.maxsize)
+        self.timeout = app.config.get('CEP_TIMEOUT', self.timeout)
+        # O timeout vale pela política do host no http_client
+        http_client.default_host(self.url, read_timeout=self.timeout)
+
+    @staticmethod
+    def normalize(cep):
+        cep = re.sub(r'\D', '', cep or '')
+        return cep if len(cep) == 8 else None
+
+    def _get_cached(self, cep):
+        with self._lock:
+            entry = self._cache.get(cep)
+            if entry is None:
+                return None
+            data, expires_at = entry
+            if expires_at < dt.utcnow():
+                del self._cache[cep]
+                return None
+            self._cache.move_to_end(cep)
+            return entry
+
+    def _put_cached(self, cep, data, expires_at):
+        with self._lock:
+            self._cache[cep] = (data, expires_at)
+            self._cache.move_to_end(cep)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def _load_stored(self, cep):
+        row = db.session.get(CepCache, cep)
+        if row is None:
+            return None
+        ttl = self.negative_ttl if row.cep_erro else self.ttl
+        expires_at = row.cep_updated_at + ttl
+        if expires_at < dt.utcnow():
+            return None
+        data = None if row.cep_erro else json.loads(row.cep_data)
+        return data, expires_at
+
+    def _store(self, cep, data):
+        try:
+            row = db.session.get(CepCache, cep) or CepCache(cep=cep)
+            row.cep_erro = data is None
+            row.cep_data = None if data is None else json.dumps(data, ensure_ascii=False)
+            row.cep_updated_at = dt.utcnow()
+            db.session.add(row)
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logging.error(f"Erro ao gravar CEP {cep}: {e}")
+
+    def _fetch(self, cep):
+        """
+        Retorna (dados, cacheável). Falhas de rede não entram no cache negativo.
+        """
+        try:
+            res = http_client.get(self.url.format(cep=cep))
+        except requests.RequestException as e:
+            logging.error(f"Erro ao consultar ViaCEP ({cep}): {e}")
+            return None, False
+        if res.status_code == 400:
+            return None, True
+        if res.status_code != 200:
+            return None, False
+        try:
+            data = res.json()
+        except ValueError as e:
+            # Página de erro de proxy ou corpo truncado: tenta de novo na próxima
+            logging.error(f"Resposta inválida do ViaCEP ({cep}): {e}")
+            return None, False
+        if not isinstance(data, dict):
+            logging.error(f"Resposta inesperada do ViaCEP ({cep}): {type(data).__name__}")
+            return None, False
+        if 'erro' in data:
+            return None, True
+        return data, True
+
+    def _resolve(self, cep):
+        stored = self._load_stored(cep)
+        if stored is not None:
+            self._put_cached(cep, *stored)
+            return stored[0]
+
+        data, cacheable = self._fetch(cep)
+        if cacheable:
+            ttl = self.ttl if data is not None else self.negative_ttl
+            self._put_cached(cep, data, dt.utcnow() + ttl)
+            self._store(cep, data)
+        return data
+
+    def lookup(self, cep):
+        """
+        Retorna o dicionário do ViaCEP ou None se o CEP não existir
+        """
+        cep = self.normalize(cep)
+        if cep is None:
+            return None
+
+        entry = self._get_cached(cep)
+        if entry is not None:
+            return entry[0]
+
+        with self._lock:
+            event = self._inflight.get(cep)
+            leader = event is None
+            if leader:
+                event = self._inflight[cep] = threading.Event()
+
+        if not leader:
+            event.wait(self.timeout * 2)
+            entry = self._get_cached(cep)
+            return entry[0] if entry is not None else None
+
+        try:
+            return self._resolve(cep)
+        finally:
+            with self._lock:
+                del self._inflight[cep]
+            event.set()
+
+
+cep_resolver = CepResolver()
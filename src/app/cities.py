@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+import unicodedata
+from http_client import http_client
+
+
+IBGE_URL = "https://servicodados.ibge.gov.br/api/v1/localidades/estados/SP/municipios"
+SNAPSHOT_VERSION = 1
+# Lista que acompanha o código, no formato do snapshot, para a primeira
+# subida com o IBGE fora do ar. fetched_at 0: é trocada assim que o IBGE responder.
+BUNDLED_SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'municipios_sp.json')
+
+
+def cityKey(name):
+    """
+    Nome comparável de uma cidade: sem acentos, sem diferença de
+    maiúsculas e com espaços normalizados ("Jundiaí" e " jundiai").
+    """
+    if not name:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', name)
+    return ' '.join(''.join(c for c in decomposed if not unicodedata.combining(c)).casefold().split())
+
+
+class CityRegistry:
+    """
+    Registro de municípios carregado de um snapshot em disco.
+    A API do IBGE só é consultada em segundo plano, quando o snapshot
+    expira (TTL) ou ainda não existe. Sem snapshot, usa a lista embutida
+    (bundled_path) até a primeira atualização.
+    """
+
+    def __init__(self, url=IBGE_URL, snapshot_path=None, bundled_path=BUNDLED_SNAPSHOT, ttl=24 * 3600, timeout=10):
+        self.url = url
+        self.snapshot_path = snapshot_path
+        self.bundled_path = bundled_path
+        self.ttl = ttl
+        self.timeout = timeout
+        self.cities = []
+        self.city_set = frozenset()
+        self.by_id = {}
+        self.by_key = {}
+        self.observers = []
+        self.fetched_at = 0
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._next_check = 0
+
+    def init_app(self, app):
+        self.url = app.config.get('CITIES_URL', self.url)
+        self.ttl = app.config.get('CITIES_TTL', self.ttl)
+        self.timeout = app.config.get('CITIES_TIMEOUT', self.timeout)
+        http_client.default_host(self.url, read_timeout=self.timeout)
+        self.snapshot_path = app.config.get(
+            'CITIES_SNAPSHOT',
+            os.path.join(app.instance_path, 'municipios_sp.json')
+        )
+        self.bundled_path = app.config.get('CITIES_BUNDLED', self.bundled_path)
+        self.load()
+        app.before_request(self.maybe_refresh)
+
+    def __contains__(self, name):
+        return name in self.city_set
+
+    def __len__(self):
+        return len(self.cities)
+
+    def code(self, name):
+        """
+        Código IBGE do município, ignorando acentos e maiúsculas. None se
+        o nome não estiver no registro (ou se ele ainda não foi carregado).
+        """
+        return self.by_key.get(cityKey(name))
+
+    @property
+    def loaded(self):
+        return bool(self.city_set)
+
+    def is_valid(self, name):
+        """
+        Sem a lista carregada (nem snapshot nem lista embutida) nenhuma
+        cidade é válida; as denúncias e resgates respondem 503 antes.
+        """
+        return name in self.city_set
+
+    def _apply(self, municipios, fetched_at):
+        municipios = sorted(municipios, key=lambda m: m['nome'])
+        self.by_id = {m['id']: m['nome'] for m in municipios}
+        self.by_key = {cityKey(m['nome']): m['id'] for m in municipios}
+        self.cities = [m['nome'] for m in municipios]
+        self.city_set = frozenset(self.cities)
+        self.fetched_at = fetched_at
+        for observer in self.observers:
+            try:
+                observer()
+            except Exception as e:
+                logging.error(f"Erro ao avisar da nova lista de municípios: {e}")
+
+    @staticmethod
+    def _read(path):
+        """
+        Snapshot e mtime do arquivo, ou (None, None) se não existir ou for inválido.
+        """
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError, TypeError):
+            return None, None
+
+        if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION or not snapshot.get('municipios'):
+            logging.warning(f"Snapshot de municípios ignorado: {path}")
+            return None, None
+        return snapshot, mtime
+
+    def load(self):
+        """
+        Carrega o snapshot do disco. Sem ele, e sem lista carregada, usa a
+        lista embutida. Retorna False se nenhum dos dois servir.
+        """
+        snapshot, mtime = self._read(self.snapshot_path)
+        if snapshot is not None:
+            self._apply(snapshot['municipios'], snapshot.get('fetched_at', mtime))
+            self._mtime = mtime
+            return True
+
+        if self.loaded or not self.bundled_path:
+            return False
+        snapshot, _ = self._read(self.bundled_path)
+        if snapshot is None:
+            return False
+        self._apply(snapshot['municipios'], snapshot.get('fetched_at', 0))
+        logging.warning(f"Sem snapshot de municípios; usando a lista embutida ({len(self.cities)} cidades)")
+        return True
+
+    def _write(self, municipios, fetched_at):
+        directory = os.path.dirname(self.snapshot_path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'source': self.url,
+            'fetched_at': fetched_at,
+            'municipios': municipios,
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._mtime = os.path.getmtime(self.snapshot_path)
+
+    def fetch(self):
+        res = http_client.get(self.url)
+        res.raise_for_status()
+        return [{'id': cidade['id'], 'nome': cidade['nome']} for cidade in res.json()]
+
+    def refresh(self):
+        """
+        Busca a lista no IBGE e grava um novo snapshot. Em caso de falha
+        mantém os dados atuais.
+        """
+        try:
+            municipios = self.fetch()
+            if not municipios:
+                raise ValueError('lista de municípios vazia')
+            fetched_at = time.time()
+            self._apply(municipios, fetched_at)
+            self._write(municipios, fetched_at)
+            logging.info(f"Snapshot de municípios atualizado: {len(municipios)} cidades")
+            return True
+        except Exception as e:
+            logging.error(f"Erro ao atualizar municípios: {e}")
+            return False
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def is_stale(self):
+        return not self.cities or time.time() - self.fetched_at > self.ttl
+
+    def maybe_refresh(self):
+        """
+        Chamado a cada requisição; só verifica o disco a cada poucos segundos
+        e dispara no máximo uma atualização em segundo plano por vez.
+        """
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + 30
+
+        try:
+            mtime = os.path.getmtime(self.snapshot_path)
+        except OSError:
+            mtime = None
+        # Outro processo pode ter gravado um snapshot mais novo
+        if mtime is not None and mtime != self._mtime:
+            self.load()
+
+        if not self.is_stale():
+            return
+
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        threading.Thread(target=self.refresh, name='cities-refresh', daemon=True).start()
+
+
+city_registry = CityRegistry()
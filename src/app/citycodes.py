@@ -0,0 +1,101 @@
+import time
+import logging
+from sqlalchemy import event, select, update, bindparam, inspect
+from db import db, User, Ong, Report, Rescue, Events
+from cities import city_registry
+
+
+# Coluna de texto, coluna do código IBGE e chave primária de cada tabela
+CITY_COLUMNS = {
+    User: (User.user_city, User.user_city_id, User.user_id),
+    Ong: (Ong.ong_city, Ong.ong_city_id, Ong.ong_id),
+    Report: (Report.rep_city, Report.rep_city_id, Report.rep_id),
+    Rescue: (Rescue.resc_city, Rescue.resc_city_id, Rescue.resc_id),
+    Events: (Events.event_city, Events.event_city_id, Events.event_id),
+}
+
+
+def cityClause(model, city):
+    """
+    Filtro de cidade por igualdade do código IBGE (inteiro, indexado), sem
+    diferença de acentos e maiúsculas. Cidade fora do registro não tem
+    código: compara o texto, como antes.
+    """
+    name_col, id_col, _ = CITY_COLUMNS[model]
+    code = city_registry.code(city)
+    return id_col == code if code is not None else name_col == city
+
+
+class CityCodeBackfill:
+    """
+    Preenche o código IBGE das linhas antigas (ou gravadas enquanto a lista
+    de municípios não estava carregada), em lotes de batch_size, cada lote
+    na sua transação. Só lê as linhas com código nulo, pelo índice da
+    coluna, então é rápido quando não há nada a fazer. Roda na subida da
+    aplicação e sempre que a lista de municípios muda.
+    """
+
+    def __init__(self, batch_size=5000):
+        self.batch_size = batch_size
+        self.app = None
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get('CITY_BACKFILL_BATCH', self.batch_size)
+        city_registry.observers.append(self.run)
+        self.run()
+
+    def run(self):
+        if self.app is None or not city_registry.by_key:
+            return {}
+        with self.app.app_context():
+            return {model.__tablename__: self.backfill(model) for model in CITY_COLUMNS}
+
+    def backfill(self, model):
+        name_col, id_col, pk = CITY_COLUMNS[model]
+        start = time.perf_counter()
+        last = 0
+        filled = 0
+        while True:
+            with db.engine.begin() as conn:
+                rows = conn.execute(
+                    select(pk, name_col)
+                    .where(id_col.is_(None), name_col.isnot(None), pk > last)
+                    .order_by(pk)
+                    .limit(self.batch_size)
+                ).all()
+                if not rows:
+                    break
+                last = rows[-1][0]
+                values = [{'row_id': row_id, 'code': city_registry.code(name)} for row_id, name in rows]
+                values = [v for v in values if v['code'] is not None]
+                if values:
+                    table = model.__table__
+                    conn.execute(
+                        update(table).where(table.c[pk.key] == bindparam('row_id'))
+                        .values({id_col.key: bindparam('code')}),
+                        values,
+                    )
+                filled += len(values)
+        if filled:
+            logging.info(f"Códigos de cidade preenchidos em {model.__tablename__}: {filled} linhas "
+                         f"em {time.perf_counter() - start:.1f}s")
+        return filled
+
+
+city_backfill = CityCodeBackfill()
+
+
+# O código acompanha o texto em toda escrita pela sessão (saveX, safe_update...)
+def _setCityCode(mapper, connection, target):
+    name_col, id_col, _ = CITY_COLUMNS[mapper.class_]
+    setattr(target, id_col.key, city_registry.code(getattr(target, name_col.key)))
+
+def _updateCityCode(mapper, connection, target):
+    name_col = CITY_COLUMNS[mapper.class_][0]
+    if inspect(target).attrs[name_col.key].history.has_changes():
+        _setCityCode(mapper, connection, target)
+
+for _model in CITY_COLUMNS:
+    event.listen(_model, 'before_insert', _setCityCode)
+    event.listen(_model, 'before_update', _updateCityCode)
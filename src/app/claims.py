@@ -0,0 +1,133 @@
+import logging
+from datetime import datetime as dt
+from sqlalchemy import update, select
+from sqlalchemy.exc import SQLAlchemyError
+from db import db, Report, Rescue
+from geo import ServiceArea
+from live import publishClaims
+from metrics import CLAIMS, CLAIM_LATENCY
+
+
+CLAIM_OK = 'ok'
+CLAIM_NOT_FOUND = 'not_found'
+CLAIM_WRONG_CITY = 'wrong_city'
+CLAIM_TAKEN = 'taken'
+
+MAX_BATCH = 500
+
+_COLUMNS = {
+    Report: (Report.rep_id, Report.rep_status, Report.rep_ong_id,
+             Report.rep_city, Report.rep_lat, Report.rep_lon, Report.rep_created_at),
+    Rescue: (Rescue.resc_id, Rescue.resc_status, Rescue.resc_ong_id,
+             Rescue.resc_city, Rescue.resc_lat, Rescue.resc_lon, Rescue.resc_created_at),
+}
+
+
+def _transition(model, ids, area, new_status, ong_id=None):
+    """
+    Troca o status de 'pendente' para new_status com um único UPDATE
+    condicional. Só as linhas que ainda estavam pendentes são alteradas, então
+    entre duas ONGs concorrentes apenas uma recebe o id de volta.
+    Retorna {id: (id, cidade, lat, lon, criado em)} das linhas alteradas.
+    """
+    pk, status, ong_col, city, lat, lon, created_at = _COLUMNS[model]
+    values = {status.key: new_status}
+    if ong_id is not None:
+        values[ong_col.key] = ong_id
+
+    stmt = (
+        update(model)
+        .where(pk.in_(ids), status == 'pendente', area.clause(model))
+        .values(**values)
+        .returning(pk, city, lat, lon, created_at)
+        .execution_options(synchronize_session=False)
+    )
+    try:
+        won = {row[0]: tuple(row) for row in db.session.execute(stmt)}
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logging.error(f"Erro ao atualizar {model.__tablename__}: {e}")
+        raise
+    return won
+
+
+def _inArea(model, ids, area):
+    """
+    Ids que estão na área pela distância real, a mesma checagem da listagem.
+    O UPDATE só tem a condição aproximada (caixa envolvente); a localização
+    de um caso não muda, então a checagem feita antes continua valendo.
+    """
+    pk, _, _, city, lat, lon, _ = _COLUMNS[model]
+    if not area.has_coords:
+        return ids
+    rows = db.session.execute(select(pk, city, lat, lon).where(pk.in_(ids), area.clause(model))).all()
+    return [row[0] for row in rows if area.contains(row[1], row[2], row[3])]
+
+
+def _explain(model, ids, area):
+    """
+    Descobre por que um id não foi alterado. Só roda para quem perdeu.
+    """
+    pk, _, _, city, lat, lon, _ = _COLUMNS[model]
+    rows = {row[0]: row[1:] for row in db.session.execute(
+        select(pk, area.clause(model), city, lat, lon).where(pk.in_(ids))
+    ).all()}
+    return {
+        i: CLAIM_NOT_FOUND if i not in rows
+        else CLAIM_WRONG_CITY if not rows[i][0] or (area.has_coords and not area.contains(*rows[i][1:]))
+        else CLAIM_TAKEN
+        for i in ids
+    }
+
+
+def _observe(model, rows, action):
+    kind = 'report' if model is Report else 'rescue'
+    CLAIMS.inc(len(rows), kind=kind, action=action)
+    if action != 'claimed':
+        return
+    now = dt.utcnow()
+    for row in rows:
+        if row[4] is not None:
+            CLAIM_LATENCY.observe((now - row[4]).total_seconds(), kind=kind)
+
+
+def _run(model, ids, area, new_status, ong_id=None):
+    area = ServiceArea.of(area)
+    action = 'claimed' if ong_id is not None else 'rejected'
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    results = {}
+    for start in range(0, len(ids), MAX_BATCH):
+        chunk = ids[start:start + MAX_BATCH]
+        allowed = _inArea(model, chunk, area)
+        won = _transition(model, allowed, area, new_status, ong_id) if allowed else {}
+        lost = [i for i in chunk if i not in won]
+        results.update({i: CLAIM_OK for i in won})
+        publishClaims(model, [row[:4] for row in won.values()], action)
+        _observe(model, won.values(), action)
+        if lost:
+            results.update(_explain(model, lost, area))
+    return results
+
+
+def claimReports(ids, ong_id, area):
+    """
+    Aceita várias denúncias de uma vez. area é a cidade da ONG ou uma
+    ServiceArea. Retorna {rep_id: resultado}.
+    """
+    return _run(Report, ids, area, 'andamento', ong_id)
+
+def claimRescues(ids, ong_id, area):
+    return _run(Rescue, ids, area, 'andamento', ong_id)
+
+def claimReport(report_id, ong_id, area):
+    return claimReports([report_id], ong_id, area)[report_id]
+
+def claimRescue(rescue_id, ong_id, area):
+    return claimRescues([rescue_id], ong_id, area)[rescue_id]
+
+def rejectReport(report_id, area):
+    return _run(Report, [report_id], area, 'rejeitado')[report_id]
+
+def rejectRescue(rescue_id, area):
+    return _run(Rescue, [rescue_id], area, 'rejeitado')[rescue_id]
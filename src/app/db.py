@@ -1,10 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime as dt, timedelta, datetime
-from argon2 import PasswordHasher
 import logging
 from sqlalchemy.exc import SQLAlchemyError
+from storage import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'tbUsers'
@@ -15,6 +15,7 @@ class User(db.Model):
     user_phone = db.Column(db.String, nullable=False)
     user_cep = db.Column(db.String)
     user_city = db.Column(db.String)
+    user_city_id = db.Column(db.Integer, index=True)
     user_address = db.Column(db.String)
     user_num = db.Column(db.String)
     user_profile_photo = db.Column(db.String, default=None)
@@ -58,27 +59,44 @@ class User(db.Model):
 
 class Report(db.Model):
     __tablename__ = 'tbReport'
-    __table_args__ = {'extend_existing': True} 
+    __table_args__ = (
+        # Painel da ONG: pendentes da cidade, mais recentes primeiro
+        db.Index('ix_tbReport_pending_cityid_date', 'rep_city_id', 'rep_date', 'rep_id',
+                 sqlite_where=db.text("rep_status = 'pendente'")),
+        db.Index('ix_tbReport_pending_geohash', 'rep_geohash',
+                 sqlite_where=db.text("rep_status = 'pendente'")),
+        # Histórico do usuário e casos em andamento da ONG
+        db.Index('ix_tbReport_user_date', 'rep_user_id', 'rep_date', 'rep_id'),
+        db.Index('ix_tbReport_ong_status', 'rep_ong_id', 'rep_status'),
+        {'extend_existing': True}
+    )
     
     rep_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    rep_title = db.Column(db.String(255), nullable=False, index=True)  
+    rep_title = db.Column(db.String(255), nullable=False)  
     rep_desc = db.Column(db.Text) 
     rep_city = db.Column(db.String(100), index=True) 
+    rep_city_id = db.Column(db.Integer, index=True)
     rep_address = db.Column(db.String(255))
     rep_date = db.Column(db.DateTime, nullable=False, index=True)  
     rep_phone = db.Column(db.String(20))
     rep_email = db.Column(db.String(100))
-    rep_status = db.Column(db.String(20), default='pendente', nullable=False, index=True)
+    rep_status = db.Column(db.String(20), default='pendente', nullable=False)
     rep_photo = db.Column(db.String(255))
-    rep_user_id = db.Column(db.Integer, db.ForeignKey('tbUsers.user_id'), index=True)
-    rep_ong_id = db.Column(db.Integer, db.ForeignKey('tbOngs.ong_id'), index=True, default=None)
-    rep_created_at = db.Column(db.DateTime, default=dt.utcnow) 
+    rep_user_id = db.Column(db.Integer, db.ForeignKey('tbUsers.user_id'))
+    rep_ong_id = db.Column(db.Integer, db.ForeignKey('tbOngs.ong_id'), default=None)
+    rep_created_at = db.Column(db.DateTime, default=dt.utcnow, index=True)
+    rep_lat = db.Column(db.Float)
+    rep_lon = db.Column(db.Float)
+    rep_geohash = db.Column(db.String(12))
     
     def __repr__(self):
         return f'<Report {self.rep_id}: {self.rep_title}>'
     
 class Events(db.Model):
     __tablename__ = 'tbEvents'
+    __table_args__ = (
+        db.Index('ix_tbEvents_ong_date', 'event_ong_id', 'event_date'),
+    )
 
     event_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     event_title = db.Column(db.String(100), nullable=False)
@@ -86,8 +104,9 @@ class Events(db.Model):
     event_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     event_location = db.Column(db.String(200), nullable=False)
     event_city = db.Column(db.String(100), nullable=True)
+    event_city_id = db.Column(db.Integer, index=True)
     event_photo = db.Column(db.String, nullable=True)
-    event_created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    event_created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     event_ong_id = db.Column(db.Integer, db.ForeignKey('tbOngs.ong_id'), nullable=False)
 
     def __repr__(self):
@@ -103,6 +122,7 @@ class Ong(db.Model):
     ong_cpf = db.Column(db.String)
     ong_cep = db.Column(db.String)
     ong_city = db.Column(db.String)
+    ong_city_id = db.Column(db.Integer, index=True)
     ong_hood = db.Column(db.String)
     ong_address = db.Column(db.String)
     ong_num = db.Column(db.String)
@@ -110,6 +130,9 @@ class Ong(db.Model):
     ong_reportsResolved = db.Column(db.Integer, default=0)
     ong_rescuesResolved = db.Column(db.Integer, default=0)
     ong_profile_photo = db.Column(db.String, default=None)
+    ong_lat = db.Column(db.Float)
+    ong_lon = db.Column(db.Float)
+    ong_radius_km = db.Column(db.Integer, default=10)
 
     def update_fields(self, **kwargs):
         """
@@ -135,7 +158,8 @@ class Ong(db.Model):
             allowed_fields = [
                 'ong_name', 'ong_phone', 'ong_email', 'ong_cpf', 'ong_cep',
                 'ong_city', 'ong_hood', 'ong_address', 'ong_num', 'ong_desc',
-                'ong_reportsResolved', 'ong_rescuesResolved', 'ong_profile_photo'
+                'ong_reportsResolved', 'ong_rescuesResolved', 'ong_profile_photo',
+                'ong_lat', 'ong_lon', 'ong_radius_km'
             ]
         
         filtered_data = {k: v for k, v in data_dict.items() 
@@ -151,7 +175,15 @@ class Ong(db.Model):
 
 class Rescue(db.Model):
     __tablename__ = 'tbRescues'
-    __table_args__ = {'extend_existing': True} 
+    __table_args__ = (
+        db.Index('ix_tbRescues_pending_cityid_date', 'resc_city_id', 'resc_created_at', 'resc_id',
+                 sqlite_where=db.text("resc_status = 'pendente'")),
+        db.Index('ix_tbRescues_pending_geohash', 'resc_geohash',
+                 sqlite_where=db.text("resc_status = 'pendente'")),
+        db.Index('ix_tbRescues_user_date', 'resc_user_id', 'resc_created_at', 'resc_id'),
+        db.Index('ix_tbRescues_ong_status', 'resc_ong_id', 'resc_status'),
+        {'extend_existing': True}
+    )
     
     resc_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     resc_date = db.Column(db.DateTime, default=dt.utcnow, index=True)  
@@ -161,21 +193,94 @@ class Rescue(db.Model):
     resc_phone = db.Column(db.String(20), nullable=False)
     resc_cep = db.Column(db.String(10))
     resc_city = db.Column(db.String(100), nullable=False, index=True) 
+    resc_city_id = db.Column(db.Integer, index=True)
     resc_addr = db.Column(db.String(255))
     resc_num = db.Column(db.String(20))
-    resc_status = db.Column(db.String(20), default='pendente', nullable=False, index=True)
-    resc_user_id = db.Column(db.Integer, db.ForeignKey('tbUsers.user_id'), index=True)
-    resc_ong_id = db.Column(db.Integer, db.ForeignKey('tbOngs.ong_id'), index=True, default=None)
-    resc_created_at = db.Column(db.DateTime, default=dt.utcnow)  
+    resc_status = db.Column(db.String(20), default='pendente', nullable=False)
+    resc_user_id = db.Column(db.Integer, db.ForeignKey('tbUsers.user_id'))
+    resc_ong_id = db.Column(db.Integer, db.ForeignKey('tbOngs.ong_id'), default=None)
+    resc_created_at = db.Column(db.DateTime, default=dt.utcnow, index=True)
+    resc_lat = db.Column(db.Float)
+    resc_lon = db.Column(db.Float)
+    resc_geohash = db.Column(db.String(12))
     
     def __repr__(self):
         return f'<Rescue {self.resc_id}: {self.resc_author} - {self.resc_city}>'
 
+class CepCache(db.Model):
+    __tablename__ = 'tbCeps'
+
+    cep = db.Column(db.String(8), primary_key=True)
+    cep_data = db.Column(db.Text)
+    cep_erro = db.Column(db.Boolean, default=False, nullable=False)
+    cep_updated_at = db.Column(db.DateTime, default=dt.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<CepCache {self.cep}>'
+
+class SessionData(db.Model):
+    __tablename__ = 'tbSessions'
+
+    sess_id = db.Column(db.String(64), primary_key=True)
+    sess_data = db.Column(db.Text, nullable=False)
+    sess_expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<SessionData {self.sess_id}>'
+
+class Blob(db.Model):
+    __tablename__ = 'tbBlobs'
+
+    blob_key = db.Column(db.String(100), primary_key=True)
+    blob_refs = db.Column(db.Integer, default=0, nullable=False)
+    blob_size = db.Column(db.Integer, nullable=False)
+    blob_created_at = db.Column(db.DateTime, default=dt.utcnow, nullable=False)
+    blob_updated_at = db.Column(db.DateTime, default=dt.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<Blob {self.blob_key} refs={self.blob_refs}>'
+
+class PendingCount(db.Model):
+    """
+    Casos pendentes por tipo e cidade, mantidos por gatilhos (metrics.py).
+    """
+    __tablename__ = 'tbPendingCounts'
+
+    pc_kind = db.Column(db.String(10), primary_key=True)
+    pc_city = db.Column(db.String(100), primary_key=True)
+    pc_pending = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<PendingCount {self.pc_kind} {self.pc_city}: {self.pc_pending}>'
+
+class CacheVersion(db.Model):
+    """
+    Contador de versão de um cache em memória, incrementado por gatilhos a
+    cada mudança nos dados de origem. Cada processo compara com a versão que
+    carregou para saber se o cache ficou velho.
+    """
+    __tablename__ = 'tbCacheVersions'
+
+    cv_name = db.Column(db.String(50), primary_key=True)
+    cv_version = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<CacheVersion {self.cv_name}: {self.cv_version}>'
+
+def geohashOf(lat, lon):
+    if lat is None or lon is None:
+        return None
+    from geo import geohashEncode
+    return geohashEncode(lat, lon)
+
+def notifyCase(case, action):
+    from live import publishCase
+    publishCase(case, action)
+
 def saveUser(name, email, password, phone, cep, city, addr, num, photo=None):
     if User.query.filter_by(user_email=email).first():
         return False
-    ph = PasswordHasher()
-    hashed_password = ph.hash(password)
+    hashed_password = hashPassword(password)
     user = User(
         user_name=name,
         user_email=email,
@@ -243,11 +348,10 @@ def updateOng(ong_id, **kwargs):
         db.session.rollback()
         return {'success': False, 'error': str(e)}
 
-def saveOng(name, phone, email, password, cpf, cep, city, hood, address, num, photo, desc=None):
+def saveOng(name, phone, email, password, cpf, cep, city, hood, address, num, photo, desc=None, lat=None, lon=None):
     if Ong.query.filter_by(ong_email=email).first():
         return False
-    ph = PasswordHasher()
-    hashed_password = ph.hash(password)
+    hashed_password = hashPassword(password)
     ong = Ong(
         ong_name=name,
         ong_phone=phone,
@@ -261,6 +365,8 @@ def saveOng(name, phone, email, password, cpf, cep, city, hood, address, num, ph
         ong_num=num,
         ong_desc=desc,
         ong_profile_photo=photo,
+        ong_lat=lat,
+        ong_lon=lon,
     )
     db.session.add(ong)
     db.session.commit()
@@ -269,31 +375,19 @@ def saveOng(name, phone, email, password, cpf, cep, city, hood, address, num, ph
 def getUser(email):
     return User.query.filter_by(user_email=email).first()
 
+def hashPassword(password):
+    from auth import auth_service
+    return auth_service.hash(password)
+
 def checkUser(email, password):
-    user = getUser(email)
-    if user:
-        ph = PasswordHasher()
-        try:
-            if ph.verify(user.user_pass, password):
-                return True
-        except Exception as e:
-            print(f"Erro ao verificar senha: {e}")
-            return False
-    return False
+    from auth import auth_service
+    return auth_service.authenticate(User, email, password) is not None
 
 def checkOng(email, password):
-    ong = getOng(email)
-    if ong:
-        ph = PasswordHasher()
-        try:
-            if ph.verify(ong.ong_pass, password):
-                return True
-        except Exception as e:
-            print(f"Erro ao verificar senha: {e}")
-            return False
-    return False
+    from auth import auth_service
+    return auth_service.authenticate(Ong, email, password) is not None
 
-def saveReport(title, desc, city, date, phone, photo=None, email=None, addr=None, userId=None):
+def saveReport(title, desc, city, date, phone, photo=None, email=None, addr=None, userId=None, lat=None, lon=None):
     try:
         if not all([title, desc, city, date, phone]):
             logging.error("Campos obrigatórios ausentes")
@@ -315,11 +409,15 @@ def saveReport(title, desc, city, date, phone, photo=None, email=None, addr=None
             rep_phone=phone[:20],  
             rep_email=email[:100] if email else None,
             rep_photo=photo,  
-            rep_user_id=userId if userId else None
+            rep_user_id=userId if userId else None,
+            rep_lat=lat,
+            rep_lon=lon,
+            rep_geohash=geohashOf(lat, lon)
         )
         
         db.session.add(report)
         db.session.commit()
+        notifyCase(report, 'created')
         
         logging.info(f"Relatório salvo com sucesso - ID: {report.rep_id}")
         return True
@@ -333,7 +431,7 @@ def saveReport(title, desc, city, date, phone, photo=None, email=None, addr=None
         logging.error(f"Erro ao salvar relatório: {e}")
         return False
 
-def saveRescue(desc, author, phone, cep, city, addr=None, num=None, photo=None, userId=None):
+def saveRescue(desc, author, phone, cep, city, addr=None, num=None, photo=None, userId=None, lat=None, lon=None):
     try:
         if not all([desc, author, phone, city]):
             logging.error("Campos obrigatórios ausentes no resgate")
@@ -355,11 +453,15 @@ def saveRescue(desc, author, phone, cep, city, addr=None, num=None, photo=None,
             resc_addr=addr[:255] if addr else None,  
             resc_num=num[:20] if num else None,  
             resc_photo=photo, 
-            resc_user_id=userId if userId else None
+            resc_user_id=userId if userId else None,
+            resc_lat=lat,
+            resc_lon=lon,
+            resc_geohash=geohashOf(lat, lon)
         )
         
         db.session.add(rescue)
         db.session.commit()
+        notifyCase(rescue, 'created')
         
         logging.info(f"Resgate salvo com sucesso - ID: {rescue.resc_id}")
         return True
@@ -391,6 +493,17 @@ def getRescuesByCity(city):
 def getRescueById(id):
     return Rescue.query.filter_by(resc_id=id).first()
 
+def caseStats(model, user_id):
+    """
+    Quantidade de casos do usuário por status, sem carregar as linhas
+    """
+    if model is Report:
+        status_col, user_col = Report.rep_status, Report.rep_user_id
+    else:
+        status_col, user_col = Rescue.resc_status, Rescue.resc_user_id
+    rows = db.session.query(status_col, db.func.count()).filter(user_col == user_id).group_by(status_col)
+    return dict(rows.all())
+
 def getAllOngs():
     return Ong.query.all()
 
@@ -0,0 +1,211 @@
+import time
+import logging
+import itertools
+import threading
+from collections import namedtuple
+from jinja2.utils import htmlsafe_json_dumps
+from sqlalchemy import event, select, text, inspect
+from sqlalchemy.orm import Session, object_session
+from db import db, Ong, CacheVersion
+from cities import cityKey, city_registry
+from fragments import fragment_cache, ONG_GRID_TAG
+
+
+DIRECTORY_VERSION = 'ongs'
+
+# Colunas mostradas na página inicial; mudar outras (senha, coordenadas) não invalida
+_DISPLAY_COLUMNS = [
+    Ong.ong_id, Ong.ong_name, Ong.ong_email, Ong.ong_phone, Ong.ong_city, Ong.ong_hood,
+    Ong.ong_address, Ong.ong_num, Ong.ong_cep, Ong.ong_desc,
+    Ong.ong_reportsResolved, Ong.ong_rescuesResolved, Ong.ong_profile_photo,
+]
+
+_VERSION_BUMP = (
+    f"INSERT INTO tbCacheVersions (cv_name, cv_version) VALUES ('{DIRECTORY_VERSION}', 1) "
+    "ON CONFLICT (cv_name) DO UPDATE SET cv_version = cv_version + 1;"
+)
+
+_DIRECTORY_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS tbOngs_directory_insert AFTER INSERT ON tbOngs BEGIN {_VERSION_BUMP} END",
+    f"CREATE TRIGGER IF NOT EXISTS tbOngs_directory_delete AFTER DELETE ON tbOngs BEGIN {_VERSION_BUMP} END",
+    f"CREATE TRIGGER IF NOT EXISTS tbOngs_directory_update AFTER UPDATE OF "
+    f"{', '.join(c.key for c in _DISPLAY_COLUMNS[1:])} ON tbOngs BEGIN {_VERSION_BUMP} END",
+]
+
+
+def installDirectory(conn):
+    """
+    Cria os gatilhos que incrementam a versão do diretório de ONGs a cada
+    mudança em tbOngs, feita por qualquer processo. Só para SQLite.
+    """
+    if conn.dialect.name != 'sqlite':
+        return
+    for trigger in _DIRECTORY_TRIGGERS:
+        conn.execute(text(trigger))
+
+
+# Um cartão da página inicial; data é o JSON (seguro para <script>) do modal
+OngCard = namedtuple('OngCard', 'id name thumb data')
+
+# Cartões, JSON do modal e chave da grade no cache de trechos de HTML
+Listing = namedtuple('Listing', 'cards data key')
+
+
+class OngDirectory:
+    """
+    Cache das ONGs mostradas na página inicial, já no formato do template:
+    cartões por id e por município (código IBGE) e o dicionário do modal já
+    serializado. Escritas pela db.session (saveOng, safe_update, updates em
+    lote) invalidam o cache no commit; mudanças de outros processos
+    aparecem pela versão em tbCacheVersions, consultada no máximo a cada
+    check_interval segundos. Entre uma consulta e outra a página inicial
+    não toca no banco.
+    """
+
+    def __init__(self, check_interval=5, max_age=300):
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._state = None
+        self._generation = 0
+        self._next_check = 0
+        self._loads = itertools.count(1)
+
+    def init_app(self, app):
+        self.check_interval = app.config.get('DIRECTORY_CHECK_INTERVAL', self.check_interval)
+        self.max_age = app.config.get('DIRECTORY_MAX_AGE', self.max_age)
+        # Lista de municípios nova muda os códigos das cidades
+        city_registry.observers.append(self.invalidate)
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+            self._generation += 1
+
+    @staticmethod
+    def _cityKey(code, name):
+        # Código IBGE como em cityClause; o nome normalizado só para cidades fora do registro
+        if code is None:
+            code = city_registry.code(name)
+        return code if code is not None else cityKey(name)
+
+    @staticmethod
+    def _version():
+        return db.session.execute(
+            select(CacheVersion.cv_version).where(CacheVersion.cv_name == DIRECTORY_VERSION)
+        ).scalar() or 0
+
+    def _load(self):
+        from images import image_pipeline
+        generation = self._generation
+        # A versão vem antes das linhas: uma escrita no meio deixa a versão velha e força nova carga
+        version = self._version()
+        rows = db.session.execute(select(*_DISPLAY_COLUMNS, Ong.ong_city_id).order_by(Ong.ong_id)).all()
+
+        by_id = {}
+        by_city = {}
+        for row in rows:
+            photo = row.ong_profile_photo or 'default_logo.png'
+            card = OngCard(row.ong_id, row.ong_name, image_pipeline.url(photo, 'thumb'), htmlsafe_json_dumps({
+                'name': row.ong_name,
+                'email': row.ong_email,
+                'phone': row.ong_phone or '',
+                'city': row.ong_city or '',
+                'hood': row.ong_hood or '',
+                'address': row.ong_address or '',
+                'num': row.ong_num or '',
+                'cep': row.ong_cep or '',
+                'desc': row.ong_desc or '',
+                'reportsResolved': row.ong_reportsResolved or 0,
+                'rescuesResolved': row.ong_rescuesResolved or 0,
+                'profilePhoto': image_pipeline.url(photo, 'card'),
+            }))
+            by_id[card.id] = card
+            by_city.setdefault(self._cityKey(row.ong_city_id, row.ong_city), []).append(card)
+
+        load = next(self._loads)
+        state = {
+            'version': version,
+            'loaded_at': time.monotonic(),
+            'by_id': by_id,
+            'by_city': {city: _listing(cards, (load, city)) for city, cards in by_city.items()},
+            'all': _listing(list(by_id.values()), (load, None)),
+        }
+        with self._lock:
+            if generation == self._generation:
+                self._state = state
+                self._next_check = time.monotonic() + self.check_interval
+        # As grades da carga anterior não serão mais pedidas
+        fragment_cache.invalidate(ONG_GRID_TAG)
+        logging.info(f"Diretório de ONGs carregado: {len(by_id)} ONGs, versão {version}")
+        return state
+
+    def _current(self):
+        state = self._state
+        now = time.monotonic()
+        if state is None or now - state['loaded_at'] >= self.max_age:
+            return self._load()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            if self._version() != state['version']:
+                return self._load()
+        return state
+
+    def listing(self, city=None):
+        """
+        Listing de todas as ONGs ou só das de uma cidade.
+        """
+        state = self._current()
+        if city is None:
+            return state['all']
+        return state['by_city'].get(self._cityKey(None, city), _EMPTY)
+
+    def get(self, ong_id):
+        return self._current()['by_id'].get(ong_id)
+
+    def version(self):
+        """
+        Versão de tbCacheVersions que gerou os dados servidos agora (para o
+        ETag da página inicial).
+        """
+        return self._current()['version']
+
+
+def _listing(cards, key):
+    return Listing(tuple(cards), '{' + ','.join(f'"{card.id}":{card.data}' for card in cards) + '}', key)
+
+_EMPTY = Listing((), '{}', None)
+
+
+ong_directory = OngDirectory()
+
+
+# Escrita pela sessão: marca e invalida só depois do commit, para a
+# próxima carga já enxergar os dados novos
+@event.listens_for(Ong, 'after_insert')
+@event.listens_for(Ong, 'after_delete')
+def _markOngWrite(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['ong_directory_dirty'] = True
+
+@event.listens_for(Ong, 'after_update')
+def _markOngUpdate(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[c.key].history.has_changes() for c in _DISPLAY_COLUMNS[1:]):
+        _markOngWrite(mapper, connection, target)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _markOngBulkWrite(orm_execute_state):
+    mapper = orm_execute_state.bind_mapper
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and mapper is not None and mapper.class_ is Ong:
+        orm_execute_state.session.info['ong_directory_dirty'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidateDirectory(session):
+    if session.info.pop('ong_directory_dirty', False):
+        ong_directory.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _discardOngWrite(session):
+    session.info.pop('ong_directory_dirty', None)
@@ -0,0 +1,148 @@
+import io
+import csv
+import json
+from datetime import datetime, date
+import click
+from sqlalchemy import select
+from db import Report, Rescue, Events
+from storage import readEngine
+from citycodes import cityClause
+from geo import ServiceArea
+
+
+# Por tabela exportada: modelo, colunas de id, cidade, status e data,
+# colunas de lat/lon (eventos não têm status nem coordenadas) e as colunas
+# que vão para o arquivo. Telefone, email, autor e usuário de quem fez o
+# caso nunca saem.
+EXPORT_TABLES = {
+    'reports': (Report, Report.rep_id, Report.rep_city, Report.rep_status, Report.rep_date,
+                (Report.rep_lat, Report.rep_lon), (
+        Report.rep_id, Report.rep_title, Report.rep_desc, Report.rep_city, Report.rep_city_id,
+        Report.rep_address, Report.rep_date, Report.rep_status, Report.rep_ong_id,
+        Report.rep_lat, Report.rep_lon, Report.rep_created_at,
+    )),
+    'rescues': (Rescue, Rescue.resc_id, Rescue.resc_city, Rescue.resc_status, Rescue.resc_date,
+                (Rescue.resc_lat, Rescue.resc_lon), (
+        Rescue.resc_id, Rescue.resc_desc, Rescue.resc_city, Rescue.resc_city_id, Rescue.resc_addr,
+        Rescue.resc_num, Rescue.resc_cep, Rescue.resc_date, Rescue.resc_status, Rescue.resc_ong_id,
+        Rescue.resc_lat, Rescue.resc_lon, Rescue.resc_created_at,
+    )),
+    'events': (Events, Events.event_id, Events.event_city, None, Events.event_date, None, (
+        Events.event_id, Events.event_title, Events.event_description, Events.event_date,
+        Events.event_location, Events.event_city, Events.event_city_id, Events.event_ong_id,
+        Events.event_created_at,
+    )),
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def csvChunks(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows([['' if v is None else _plain(v) for v in row] for row in rows])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def ndjsonChunks(columns, batches):
+    for rows in batches:
+        yield ''.join(
+            json.dumps({c: _plain(v) for c, v in zip(columns, row)}, ensure_ascii=False) + '\n'
+            for row in rows
+        )
+
+_WRITERS = {'csv': csvChunks, 'ndjson': ndjsonChunks}
+
+
+class Exporter:
+    """
+    Exportação de denúncias, resgates e eventos em CSV ou NDJSON. As linhas
+    são lidas em lotes pela chave primária (id > último id do lote anterior),
+    cada lote numa leitura curta: a memória não cresce com a tabela, o
+    primeiro lote sai logo e nenhuma transação fica aberta enquanto o cliente
+    baixa o arquivo.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+
+    def init_app(self, app):
+        self.batch_size = app.config.get('EXPORT_BATCH', self.batch_size)
+
+        @app.cli.command('export')
+        @click.argument('table', type=click.Choice(list(EXPORT_TABLES)))
+        @click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default='csv')
+        @click.option('--city', default=None)
+        @click.option('--status', default=None)
+        @click.option('--since', type=click.DateTime(['%Y-%m-%d']), default=None, help='Data inicial (inclusive).')
+        @click.option('--until', type=click.DateTime(['%Y-%m-%d']), default=None, help='Data final (exclusive).')
+        @click.option('-o', '--output', type=click.File('w', encoding='utf-8'), default='-')
+        def export(table, fmt, city, status, since, until, output):
+            """Exporta uma tabela em CSV ou NDJSON."""
+            for chunk in self.stream(table, fmt, city=city, status=status, date_from=since, date_to=until):
+                output.write(chunk)
+
+    def query(self, table, area=None, city=None, status=None, date_from=None, date_to=None):
+        model, id_col, city_col, status_col, date_col, coords, columns = EXPORT_TABLES[table]
+        query = select(*columns)
+        if area is not None:
+            # Casos: cidade ou caixa envolvente, refinada depois em batches()
+            query = query.where(area.clause(model) if coords else cityClause(model, area.city))
+        if city:
+            query = query.where(cityClause(model, city))
+        if status and status_col is not None:
+            query = query.where(status_col == status)
+        if date_from:
+            query = query.where(date_col >= date_from)
+        if date_to:
+            query = query.where(date_col < date_to)
+        return query.order_by(id_col)
+
+    def batches(self, engine, table, area=None, **filters):
+        _, id_col, city_col, _, _, coords, _ = EXPORT_TABLES[table]
+        query = self.query(table, area=area, **filters).limit(self.batch_size)
+        last_id = None
+        while True:
+            page = query if last_id is None else query.where(id_col > last_id)
+            with engine.connect() as conn:
+                rows = conn.execute(page).all()
+            if not rows:
+                return
+            last_id = rows[-1]._mapping[id_col.key]
+            full = len(rows) == self.batch_size
+            if area is not None and coords and area.has_coords:
+                # Mesma distância real da listagem do painel
+                rows = [row for row in rows if area.contains(
+                    row._mapping[city_col.key], row._mapping[coords[0].key], row._mapping[coords[1].key])]
+            if rows:
+                yield rows
+            if not full:
+                return
+
+    def stream(self, table, fmt, area=None, **filters):
+        """
+        Gerador dos pedaços de texto do arquivo. Com area (a ServiceArea da
+        ONG), só saem os casos dentro dela e os eventos da cidade dela. Pega
+        o engine na hora da chamada, então pode ser consumido fora do
+        contexto da aplicação.
+        """
+        columns = [c.key for c in EXPORT_TABLES[table][6]]
+        area = ServiceArea.of(area) if area is not None else None
+        return _WRITERS[fmt](columns, self.batches(readEngine(), table, area=area, **filters))
+
+
+exporter = Exporter()
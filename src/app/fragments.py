@@ -0,0 +1,172 @@
+import threading
+from collections import OrderedDict
+from markupsafe import Markup, escape
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from db import Report, Rescue
+from cities import city_registry
+from metrics import FRAGMENTS
+
+
+# Tipo, chave primária e campos mostrados no card de cada caso
+_CARD_FIELDS = {
+    Report: ('report', 'rep_id', ('rep_title', 'rep_date', 'rep_desc', 'rep_address', 'rep_phone', 'rep_email'), 'rep_photo'),
+    Rescue: ('rescue', 'resc_id', ('resc_author', 'resc_date', 'resc_desc', 'resc_phone', 'resc_addr', 'resc_num', 'resc_cep'), 'resc_photo'),
+}
+
+CITIES_TAG = 'cities'
+ONG_GRID_TAG = 'ong_grid'
+
+
+class FragmentCache:
+    """
+    Trechos de HTML já renderizados (grade de ONGs da página inicial, cards
+    dos casos no painel, <option> das cidades), num LRU limitado a
+    max_bytes (HTML em UTF-8). As chaves carregam o que o trecho mostra
+    (versão do diretório, campos do caso, data da lista de municípios),
+    então nunca sai HTML desatualizado, nem de escritas de outro processo;
+    a tag de cada trecho (ex.: ('report', 12)) é invalidada quando a linha
+    muda pela sessão, para liberar o espaço antes de o LRU chegar lá.
+    """
+
+    def __init__(self, max_bytes=16 * 2 ** 20, enabled=True):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.size = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get('FRAGMENT_CACHE_BYTES', self.max_bytes)
+        self.enabled = app.config.get('FRAGMENT_CACHE_ENABLED', self.enabled)
+        app.jinja_env.globals.update(fragment=self.fragment, card_key=cardKey, city_options=self.city_options)
+        city_registry.observers.append(lambda: self.invalidate(CITIES_TAG))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        FRAGMENTS.inc(result='hit' if entry is not None else 'miss')
+        return entry[0] if entry is not None else None
+
+    def set(self, key, html, tag=None):
+        html = Markup(html)
+        size = len(html.encode('utf-8'))
+        if size > self.max_bytes:
+            return html
+        evicted = 0
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (html, size, tag)
+            self.size += size
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                evicted += 1
+        if evicted:
+            FRAGMENTS.inc(evicted, result='evicted')
+        return html
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry[1]
+        keys = self._tags.get(entry[2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tags[entry[2]]
+
+    def invalidate(self, tag):
+        with self._lock:
+            for key in self._tags.pop(tag, ()):
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self.size -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.size = 0
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self.size, 'max_bytes': self.max_bytes}
+
+    def fragment(self, key, tag=None, caller=None):
+        """
+        Para templates: {% call fragment(chave, tag) %}...{% endcall %}
+        renderiza o corpo só quando a chave não está no cache.
+        """
+        if not self.enabled:
+            return caller()
+        html = self.get(key)
+        if html is None:
+            html = self.set(key, caller(), tag)
+        return html
+
+    def city_options(self, cities, selected=None, label=True):
+        """
+        <option> de cada cidade, com a escolhida marcada. label=False gera
+        as opções sem texto, para <datalist>.
+        """
+        if self.enabled and cities is city_registry.cities:
+            key = (CITIES_TAG, label, city_registry.fetched_at)
+            html = self.get(key)
+            if html is None:
+                html = self.set(key, _cityOptions(cities, label), CITIES_TAG)
+        else:
+            html = _cityOptions(cities, label)
+        if selected:
+            value = f'<option value="{escape(selected)}"'
+            html = Markup(str(html).replace(value + '>', value + ' selected>', 1))
+        return html
+
+
+def _cityOptions(cities, label):
+    if label:
+        return Markup(''.join(f'<option value="{city}">{city}</option>\n' for city in map(escape, cities)))
+    return Markup(''.join(f'<option value="{escape(city)}">\n' for city in cities))
+
+
+def cardKey(case):
+    """
+    Chave do card de um caso: tipo, id, campos mostrados e URLs das fotos
+    (a miniatura muda de endereço quando termina de ser gerada).
+    """
+    from images import image_pipeline
+    kind, pk, fields, photo = _CARD_FIELDS[type(case)]
+    filename = getattr(case, photo)
+    return (kind, getattr(case, pk), *(getattr(case, f) for f in fields),
+            image_pipeline.url(filename, 'thumb'), image_pipeline.url(filename))
+
+
+fragment_cache = FragmentCache()
+
+
+# Caso alterado ou apagado pela sessão: solta os cards dele no commit
+@event.listens_for(Report, 'after_update')
+@event.listens_for(Report, 'after_delete')
+@event.listens_for(Rescue, 'after_update')
+@event.listens_for(Rescue, 'after_delete')
+def _markCaseWrite(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        kind, pk = _CARD_FIELDS[mapper.class_][:2]
+        session.info.setdefault('fragment_tags', set()).add((kind, getattr(target, pk)))
+
+@event.listens_for(Session, 'after_commit')
+def _invalidateFragments(session):
+    for tag in session.info.pop('fragment_tags', ()):
+        fragment_cache.invalidate(tag)
+
+@event.listens_for(Session, 'after_rollback')
+def _discardCaseWrite(session):
+    session.info.pop('fragment_tags', None)
@@ -0,0 +1,306 @@
+import math
+import time
+import logging
+import threading
+from sqlalchemy import select, event, or_, and_
+from sqlalchemy.orm import Session
+from db import db, Ong, Report, Rescue
+from pagination import keysetUnionPage, keysetFilteredPage, PAGE_SIZE
+from cities import cityKey, city_registry
+from citycodes import cityClause
+
+
+EARTH_RADIUS_KM = 6371.0
+GEOHASH_PRECISION = 7
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 100
+GRID_CELL_DEG = 0.1
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Colunas de localização de cada tipo de caso
+_CASE_COLUMNS = {
+    Report: (Report.rep_city, Report.rep_lat, Report.rep_lon, Report.rep_geohash, Report.rep_status),
+    Rescue: (Rescue.resc_city, Rescue.resc_lat, Rescue.resc_lon, Rescue.resc_geohash, Rescue.resc_status),
+}
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def parseCoords(lat, lon):
+    """
+    Converte lat/lon vindos de formulário. Retorna (None, None) se inválidos.
+    """
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None, None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or (lat == 0 and lon == 0):
+        return None, None
+    return lat, lon
+
+def geohashEncode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+def _cellSize(precision):
+    total = 5 * precision
+    lon_bits = (total + 1) // 2
+    lat_bits = total // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+def boundingBox(lat, lon, radius_km):
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+def coverCells(lat, lon, radius_km, max_cells=16, precision=None):
+    """
+    Prefixos de geohash que cobrem o círculo. Usa a maior precisão que
+    ainda gera no máximo max_cells células, ou a precisão pedida.
+    """
+    min_lat, max_lat, min_lon, max_lon = boundingBox(lat, lon, radius_km)
+    for precision in [precision] if precision else range(GEOHASH_PRECISION, 0, -1):
+        height, width = _cellSize(precision)
+        rows = math.floor(max_lat / height) - math.floor(min_lat / height) + 1
+        cols = math.floor(max_lon / width) - math.floor(min_lon / width) + 1
+        if rows * cols <= max_cells or precision == 1:
+            break
+
+    cells = set()
+    for r in range(rows):
+        cell_lat = min(max_lat, (math.floor(min_lat / height) + r + 0.5) * height)
+        for c in range(cols):
+            cell_lon = (math.floor(min_lon / width) + c + 0.5) * width
+            cells.add(geohashEncode(cell_lat, cell_lon, precision))
+    return sorted(cells)
+
+
+class ServiceArea:
+    """
+    Área de atuação de uma ONG: a cidade cadastrada e, se houver
+    coordenadas, o círculo de raio radius_km em volta da sede.
+    """
+
+    def __init__(self, city, lat=None, lon=None, radius_km=None):
+        self.city = city
+        self.city_key = cityKey(city)
+        self.city_code = city_registry.code(city)
+        self.lat = lat
+        self.lon = lon
+        self.radius_km = min(radius_km or DEFAULT_RADIUS_KM, MAX_RADIUS_KM)
+
+    @classmethod
+    def of(cls, area):
+        return area if isinstance(area, cls) else cls(area)
+
+    @property
+    def has_coords(self):
+        return self.lat is not None and self.lon is not None
+
+    def same_city(self, city, code=None):
+        """
+        Mesmo município pelo código IBGE, como o cityClause; sem código (fora
+        do registro ou lista não carregada) compara o nome normalizado.
+        """
+        if code is None:
+            code = city_registry.code(city)
+        if code is not None and self.city_code is not None:
+            return code == self.city_code
+        return cityKey(city) == self.city_key
+
+    def contains(self, city, lat, lon, city_code=None):
+        if self.same_city(city, city_code):
+            return True
+        if not self.has_coords or lat is None or lon is None:
+            return False
+        return haversine(self.lat, self.lon, lat, lon) <= self.radius_km
+
+    def clause(self, model):
+        """
+        Condição SQL aproximada (cidade ou caixa envolvente), usada no UPDATE
+        de aceite para garantir que a ONG só assuma casos da sua área.
+        """
+        _, lat_col, lon_col, _, _ = _CASE_COLUMNS[model]
+        if not self.has_coords:
+            return cityClause(model, self.city)
+        min_lat, max_lat, min_lon, max_lon = boundingBox(self.lat, self.lon, self.radius_km)
+        return or_(
+            cityClause(model, self.city),
+            and_(lat_col.between(min_lat, max_lat), lon_col.between(min_lon, max_lon))
+        )
+
+    def cases_clauses(self, model):
+        """
+        Condições indexadas para listar casos: a cidade e uma faixa de geohash
+        por célula. Cada uma vira uma subconsulta separada, pois um OR entre
+        elas impede o SQLite de usar os índices.
+        """
+        geohash_col = _CASE_COLUMNS[model][3]
+        clauses = [cityClause(model, self.city)]
+        if self.has_coords:
+            clauses += [and_(geohash_col >= cell, geohash_col < cell + '{')
+                        for cell in coverCells(self.lat, self.lon, self.radius_km)]
+        return clauses
+
+
+def pendingCasesNear(model, area, cursor=None, limit=PAGE_SIZE):
+    """
+    Uma página de casos pendentes dentro da área da ONG. O banco filtra por
+    geohash e o resultado é refinado pela distância real, buscando mais
+    lotes até a página encher. Retorna (casos, próximo cursor).
+    """
+    city_col, lat_col, lon_col, _, status_col = _CASE_COLUMNS[model]
+    area = ServiceArea.of(area)
+    queries = [model.query.filter(status_col == 'pendente', clause)
+               for clause in area.cases_clauses(model)]
+    if not area.has_coords:
+        return keysetUnionPage(queries, model, cursor, limit)
+    return keysetFilteredPage(
+        queries, model,
+        lambda row: area.contains(getattr(row, city_col.key), getattr(row, lat_col.key), getattr(row, lon_col.key)),
+        cursor, limit)
+
+
+class OngSpatialIndex:
+    """
+    Índice em memória das sedes das ONGs em uma grade de células de
+    GRID_CELL_DEG graus. Mantido em sincronia com tbOngs pelos eventos do
+    SQLAlchemy e recarregado periodicamente para pegar mudanças de outros
+    processos.
+    """
+
+    def __init__(self, reload_interval=300):
+        self.reload_interval = reload_interval
+        self._ongs = {}
+        self._grid = {}
+        self._lock = threading.Lock()
+        self._next_reload = 0
+
+    def init_app(self, app):
+        self.reload_interval = app.config.get('ONG_INDEX_RELOAD', self.reload_interval)
+        app.before_request(self.maybe_reload)
+
+    @staticmethod
+    def _cell(lat, lon):
+        return math.floor(lat / GRID_CELL_DEG), math.floor(lon / GRID_CELL_DEG)
+
+    def _remove(self, ong_id):
+        entry = self._ongs.pop(ong_id, None)
+        if entry is not None:
+            bucket = self._grid.get(self._cell(entry[0], entry[1]))
+            if bucket is not None:
+                bucket.discard(ong_id)
+                if not bucket:
+                    del self._grid[self._cell(entry[0], entry[1])]
+
+    def _add(self, ong_id, lat, lon, radius_km):
+        self._remove(ong_id)
+        if lat is None or lon is None:
+            return
+        self._ongs[ong_id] = (lat, lon, radius_km or DEFAULT_RADIUS_KM)
+        self._grid.setdefault(self._cell(lat, lon), set()).add(ong_id)
+
+    def update(self, ong_id, lat, lon, radius_km=None):
+        with self._lock:
+            self._add(ong_id, lat, lon, radius_km)
+
+    def remove(self, ong_id):
+        with self._lock:
+            self._remove(ong_id)
+
+    def reload(self):
+        rows = db.session.execute(
+            select(Ong.ong_id, Ong.ong_lat, Ong.ong_lon, Ong.ong_radius_km)
+            .where(Ong.ong_lat.isnot(None), Ong.ong_lon.isnot(None))
+        ).all()
+        with self._lock:
+            self._ongs, self._grid = {}, {}
+            for row in rows:
+                self._add(*row)
+        self._next_reload = time.monotonic() + self.reload_interval
+        logging.info(f"Índice espacial de ONGs carregado: {len(rows)} ONGs")
+
+    def maybe_reload(self):
+        if time.monotonic() >= self._next_reload:
+            try:
+                self.reload()
+            except Exception as e:
+                self._next_reload = time.monotonic() + 30
+                logging.error(f"Erro ao carregar índice espacial de ONGs: {e}")
+
+    def get(self, ong_id):
+        return self._ongs.get(ong_id)
+
+    def __len__(self):
+        return len(self._ongs)
+
+    def nearby(self, lat, lon, radius_km, within_service_radius=False):
+        """
+        ONGs a até radius_km do ponto, ordenadas pela distância.
+        Com within_service_radius, só as que atendem o ponto pelo próprio raio.
+        """
+        min_lat, max_lat, min_lon, max_lon = boundingBox(lat, lon, radius_km)
+        lat0, lon0 = self._cell(min_lat, min_lon)
+        lat1, lon1 = self._cell(max_lat, max_lon)
+        found = []
+        with self._lock:
+            for i in range(lat0, lat1 + 1):
+                for j in range(lon0, lon1 + 1):
+                    for ong_id in self._grid.get((i, j), ()):
+                        ong_lat, ong_lon, ong_radius = self._ongs[ong_id]
+                        dist = haversine(lat, lon, ong_lat, ong_lon)
+                        if dist <= radius_km and (not within_service_radius or dist <= ong_radius):
+                            found.append((dist, ong_id))
+        found.sort()
+        return found
+
+    def area(self, ong_id, city):
+        entry = self.get(ong_id)
+        if entry is None:
+            return ServiceArea(city)
+        return ServiceArea(city, *entry)
+
+
+ong_index = OngSpatialIndex()
+
+
+# Mudanças da sessão: guardadas no flush e aplicadas só depois do commit,
+# para um rollback não deixar coordenadas que não existem no banco
+@event.listens_for(Session, 'after_flush')
+def _markOngWrite(session, flush_context):
+    for target in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(target, Ong):
+            entry = None if target in session.deleted else (target.ong_lat, target.ong_lon, target.ong_radius_km)
+            session.info.setdefault('ong_index_changes', {})[target.ong_id] = entry
+
+@event.listens_for(Session, 'after_commit')
+def _syncOngIndex(session):
+    for ong_id, entry in session.info.pop('ong_index_changes', {}).items():
+        if entry is None:
+            ong_index.remove(ong_id)
+        else:
+            ong_index.update(ong_id, *entry)
+
+@event.listens_for(Session, 'after_rollback')
+def _discardOngWrite(session):
+    session.info.pop('ong_index_changes', None)
@@ -0,0 +1,28 @@
+"""
+Configuração do gunicorn para produção, de dentro de src/app:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Workers gevent: cada conexão é um greenlet, então os painéis conectados em
+/ong_stream (que passam quase todo o tempo parados em Subscriber.wait) não
+prendem uma thread cada, e um worker segura milhares de conexões ociosas.
+O limite fica em GUNICORN_CONNECTIONS e no ulimit -n do processo, que
+precisa ser maior. O gunicorn aplica o monkey-patch do gevent antes de
+importar a aplicação; o Argon2 continua em threads nativas (auth.py).
+
+O pub/sub dos casos (live.py) é em memória, por processo: um evento só
+chega às ONGs conectadas ao mesmo worker (e ao mesmo nó) em que o caso foi
+criado ou aceito. Por isso o padrão é um worker por nó; com mais de um, os
+painéis deixam de receber ao vivo os casos de outros workers e só os veem
+ao recarregar (o aceite continua atômico no banco).
+"""
+import os
+
+worker_class = 'gevent'
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+worker_connections = int(os.environ.get('GUNICORN_CONNECTIONS', 4000))
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+# O heartbeat das conexões SSE (SSE_HEARTBEAT, 15 s) fica abaixo do keepalive
+# dos proxies; o timeout do gunicorn só vigia o worker, não as requisições
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 10))
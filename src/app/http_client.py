@@ -0,0 +1,229 @@
+import time
+import random
+import logging
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+
+RETRY_STATUS = {429, 502, 503, 504}
+
+
+class CircuitOpen(requests.RequestException):
+    """
+    O host falhou seguidamente e está em pausa; nenhuma chamada foi feita.
+    """
+
+class UpstreamBusy(requests.RequestException):
+    """
+    Limite de chamadas simultâneas ao host atingido.
+    """
+
+
+class HostPolicy:
+    """
+    Limites de um host externo: timeouts (conexão, leitura), tentativas,
+    chamadas simultâneas e quando abrir o circuito.
+    """
+
+    def __init__(self, connect_timeout=3, read_timeout=5, retries=2, backoff=0.2,
+                 max_concurrency=16, failure_threshold=5, reset_timeout=30):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_concurrency = max_concurrency
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+
+class HostState:
+    """
+    Semáforo, disjuntor e contadores de um host.
+    """
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.slots = threading.BoundedSemaphore(policy.max_concurrency)
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.counters = {
+            'requests': 0, 'errors': 0, 'retries': 0,
+            'short_circuited': 0, 'busy': 0, 'latency_sum': 0.0,
+        }
+
+    def allow(self):
+        """
+        Fechado: passa. Aberto: recusa até reset_timeout; depois deixa passar
+        uma única chamada de teste (meio aberto).
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.policy.reset_timeout or self.probing:
+                self.counters['short_circuited'] += 1
+                return False
+            self.probing = True
+            return True
+
+    def record(self, ok, elapsed):
+        with self.lock:
+            self.counters['requests'] += 1
+            self.counters['latency_sum'] += elapsed
+            self.probing = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.counters['errors'] += 1
+            self.failures += 1
+            if self.failures >= self.policy.failure_threshold or self.opened_at is not None:
+                if self.opened_at is None:
+                    logging.error(f"Circuito aberto após {self.failures} falhas seguidas")
+                self.opened_at = time.monotonic()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.policy.reset_timeout:
+            return 'open'
+        return 'half_open'
+
+
+class HttpClient:
+    """
+    Cliente HTTP compartilhado pelas integrações externas (IBGE, ViaCEP).
+    Uma Session com pool de conexões keep-alive e, por host, timeouts,
+    limite de concorrência, novas tentativas com jitter e disjuntor.
+    """
+
+    def __init__(self, pool_size=20):
+        self.pool_size = pool_size
+        self.policies = {}
+        self.default_policy = HostPolicy()
+        self._hosts = {}
+        self._lock = threading.Lock()
+        # Chamados com (host, segundos) a cada tentativa, ex.: pelo profiler
+        self.observers = []
+        self.session = self._build_session()
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['User-Agent'] = 'AnimalAider/1.0'
+        return session
+
+    def init_app(self, app):
+        pool_size = app.config.get('HTTP_POOL_SIZE', self.pool_size)
+        if pool_size != self.pool_size:
+            self.pool_size = pool_size
+            self.session = self._build_session()
+        for host, options in app.config.get('HTTP_HOSTS', {}).items():
+            self.configure_host(host, **options)
+
+    def configure_host(self, host, **options):
+        with self._lock:
+            self.policies[host] = HostPolicy(**options)
+            self._hosts.pop(host, None)
+
+    def default_host(self, url, **options):
+        """
+        Política do host de uma integração, a menos que HTTP_HOSTS já
+        tenha configurado esse host.
+        """
+        host = urlsplit(url).hostname
+        if host not in self.policies:
+            self.configure_host(host, **options)
+
+    def _host(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = HostState(self.policies.get(host, self.default_policy))
+            return state
+
+    @staticmethod
+    def _sleep(policy, attempt):
+        # Backoff exponencial com jitter completo
+        time.sleep(random.uniform(0, policy.backoff * (2 ** attempt)))
+
+    def _observe(self, host, elapsed):
+        for observer in self.observers:
+            try:
+                observer(host, elapsed)
+            except Exception as e:
+                logging.error(f"Erro no observador do cliente HTTP: {e}")
+
+    def get(self, url, **kwargs):
+        """
+        GET com as regras do host. Levanta CircuitOpen, UpstreamBusy ou a
+        exceção do requests da última tentativa. Respostas 5xx voltam para
+        quem chamou depois de esgotar as tentativas.
+        """
+        host = urlsplit(url).hostname
+        state = self._host(host)
+        policy = state.policy
+        kwargs.setdefault('timeout', (policy.connect_timeout, policy.read_timeout))
+
+        if not state.allow():
+            raise CircuitOpen(f'{host} indisponível')
+        if not state.slots.acquire(timeout=policy.connect_timeout):
+            with state.lock:
+                state.counters['busy'] += 1
+                state.probing = False
+            raise UpstreamBusy(f'{host} com muitas chamadas simultâneas')
+
+        try:
+            attempt = 0
+            while True:
+                start = time.perf_counter()
+                try:
+                    response = self.session.get(url, **kwargs)
+                except requests.RequestException as e:
+                    elapsed = time.perf_counter() - start
+                    self._observe(host, elapsed)
+                    state.record(False, elapsed)
+                    retryable = isinstance(e, (requests.ConnectionError, requests.Timeout))
+                    if not retryable or attempt >= policy.retries or not state.allow():
+                        raise
+                    reason = e
+                else:
+                    failed = response.status_code in RETRY_STATUS or response.status_code >= 500
+                    elapsed = time.perf_counter() - start
+                    self._observe(host, elapsed)
+                    state.record(not failed, elapsed)
+                    if not failed or attempt >= policy.retries or not state.allow():
+                        return response
+                    reason = response.status_code
+                with state.lock:
+                    state.counters['retries'] += 1
+                attempt += 1
+                logging.warning(f"Nova tentativa {attempt} para {host}: {reason}")
+                self._sleep(policy, attempt - 1)
+        finally:
+            state.slots.release()
+
+    def stats(self):
+        """
+        Contadores por host, com latência média em segundos e estado do circuito.
+        """
+        with self._lock:
+            hosts = dict(self._hosts)
+        result = {}
+        for host, state in hosts.items():
+            with state.lock:
+                counters = dict(state.counters)
+            done = counters['requests']
+            counters['latency_avg'] = counters['latency_sum'] / done if done else 0.0
+            counters['circuit'] = state.state
+            result[host] = counters
+        return result
+
+
+http_client = HttpClient()
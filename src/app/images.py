@@ -0,0 +1,303 @@
+import os
+import zlib
+import struct
+import logging
+import tempfile
+import click
+from concurrent.futures import ProcessPoolExecutor
+from flask import url_for
+from PIL import Image, ImageOps, features
+from blobstore import blob_store, isBlobKey, CHUNK_SIZE
+
+
+# Nome da variante: (largura, altura) máximas
+VARIANTS = {
+    'thumb': (160, 160),
+    'card': (480, 360),
+    'full': (1600, 1600),
+}
+
+# Imagens padrão compartilhadas entre vários cadastros, nunca apagadas
+DEFAULT_PHOTOS = {'default_profile.jpg', 'default_logo.png'}
+
+MAX_PIXELS = 50_000_000
+Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+
+# Uploads limpos ficam em memória até esse tamanho, depois vão para disco
+SPOOL_BYTES = 8 * 2 ** 20
+
+ORIENTATION = 0x0112
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Segmentos APPn do JPEG mantidos: JFIF, perfil ICC e Adobe (cores CMYK).
+# Os outros (EXIF, XMP, IPTC...) e os comentários saem.
+_JPEG_KEEP = {0xE0, 0xE2, 0xEE}
+# Chunks do PNG com texto livre, data ou EXIF
+_PNG_DROP = {b'eXIf', b'tEXt', b'zTXt', b'iTXt', b'tIME'}
+
+
+def variantName(filename, variant, fmt):
+    stem = os.path.splitext(filename)[0]
+    return f'{stem}.{variant}.{fmt}'
+
+def _read(src, size):
+    data = src.read(size)
+    if len(data) != size:
+        raise ValueError('Imagem truncada')
+    return data
+
+def _orientationExif(data):
+    """
+    EXIF novo só com a orientação do original (None se não houver), para a
+    foto não aparecer deitada.
+    """
+    exif = Image.Exif()
+    try:
+        exif.load(data)
+    except Exception:
+        return None
+    orientation = exif.get(ORIENTATION)
+    if orientation in (None, 1):
+        return None
+    clean = Image.Exif()
+    clean[ORIENTATION] = orientation
+    return clean.tobytes()
+
+def _stripJpeg(src, dst):
+    dst.write(b'\xff\xd8')
+    while True:
+        marker = _read(src, 2)
+        while marker[1] == 0xFF:
+            marker = marker[1:] + _read(src, 1)
+        if marker[0] != 0xFF:
+            raise ValueError('JPEG inválido')
+        code = marker[1]
+        if code == 0xD9:
+            dst.write(marker)
+            return
+        if code == 0x01 or 0xD0 <= code <= 0xD7:
+            dst.write(marker)
+            continue
+        length = _read(src, 2)
+        payload = _read(src, struct.unpack('>H', length)[0] - 2)
+        if code == 0xDA:
+            # Início dos dados da imagem: o resto vai como está
+            dst.write(marker + length + payload)
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                dst.write(chunk)
+            return
+        if code == 0xE1 and payload.startswith(b'Exif\x00\x00'):
+            exif = _orientationExif(payload)
+            if exif is not None:
+                dst.write(b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif)
+        elif code == 0xFE or (0xE0 <= code <= 0xEF and code not in _JPEG_KEEP):
+            continue
+        else:
+            dst.write(marker + length + payload)
+
+def _pngChunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+def _stripPng(src, dst):
+    dst.write(PNG_SIGNATURE)
+    while True:
+        size, kind = struct.unpack('>I4s', _read(src, 8))
+        data = _read(src, size)
+        crc = _read(src, 4)
+        if kind == b'eXIf':
+            exif = _orientationExif(data)
+            if exif is not None:
+                dst.write(_pngChunk(kind, exif[6:]))
+        elif kind not in _PNG_DROP:
+            dst.write(struct.pack('>I', size) + kind + data + crc)
+        if kind == b'IEND':
+            return
+
+def stripMetadata(src, dst):
+    """
+    Copia a foto de src para dst sem os metadados (EXIF com GPS e modelo
+    da câmera, XMP, IPTC, comentários), sem recodificar a imagem. Do EXIF
+    só fica a orientação, que processImage aplica nas variantes.
+    """
+    head = _read(src, 8)
+    if head[:2] == b'\xff\xd8':
+        _stripJpeg(_Prefixed(head[2:], src), dst)
+    elif head == PNG_SIGNATURE:
+        _stripPng(src, dst)
+    else:
+        raise ValueError('Formato de imagem não suportado')
+
+
+class _Prefixed:
+    """
+    Stream com alguns bytes já lidos devolvidos na frente.
+    """
+
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size):
+        if not self.prefix:
+            return self.stream.read(size)
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        if len(data) < size:
+            data += self.stream.read(size - len(data))
+        return data
+
+
+def processImage(src_path, fmt, quality):
+    """
+    Gera as variantes de uma foto já salva. Roda em outro processo, então só
+    recebe e retorna valores simples. A orientação do EXIF é aplicada antes de
+    descartar os metadados.
+    """
+    directory, filename = os.path.split(src_path)
+    created = []
+    with Image.open(src_path) as img:
+        img = ImageOps.exif_transpose(img)
+        has_alpha = 'A' in img.getbands() or 'transparency' in img.info
+        mode = 'RGBA' if fmt == 'webp' and has_alpha else 'RGB'
+        if img.mode != mode:
+            img = img.convert(mode)
+
+        for variant, size in VARIANTS.items():
+            out = img.copy()
+            out.thumbnail(size, Image.LANCZOS)
+            out_name = variantName(filename, variant, 'jpg' if fmt == 'jpeg' else fmt)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                out.save(f, fmt.upper(), quality=quality, optimize=True)
+            os.replace(tmp_path, os.path.join(directory, out_name))
+            created.append(out_name)
+    return created
+
+
+class ImagePipeline:
+    """
+    Salva o arquivo original enviado e gera as variantes (thumb, card, full)
+    em um pool de processos, fora da requisição. Enquanto as variantes não
+    existem, os templates usam o original.
+    """
+
+    def __init__(self, workers=2, quality=80):
+        self.workers = workers
+        self.quality = quality
+        self.upload_folder = None
+        self.fmt = 'webp' if features.check('webp') else 'jpeg'
+        self._pool = None
+        self._ready = set()
+
+    def init_app(self, app):
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        self.workers = app.config.get('IMAGE_WORKERS', self.workers)
+        self.quality = app.config.get('IMAGE_QUALITY', self.quality)
+        app.jinja_env.globals['photo_url'] = self.url
+
+        @app.cli.command('scrub-uploads')
+        def scrub_uploads():
+            """Tira os metadados dos originais gravados antes da limpeza no upload."""
+            click.echo(f'{self.scrub()} arquivos limpos')
+
+    def scrub(self):
+        """
+        Regrava sem metadados os originais já salvos (chave de blob, sem ser
+        variante). A chave continua a mesma, só não bate mais com o sha256.
+        """
+        from uploads_gc import walkUploads, VARIANT_RE
+        cleaned = 0
+        for name, _ in walkUploads(self.upload_folder):
+            if not isBlobKey(name) or VARIANT_RE.match(name) or name.endswith(('.tmp', '.deleted')):
+                continue
+            path = os.path.join(self.upload_folder, name)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with open(path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                    stripMetadata(src, dst)
+                if os.path.getsize(tmp_path) == os.path.getsize(path):
+                    os.remove(tmp_path)
+                    continue
+                os.replace(tmp_path, path)
+                cleaned += 1
+            except (OSError, ValueError) as e:
+                os.remove(tmp_path)
+                logging.error(f"Erro ao limpar metadados de {name}: {e}")
+        return cleaned
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    @property
+    def ext(self):
+        return 'jpg' if self.fmt == 'jpeg' else self.fmt
+
+    def save(self, photo, ext):
+        """
+        Grava o upload sem metadados no blob_store (com fsync) antes de
+        responder e agenda as variantes. Retorna o nome a guardar no banco.
+        O original fica público em static/uploads, por isso nunca é gravado
+        com o EXIF (que traz o GPS de quem tirou a foto).
+        """
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as clean:
+            stripMetadata(photo.stream, clean)
+            clean.seek(0)
+            key, created = blob_store.put(clean, ext)
+        if created or not os.path.exists(os.path.join(self.upload_folder, self.variants(key)[0])):
+            self.submit(key)
+        return key
+
+    def submit(self, filename):
+        path = os.path.join(self.upload_folder, filename)
+        try:
+            future = self.pool.submit(processImage, os.path.abspath(path), self.fmt, self.quality)
+        except Exception as e:
+            logging.error(f"Erro ao agendar processamento de {filename}: {e}")
+            self._pool = None
+            return None
+        future.add_done_callback(lambda f: self._done(filename, f))
+        return future
+
+    def _done(self, filename, future):
+        error = future.exception()
+        # O original pode ter sido apagado antes do processamento (ex.: falha ao salvar o caso)
+        if error and not isinstance(error, FileNotFoundError):
+            logging.error(f"Erro ao processar imagem {filename}: {error}")
+
+    def variants(self, filename):
+        return [variantName(filename, variant, self.ext) for variant in VARIANTS]
+
+    def remove(self, filename):
+        """
+        Solta a referência à foto e apaga as variantes se o blob foi apagado.
+        Nomes antigos, de antes do blob_store, são apagados direto.
+        """
+        if filename in DEFAULT_PHOTOS:
+            return
+        if isBlobKey(filename):
+            if not blob_store.release(filename):
+                return
+            names = self.variants(filename)
+        else:
+            names = [filename] + self.variants(filename)
+        for name in names:
+            try:
+                os.remove(os.path.join(self.upload_folder, name))
+            except OSError:
+                pass
+        self._ready.difference_update(self.variants(filename))
+
+    def url(self, filename, variant='full'):
+        """
+        URL da variante pedida, ou do original se ela ainda não foi gerada.
+        """
+        if not filename:
+            return ''
+        name = variantName(filename, variant, self.ext)
+        if name not in self._ready and os.path.exists(os.path.join(self.upload_folder, name)):
+            self._ready.add(name)
+        return url_for('static', filename='uploads/' + (name if name in self._ready else filename))
+
+
+image_pipeline = ImagePipeline()
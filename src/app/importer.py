@@ -0,0 +1,267 @@
+import io
+import csv
+import json
+import logging
+from datetime import datetime
+import click
+from sqlalchemy import select, insert
+from sqlalchemy.exc import SQLAlchemyError
+from db import db, Ong, Report, Rescue
+from geo import parseCoords, geohashEncode, ong_index
+from directory import ong_directory
+from cities import city_registry
+from citycodes import CITY_COLUMNS
+from auth import auth_service
+
+
+CASE_STATUSES = ('pendente', 'andamento', 'finalizado', 'rejeitado')
+MAX_ERRORS = 100
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+def _text(size=None):
+    def parse(value):
+        value = str(value).strip()
+        return value[:size] if size else value
+    return parse
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise InvalidRow(f'número inválido: {value!r}')
+
+def _date(value):
+    try:
+        return datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise InvalidRow(f'data inválida: {value!r}')
+
+def _status(value):
+    if value not in CASE_STATUSES:
+        raise InvalidRow(f'status inválido: {value!r}')
+    return value
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise InvalidRow(f'coordenada inválida: {value!r}')
+
+
+# Por tipo: modelo, colunas de lat/lon/geohash e {coluna: (conversor, obrigatória)}.
+# Os nomes são os mesmos da exportação (export.py).
+IMPORT_KINDS = {
+    'ongs': (Ong, 'ong_lat', 'ong_lon', None, {
+        'ong_name': (_text(), True),
+        'ong_email': (_text(), True),
+        'ong_pass': (str, True),
+        'ong_phone': (_text(), False),
+        'ong_cpf': (_text(), False),
+        'ong_cep': (_text(), False),
+        'ong_city': (_text(), False),
+        'ong_hood': (_text(), False),
+        'ong_address': (_text(), False),
+        'ong_num': (_text(), False),
+        'ong_desc': (_text(), False),
+        'ong_lat': (_float, False),
+        'ong_lon': (_float, False),
+        'ong_radius_km': (_int, False),
+    }),
+    'reports': (Report, 'rep_lat', 'rep_lon', 'rep_geohash', {
+        'rep_title': (_text(255), True),
+        'rep_desc': (_text(1000), True),
+        'rep_city': (_text(100), True),
+        'rep_date': (_date, True),
+        'rep_phone': (_text(20), True),
+        'rep_address': (_text(255), False),
+        'rep_email': (_text(100), False),
+        'rep_status': (_status, False),
+        'rep_created_at': (_date, False),
+        'rep_lat': (_float, False),
+        'rep_lon': (_float, False),
+    }),
+    'rescues': (Rescue, 'resc_lat', 'resc_lon', 'resc_geohash', {
+        'resc_desc': (_text(), True),
+        'resc_author': (_text(100), True),
+        'resc_phone': (_text(20), True),
+        'resc_city': (_text(100), True),
+        'resc_date': (_date, False),
+        'resc_cep': (_text(10), False),
+        'resc_addr': (_text(255), False),
+        'resc_num': (_text(20), False),
+        'resc_status': (_status, False),
+        'resc_created_at': (_date, False),
+        'resc_lat': (_float, False),
+        'resc_lon': (_float, False),
+    }),
+}
+
+
+def readRecords(stream, fmt):
+    """
+    Lê CSV (com cabeçalho) ou NDJSON linha a linha. Gera (linha, dict).
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            yield number, None
+            continue
+        yield number, record if isinstance(record, dict) else None
+
+def validateRecord(kind, record):
+    """
+    Converte um registro lido para os valores das colunas. Campos vazios
+    viram None e colunas desconhecidas (ex.: ids) são ignoradas.
+    Levanta InvalidRow.
+    """
+    if record is None:
+        raise InvalidRow('registro mal formado')
+    model, lat_col, lon_col, geohash_col, fields = IMPORT_KINDS[kind]
+    row = {}
+    for column, (parse, required) in fields.items():
+        value = record.get(column)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            if required:
+                raise InvalidRow(f'{column} obrigatório')
+            continue
+        row[column] = parse(value)
+
+    if lat_col in row or lon_col in row:
+        lat, lon = parseCoords(row.get(lat_col), row.get(lon_col))
+        if lat is None:
+            raise InvalidRow('coordenadas inválidas')
+        row[lat_col], row[lon_col] = lat, lon
+        if geohash_col:
+            row[geohash_col] = geohashEncode(lat, lon)
+
+    name_col, id_col, _ = CITY_COLUMNS[model]
+    if name_col.key in row:
+        row[id_col.key] = city_registry.code(row[name_col.key])
+    return row
+
+
+class Importer:
+    """
+    Importação em lote de ONGs, denúncias e resgates a partir de CSV ou
+    NDJSON. Valida numa única passada pelo arquivo, descarta emails de ONG já
+    cadastrados (conjunto em memória) e grava lotes inteiros com um único
+    INSERT executemany por transação. As senhas do lote são processadas em
+    paralelo no pool do Argon2; valores que já são hashes argon2 são mantidos.
+    """
+
+    def __init__(self, batch_size=5000):
+        self.batch_size = batch_size
+
+    def init_app(self, app):
+        self.batch_size = app.config.get('IMPORT_BATCH', self.batch_size)
+
+        @app.cli.command('import-data')
+        @click.argument('kind', type=click.Choice(list(IMPORT_KINDS)))
+        @click.argument('source', type=click.File('r', encoding='utf-8-sig'))
+        @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None,
+                      help='Padrão: pela extensão do arquivo.')
+        @click.option('--dry-run', is_flag=True, help='Só valida, sem gravar.')
+        def import_data(kind, source, fmt, dry_run):
+            """Importa ONGs, denúncias ou resgates de um arquivo CSV ou NDJSON."""
+            fmt = fmt or ('ndjson' if source.name.endswith(('.ndjson', '.jsonl')) else 'csv')
+            stats = self.run(kind, source, fmt, dry_run=dry_run)
+            for error in stats['errors']:
+                click.echo(error, err=True)
+            click.echo(
+                f"{stats['read']} lidos, {stats['inserted']} {'válidos' if dry_run else 'gravados'}, "
+                f"{stats['duplicates']} duplicados, {stats['invalid']} inválidos"
+            )
+
+    def _existingEmails(self, conn):
+        result = conn.execute(select(Ong.ong_email).execution_options(yield_per=self.batch_size))
+        return {email.lower() for (email,) in result}
+
+    def _flush(self, conn, kind, model, batch):
+        if kind == 'ongs':
+            pending = [i for i, row in enumerate(batch) if not row['ong_pass'].startswith('$argon2')]
+            hashes = auth_service.hash_many([batch[i]['ong_pass'] for i in pending])
+            for i, hashed in zip(pending, hashes):
+                batch[i]['ong_pass'] = hashed
+        # Um executemany por conjunto de colunas; as ausentes ficam com o default do modelo
+        groups = {}
+        for row in batch:
+            groups.setdefault(frozenset(row), []).append(row)
+        for rows in groups.values():
+            conn.execute(insert(model), rows)
+        conn.commit()
+
+    def run(self, kind, stream, fmt, dry_run=False):
+        """
+        Retorna {'read', 'inserted', 'duplicates', 'invalid', 'errors', 'complete'}.
+        Lotes já gravados ficam gravados se um lote posterior falhar
+        (complete=False).
+        """
+        model = IMPORT_KINDS[kind][0]
+        stats = {'read': 0, 'inserted': 0, 'duplicates': 0, 'invalid': 0, 'errors': [], 'complete': True}
+
+        def error(line, message):
+            if len(stats['errors']) < MAX_ERRORS:
+                stats['errors'].append(f'linha {line}: {message}')
+
+        with db.engine.connect() as conn:
+            seen = self._existingEmails(conn) if kind == 'ongs' else None
+            batch = []
+            try:
+                for line, record in readRecords(stream, fmt):
+                    stats['read'] += 1
+                    try:
+                        row = validateRecord(kind, record)
+                    except InvalidRow as e:
+                        stats['invalid'] += 1
+                        error(line, e)
+                        continue
+
+                    if seen is not None:
+                        email = row['ong_email'].lower()
+                        if email in seen:
+                            stats['duplicates'] += 1
+                            continue
+                        seen.add(email)
+
+                    batch.append(row)
+                    if len(batch) >= self.batch_size:
+                        if not dry_run:
+                            self._flush(conn, kind, model, batch)
+                        stats['inserted'] += len(batch)
+                        batch = []
+                if batch:
+                    if not dry_run:
+                        self._flush(conn, kind, model, batch)
+                    stats['inserted'] += len(batch)
+            except (SQLAlchemyError, UnicodeDecodeError, csv.Error) as e:
+                conn.rollback()
+                logging.error(f"Erro na importação de {kind}: {e}")
+                stats['errors'].append(f"importação interrompida: {e}")
+                stats['complete'] = False
+
+        if kind == 'ongs' and stats['inserted'] and not dry_run:
+            ong_index.reload()
+            ong_directory.invalidate()
+        logging.info(f"Importação de {kind}: {stats['inserted']} de {stats['read']} registros")
+        return stats
+
+    def run_upload(self, kind, file, fmt, dry_run=False):
+        """
+        Mesmo que run, para um arquivo enviado por formulário (bytes).
+        """
+        return self.run(kind, io.TextIOWrapper(file, encoding='utf-8-sig'), fmt, dry_run=dry_run)
+
+
+importer = Importer()
@@ -0,0 +1,169 @@
+import os
+import json
+import logging
+import threading
+import itertools
+from collections import deque
+from flask import render_template, has_request_context
+from db import Report, Rescue
+from cities import city_registry
+
+
+# Por tipo de caso: nome, colunas (id, cidade, lat, lon), partial do painel e variável do partial
+_CASE_FIELDS = {
+    Report: ('report', 'rep_id', 'rep_city', 'rep_lat', 'rep_lon', 'partials/ong_report_cards.html', 'reports'),
+    Rescue: ('rescue', 'resc_id', 'resc_city', 'resc_lat', 'resc_lon', 'partials/ong_rescue_cards.html', 'rescues'),
+}
+
+
+class Subscriber:
+    """
+    Fila de eventos de uma conexão. Quem publica só enfileira e acorda o
+    leitor; nenhuma thread extra é criada por cliente. Nos workers gevent
+    (gunicorn.conf.py) o Event é do gevent e wait() só suspende o greenlet
+    da conexão.
+    """
+
+    def __init__(self, area, queue_size):
+        self.area = area
+        self.queue = deque(maxlen=queue_size)
+        self.overflowed = False
+        self._wakeup = threading.Event()
+
+    def push(self, event):
+        if len(self.queue) == self.queue.maxlen:
+            self.overflowed = True
+        self.queue.append(event)
+        self._wakeup.set()
+
+    def wait(self, timeout):
+        woke = self._wakeup.wait(timeout)
+        self._wakeup.clear()
+        return woke
+
+    def drain(self):
+        while self.queue:
+            yield self.queue.popleft()
+
+
+class CaseBroker:
+    """
+    Pub/sub em memória dos casos novos, aceitos e rejeitados. Cada evento vai
+    para as ONGs conectadas a este processo cuja área contém o caso. Guarda os
+    últimos eventos para reenviar a quem reconectar com Last-Event-ID.
+
+    A entrega é por processo: ONGs ligadas a outro worker ou outro nó não
+    recebem o evento (veja gunicorn.conf.py, que usa um worker por nó).
+    """
+
+    def __init__(self, queue_size=100, history=200, heartbeat=15):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        # Ids de outro processo (outro worker) não são reaproveitados
+        self._token = f'{os.getpid():x}'
+
+    def init_app(self, app):
+        self.heartbeat = app.config.get('SSE_HEARTBEAT', self.heartbeat)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, area):
+        subscriber = Subscriber(area, self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event):
+        # Código IBGE resolvido uma vez, não por assinante
+        event['city_code'] = city_registry.code(event['city'])
+        with self._lock:
+            event['id'] = f'{self._token}-{next(self._ids)}'
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if subscriber.area.contains(event['city'], event['lat'], event['lon'], event['city_code']):
+                subscriber.push(event)
+
+    def _since(self, last_id, area):
+        token, _, number = (last_id or '').partition('-')
+        if token != self._token or not number.isdigit():
+            return []
+        with self._lock:
+            history = list(self._history)
+        return [
+            event for event in history
+            if int(event['id'].partition('-')[2]) > int(number)
+            and area.contains(event['city'], event['lat'], event['lon'], event['city_code'])
+        ]
+
+    @staticmethod
+    def _format(event):
+        payload = {k: v for k, v in event.items() if k not in ('id', 'lat', 'lon', 'city_code')}
+        return f"id: {event['id']}\nevent: case\ndata: {json.dumps(payload)}\n\n"
+
+    def stream(self, area, last_id=None):
+        """
+        Gerador do corpo text/event-stream de uma conexão.
+        """
+        subscriber = self.subscribe(area)
+        try:
+            yield 'retry: 5000\n\n'
+            for event in self._since(last_id, area):
+                yield self._format(event)
+            while True:
+                if not subscriber.wait(self.heartbeat):
+                    yield ': ping\n\n'
+                    continue
+                if subscriber.overflowed:
+                    # Cliente lento perdeu eventos: melhor recarregar a página
+                    yield 'event: reload\ndata: {}\n\n'
+                    return
+                for event in subscriber.drain():
+                    yield self._format(event)
+        finally:
+            self.unsubscribe(subscriber)
+
+
+case_broker = CaseBroker()
+
+
+def publishCase(case, action):
+    """
+    Avisa os painéis sobre um caso criado ('created'), aceito ('claimed') ou
+    rejeitado ('rejected'). Casos novos levam o card já renderizado.
+    """
+    kind, pk, city, lat, lon, partial, name = _CASE_FIELDS[type(case)]
+    event = {
+        'kind': kind,
+        'action': action,
+        'case_id': getattr(case, pk),
+        'city': getattr(case, city),
+        'lat': getattr(case, lat),
+        'lon': getattr(case, lon),
+    }
+    try:
+        if action == 'created' and has_request_context():
+            event['html'] = render_template(partial, **{name: [case]})
+        case_broker.publish(event)
+    except Exception as e:
+        logging.error(f"Erro ao publicar evento de {kind}: {e}")
+
+def publishClaims(model, rows, action):
+    """
+    Versão para o motor de aceite, que só tem (id, cidade, lat, lon).
+    """
+    kind = _CASE_FIELDS[model][0]
+    for case_id, city, lat, lon in rows:
+        case_broker.publish({
+            'kind': kind, 'action': action, 'case_id': case_id,
+            'city': city, 'lat': lat, 'lon': lon,
+        })
@@ -0,0 +1,387 @@
+import os
+import json
+import time
+import atexit
+import logging
+import tempfile
+import threading
+from sqlalchemy import text, select
+from db import db, PendingCount
+from storage import readEngine
+
+
+# Buckets em segundos
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CLAIM_BUCKETS = (60, 300, 900, 3600, 4 * 3600, 12 * 3600, 86400, 3 * 86400, 7 * 86400, 30 * 86400)
+
+# Gatilhos que mantêm tbPendingCounts: +1/-1 quando um caso entra ou sai de
+# 'pendente' ou muda de cidade. Assim o total por cidade nunca precisa de COUNT(*).
+_PENDING_TABLES = [
+    ('report', 'tbReport', 'rep_status', 'rep_city'),
+    ('rescue', 'tbRescues', 'resc_status', 'resc_city'),
+]
+
+_PENDING_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_pending_insert AFTER INSERT ON {table}
+    WHEN new.{status} = 'pendente' BEGIN
+        INSERT INTO tbPendingCounts (pc_kind, pc_city, pc_pending) VALUES ('{kind}', COALESCE(new.{city}, ''), 1)
+        ON CONFLICT (pc_kind, pc_city) DO UPDATE SET pc_pending = pc_pending + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_pending_delete AFTER DELETE ON {table}
+    WHEN old.{status} = 'pendente' BEGIN
+        UPDATE tbPendingCounts SET pc_pending = pc_pending - 1
+        WHERE pc_kind = '{kind}' AND pc_city = COALESCE(old.{city}, '');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_pending_update AFTER UPDATE OF {status}, {city} ON {table}
+    WHEN old.{status} = 'pendente' OR new.{status} = 'pendente' BEGIN
+        UPDATE tbPendingCounts SET pc_pending = pc_pending - 1
+        WHERE old.{status} = 'pendente' AND pc_kind = '{kind}' AND pc_city = COALESCE(old.{city}, '');
+        INSERT INTO tbPendingCounts (pc_kind, pc_city, pc_pending)
+        SELECT '{kind}', COALESCE(new.{city}, ''), 1 WHERE new.{status} = 'pendente'
+        ON CONFLICT (pc_kind, pc_city) DO UPDATE SET pc_pending = pc_pending + 1;
+    END
+    """,
+]
+
+
+def installMetrics(conn):
+    """
+    Cria os gatilhos dos pendentes por cidade. Na primeira vez, conta os
+    pendentes que já existem. Só para SQLite.
+    """
+    if conn.dialect.name != 'sqlite':
+        return
+    for kind, table, status, city in _PENDING_TABLES:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = :name"
+        ), {'name': f'{table}_pending_insert'}).first()
+        if not exists:
+            conn.execute(text('DELETE FROM tbPendingCounts WHERE pc_kind = :kind'), {'kind': kind})
+            conn.execute(text(
+                f"INSERT INTO tbPendingCounts (pc_kind, pc_city, pc_pending) "
+                f"SELECT '{kind}', COALESCE({city}, ''), count(*) FROM {table} "
+                f"WHERE {status} = 'pendente' GROUP BY COALESCE({city}, '')"
+            ))
+        for trigger in _PENDING_TRIGGERS:
+            conn.execute(text(trigger.format(kind=kind, table=table, status=status, city=city)))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in pairs) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Métrica com rótulos. Os valores ficam num dict {valores dos rótulos: valor}.
+    """
+
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def state(self):
+        with self._lock:
+            return {json.dumps(k): v for k, v in self._values.items()}
+
+    @staticmethod
+    def merge(values, other):
+        for key, value in other.items():
+            values[key] = values.get(key, 0) + value
+
+    def lines(self, values):
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_labels(self.labelnames, json.loads(key))} {_number(value)}'
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Gauge comum (set) ou calculado na coleta (collect devolve
+    {valores dos rótulos: valor}). shared=True quando o valor é o mesmo
+    para todos os processos (ex.: vem do banco) e não deve ser somado.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, help, labels=(), collect=None, shared=False):
+        super().__init__(name, help, labels)
+        self.collect = collect
+        self.shared = shared
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def state(self):
+        if self.collect is None:
+            return super().state()
+        try:
+            return {json.dumps(list(k)): v for k, v in self.collect().items()}
+        except Exception as e:
+            logging.error(f"Erro ao coletar {self.name}: {e}")
+            return {}
+
+
+class Histogram(Metric):
+    """
+    Valor por rótulos: [contagem por bucket..., soma, total].
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+                    break
+            data[-2] += value
+            data[-1] += 1
+
+    def state(self):
+        with self._lock:
+            return {json.dumps(k): list(v) for k, v in self._values.items()}
+
+    @staticmethod
+    def merge(values, other):
+        for key, data in other.items():
+            current = values.get(key)
+            values[key] = data if current is None else [a + b for a, b in zip(current, data)]
+
+    def lines(self, values):
+        for key, data in sorted(values.items()):
+            labels = json.loads(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                yield f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", _number(bound))])} {cumulative}'
+            yield f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", "+Inf")])} {data[-1]}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(float(data[-2]))}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {data[-1]}'
+
+
+class MetricsRegistry:
+    """
+    Contadores, gauges e histogramas em memória, expostos no formato texto
+    do Prometheus. Com METRICS_DIR configurado (vários workers do gunicorn),
+    cada processo grava seu estado em METRICS_DIR/metrics-<pid>.json a cada
+    METRICS_FLUSH_INTERVAL segundos e quem atende a coleta soma os arquivos.
+    Contadores de workers que já terminaram continuam somando; gauges só de
+    processos vivos. Limpe a pasta ao iniciar o servidor.
+    """
+
+    def __init__(self, flush_interval=5):
+        self.metrics = {}
+        self.directory = None
+        self.flush_interval = flush_interval
+        self._engines = {}
+        self._thread = None
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), collect=None, shared=False):
+        return self._register(Gauge(name, help, labels, collect, shared))
+
+    def histogram(self, name, help, labels=(), buckets=REQUEST_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def init_app(self, app):
+        self.directory = app.config.get('METRICS_DIR') or None
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', self.flush_interval)
+        with app.app_context():
+            self._engines = {'writer': db.engine, 'reader': readEngine()}
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Erro ao gravar métricas: {e}")
+
+    def _local(self):
+        return {
+            name: metric.state() for name, metric in self.metrics.items()
+            if not getattr(metric, 'shared', False)
+        }
+
+    def flush(self):
+        """
+        Grava o estado deste processo no diretório compartilhado.
+        """
+        if not self.directory:
+            return
+        payload = {'pid': os.getpid(), 'metrics': self._local()}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, os.path.join(self.directory, f'metrics-{os.getpid()}.json'))
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def collect(self):
+        """
+        {nome: {rótulos: valor}} deste processo ou de todos os workers.
+        """
+        if not self.directory:
+            states = [(True, self._local())]
+        else:
+            self.flush()
+            states = []
+            for entry in os.scandir(self.directory):
+                if not (entry.name.startswith('metrics-') and entry.name.endswith('.json')):
+                    continue
+                try:
+                    with open(entry.path) as f:
+                        payload = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                states.append((self._alive(payload['pid']), payload['metrics']))
+
+        merged = {name: {} for name in self.metrics}
+        for alive, state in states:
+            for name, values in state.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.type == 'gauge' and not alive):
+                    continue
+                metric.merge(merged[name], values)
+        for name, metric in self.metrics.items():
+            if getattr(metric, 'shared', False):
+                merged[name] = metric.state()
+        return merged
+
+    def render(self):
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            lines.extend(metric.lines(values))
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+
+
+def _pendingCounts():
+    with metrics_registry._engines['reader'].connect() as conn:
+        rows = conn.execute(
+            select(PendingCount.pc_kind, PendingCount.pc_city, PendingCount.pc_pending)
+            .where(PendingCount.pc_pending > 0)
+        )
+        return {(kind, city): n for kind, city, n in rows}
+
+def _poolUsage():
+    usage = {}
+    for name, engine in metrics_registry._engines.items():
+        if name == 'reader' and engine is metrics_registry._engines['writer']:
+            continue
+        for state in ('checkedout', 'size', 'overflow'):
+            method = getattr(engine.pool, state, None)
+            if method is not None:
+                # overflow() fica negativo enquanto o pool ainda não abriu todas as conexões
+                usage[(name, state)] = max(method(), 0)
+    return usage
+
+def _sseSubscribers():
+    from live import case_broker
+    return {(): len(case_broker)}
+
+def _fragmentBytes():
+    from fragments import fragment_cache
+    return {(): fragment_cache.size}
+
+def _residentMemory():
+    try:
+        with open('/proc/self/statm') as f:
+            return {(): int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')}
+    except (OSError, ValueError):
+        return {}
+
+
+REQUEST_SECONDS = metrics_registry.histogram(
+    'animal_aider_request_duration_seconds', 'Duração das requisições por endpoint.', ('endpoint',))
+RESPONSES = metrics_registry.counter(
+    'animal_aider_responses_total', 'Respostas por endpoint e status.', ('endpoint', 'status'))
+SQL_STATEMENTS = metrics_registry.counter(
+    'animal_aider_sql_statements_total', 'Comandos SQL emitidos por endpoint.', ('endpoint',))
+CLAIMS = metrics_registry.counter(
+    'animal_aider_claims_total', 'Casos aceitos ou rejeitados por ONGs.', ('kind', 'action'))
+CLAIM_LATENCY = metrics_registry.histogram(
+    'animal_aider_claim_latency_seconds', 'Tempo entre a criação do caso e o aceite.', ('kind',), CLAIM_BUCKETS)
+UPLOADS = metrics_registry.counter(
+    'animal_aider_uploads_total', 'Arquivos enviados (dedup=true quando o conteúdo já existia).', ('dedup',))
+UPLOAD_BYTES = metrics_registry.counter(
+    'animal_aider_upload_bytes_total', 'Bytes recebidos em uploads.', ('dedup',))
+LOGINS = metrics_registry.counter(
+    'animal_aider_logins_total', 'Tentativas de login por tipo de conta e resultado.', ('account', 'result'))
+FRAGMENTS = metrics_registry.counter(
+    'animal_aider_fragment_cache_total', 'Consultas ao cache de trechos de HTML (hit, miss) e remoções pelo LRU.', ('result',))
+
+metrics_registry.gauge(
+    'animal_aider_pending_cases', 'Casos pendentes por cidade.', ('kind', 'city'),
+    collect=_pendingCounts, shared=True)
+metrics_registry.gauge(
+    'animal_aider_db_pool_connections', 'Conexões dos pools do SQLAlchemy.', ('engine', 'state'), collect=_poolUsage)
+metrics_registry.gauge(
+    'animal_aider_sse_subscribers', 'Painéis de ONG conectados por SSE.', collect=_sseSubscribers)
+metrics_registry.gauge(
+    'animal_aider_fragment_cache_bytes', 'Bytes de HTML no cache de trechos.', collect=_fragmentBytes)
+metrics_registry.gauge(
+    'animal_aider_process_resident_memory_bytes', 'Memória residente dos processos.', collect=_residentMemory)
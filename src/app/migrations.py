@@ -0,0 +1,78 @@
+import logging
+from sqlalchemy import inspect, text, literal, update
+from db import db, Ong
+from search import installSearch
+from metrics import installMetrics
+from directory import installDirectory
+from validators import installValidators
+
+
+# Índices do esquema original substituídos pelos compostos/parciais declarados nos modelos
+OBSOLETE_INDEXES = [
+    'ix_tbReport_rep_title',
+    'ix_tbReport_rep_status',
+    'ix_tbReport_rep_user_id',
+    'ix_tbReport_rep_ong_id',
+    'ix_tbRescues_resc_status',
+    'ix_tbRescues_resc_user_id',
+    'ix_tbRescues_resc_ong_id',
+]
+
+# Colunas em que nulo quer dizer "use o default" (linhas de antes da coluna existir)
+NULL_AS_DEFAULT = [Ong.ong_radius_km]
+
+
+def _defaultClause(column, dialect):
+    # O default do modelo só vale para INSERTs do SQLAlchemy; as linhas já
+    # existentes só o recebem se ele estiver no DDL. Defaults calculados
+    # (datas) ficam nulos.
+    default = column.default
+    if default is None or not default.is_scalar or default.arg is None:
+        return ''
+    value = literal(default.arg).compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+    return f' DEFAULT {value}'
+
+
+def upgradeSchema():
+    """
+    Completa tabelas já existentes com as colunas e índices declarados nos
+    modelos. O create_all só cria tabelas novas, então bancos antigos passam
+    por aqui. Pode ser executado várias vezes sem efeito colateral.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}'
+                    f'{_defaultClause(column, engine.dialect)}'
+                ))
+                logging.info(f"Coluna adicionada: {table.name}.{column.name}")
+
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+        for name in OBSOLETE_INDEXES:
+            conn.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+
+        # Bancos que ganharam a coluna sem o DEFAULT no DDL
+        for column in NULL_AS_DEFAULT:
+            conn.execute(
+                update(column.table).where(column.is_(None)).values({column.key: column.default.arg})
+            )
+
+        installSearch(conn)
+        installMetrics(conn)
+        installDirectory(conn)
+        installValidators(conn)
+
+        # Estatísticas para o planejador escolher entre os índices
+        conn.execute(text('PRAGMA optimize'))
@@ -0,0 +1,105 @@
+import json
+import base64
+from datetime import datetime as dt
+from sqlalchemy import or_, and_, select, union
+from db import db, Report, Rescue
+
+
+PAGE_SIZE = 24
+# Lotes buscados no máximo por keysetFilteredPage antes de devolver uma página curta
+MAX_FILTER_ROUNDS = 8
+
+# Chave de ordenação (mais recentes primeiro) de cada listagem
+CASE_ORDER = {
+    Report: (Report.rep_date, Report.rep_id),
+    Rescue: (Rescue.resc_created_at, Rescue.resc_id),
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encodeCursor(date, id):
+    raw = json.dumps([date.isoformat(), id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decodeCursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        date, id = json.loads(raw)
+        return dt.fromisoformat(date), int(id)
+    except (ValueError, TypeError, json.JSONDecodeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def _afterCursor(query, model, cursor):
+    if not cursor:
+        return query
+    date_col, id_col = CASE_ORDER[model]
+    date, id = decodeCursor(cursor)
+    return query.filter(or_(date_col < date, and_(date_col == date, id_col < id)))
+
+def _nextCursor(rows, model, limit):
+    if len(rows) <= limit:
+        return rows, None
+    date_col, id_col = CASE_ORDER[model]
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encodeCursor(getattr(last, date_col.key), getattr(last, id_col.key))
+
+
+def keysetPage(query, model, cursor=None, limit=PAGE_SIZE):
+    """
+    Uma página da consulta ordenada por (data, id) decrescente. O cursor é a
+    chave da última linha da página anterior, então o custo não depende de
+    quantas páginas já foram lidas. Retorna (linhas, próximo cursor ou None).
+    """
+    date_col, id_col = CASE_ORDER[model]
+    query = _afterCursor(query, model, cursor)
+    rows = query.order_by(date_col.desc(), id_col.desc()).limit(limit + 1).all()
+    return _nextCursor(rows, model, limit)
+
+def keysetUnionPage(queries, model, cursor=None, limit=PAGE_SIZE):
+    """
+    Como keysetPage, mas para a união de várias consultas. Cada uma busca só
+    as chaves da sua própria página pelo seu índice; as linhas completas são
+    carregadas depois pela chave primária.
+    """
+    if len(queries) == 1:
+        return keysetPage(queries[0], model, cursor, limit)
+
+    date_col, id_col = CASE_ORDER[model]
+    parts = []
+    for query in queries:
+        sub = (_afterCursor(query, model, cursor)
+               .with_entities(date_col.label('k_date'), id_col.label('k_id'))
+               .order_by(date_col.desc(), id_col.desc())
+               .limit(limit + 1)
+               .subquery())
+        parts.append(select(sub.c.k_date, sub.c.k_id))
+    keys = union(*parts).subquery()
+    ids = db.session.execute(
+        select(keys.c.k_id).order_by(keys.c.k_date.desc(), keys.c.k_id.desc()).limit(limit + 1)
+    ).scalars().all()
+
+    by_id = {getattr(row, id_col.key): row for row in model.query.filter(id_col.in_(ids))}
+    rows = [by_id[i] for i in ids if i in by_id]
+    return _nextCursor(rows, model, limit)
+
+def keysetFilteredPage(queries, model, keep, cursor=None, limit=PAGE_SIZE):
+    """
+    Como keysetUnionPage, com um filtro em Python (keep) aplicado depois do
+    banco. Busca lotes seguidos até juntar uma página cheia ou a consulta
+    acabar; só depois de MAX_FILTER_ROUNDS lotes a página volta curta, com
+    o cursor do último lote lido.
+    """
+    rows = []
+    for _ in range(MAX_FILTER_ROUNDS):
+        page, cursor = keysetUnionPage(queries, model, cursor, limit * 2)
+        rows += [row for row in page if keep(row)]
+        if cursor is None or len(rows) > limit:
+            break
+    if len(rows) > limit:
+        return _nextCursor(rows, model, limit)
+    return rows, cursor
@@ -0,0 +1,276 @@
+import os
+import time
+import random
+import logging
+import cProfile
+import threading
+from collections import Counter, deque
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from db import db
+from http_client import http_client
+from metrics import REQUEST_SECONDS, RESPONSES, SQL_STATEMENTS
+
+
+class RequestStats:
+    """
+    Medidas de uma requisição. Tempos em segundos.
+    """
+
+    def __init__(self, endpoint, method, path):
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.start = time.perf_counter()
+        self.wall = 0.0
+        self.status = None
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.statements = Counter()
+        self.template_time = 0.0
+        self.http_count = 0
+        self.http_time = 0.0
+        self.bytes_sent = 0
+        self.repeated = []
+        self.profile = None
+        self._template_starts = []
+
+    def as_dict(self):
+        return {
+            'endpoint': self.endpoint,
+            'method': self.method,
+            'path': self.path,
+            'status': self.status,
+            'wall_ms': round(self.wall * 1000, 2),
+            'sql_count': self.sql_count,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'http_count': self.http_count,
+            'http_ms': round(self.http_time * 1000, 2),
+            'bytes_sent': self.bytes_sent,
+            'n_plus_one': [{'statement': s[:200], 'count': n} for s, n in self.repeated],
+        }
+
+
+class RouteStats:
+    """
+    Totais acumulados de um endpoint.
+    """
+
+    FIELDS = ('wall', 'sql_count', 'sql_time', 'template_time', 'http_count', 'http_time', 'bytes_sent')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.n_plus_one = 0
+        self.max_wall = 0.0
+        self.totals = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, stats):
+        self.requests += 1
+        self.errors += stats.status is not None and stats.status >= 500
+        self.n_plus_one += bool(stats.repeated)
+        self.max_wall = max(self.max_wall, stats.wall)
+        for field in self.FIELDS:
+            self.totals[field] += getattr(stats, field)
+
+    def as_dict(self):
+        n = self.requests or 1
+        t = self.totals
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'n_plus_one': self.n_plus_one,
+            'wall_ms_avg': round(t['wall'] / n * 1000, 2),
+            'wall_ms_max': round(self.max_wall * 1000, 2),
+            'sql_count_avg': round(t['sql_count'] / n, 2),
+            'sql_ms_avg': round(t['sql_time'] / n * 1000, 2),
+            'template_ms_avg': round(t['template_time'] / n * 1000, 2),
+            'http_count_avg': round(t['http_count'] / n, 2),
+            'http_ms_avg': round(t['http_time'] / n * 1000, 2),
+            'bytes_sent_total': t['bytes_sent'],
+        }
+
+
+def _current():
+    return g.get('_request_stats') if has_request_context() else None
+
+
+class RequestProfiler:
+    """
+    Instrumentação por requisição: tempo total, quantidade e tempo de SQL
+    (eventos do SQLAlchemy), tempo de renderização de templates, chamadas
+    HTTP externas (http_client) e bytes enviados. A mesma consulta repetida
+    muitas vezes numa requisição é marcada como possível N+1. Uma amostra das
+    requisições (ou as que pedirem pelo cabeçalho, se permitido) é
+    perfilada com cProfile e gravada em PROFILE_DIR.
+    """
+
+    def __init__(self, n_plus_one_threshold=5, slow_ms=500, sample_rate=0.0, recent=50):
+        self.enabled = True
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.allow_header = False
+        self.header = 'X-Profile'
+        self.profile_dir = None
+        self.routes = {}
+        self.recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PROFILE_ENABLED', self.enabled)
+        self.n_plus_one_threshold = app.config.get('PROFILE_N_PLUS_ONE', self.n_plus_one_threshold)
+        self.slow_ms = app.config.get('PROFILE_SLOW_MS', self.slow_ms)
+        self.sample_rate = app.config.get('PROFILE_SAMPLE_RATE', self.sample_rate)
+        self.allow_header = app.config.get('PROFILE_ALLOW_HEADER', app.debug)
+        self.header = app.config.get('PROFILE_HEADER', self.header)
+        self.profile_dir = app.config.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+        if not self.enabled:
+            return
+
+        # O engine de leitura (modo WAL) também conta
+        with app.app_context():
+            engines = set(db.engines.values())
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._before_sql)
+            event.listen(engine, 'after_cursor_execute', self._after_sql)
+        before_render_template.connect(self._before_template, app)
+        template_rendered.connect(self._after_template, app)
+        http_client.observers.append(self._on_http)
+        app.before_request(self._start)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+
+    # Ganchos
+
+    def _before_sql(self, conn, cursor, statement, parameters, context, executemany):
+        if _current() is not None:
+            conn.info.setdefault('profile_start', []).append(time.perf_counter())
+
+    def _after_sql(self, conn, cursor, statement, parameters, context, executemany):
+        stats = _current()
+        starts = conn.info.get('profile_start')
+        if stats is None or not starts:
+            return
+        stats.sql_count += 1
+        stats.sql_time += time.perf_counter() - starts.pop()
+        stats.statements[statement] += 1
+
+    def _before_template(self, sender, template, context, **extra):
+        stats = _current()
+        if stats is not None:
+            stats._template_starts.append(time.perf_counter())
+
+    def _after_template(self, sender, template, context, **extra):
+        stats = _current()
+        if stats is not None and stats._template_starts:
+            elapsed = time.perf_counter() - stats._template_starts.pop()
+            # Templates incluídos contam só uma vez, no mais externo
+            if not stats._template_starts:
+                stats.template_time += elapsed
+
+    def _on_http(self, host, elapsed):
+        stats = _current()
+        if stats is not None:
+            stats.http_count += 1
+            stats.http_time += elapsed
+
+    def _wants_profile(self):
+        if self.allow_header and request.headers.get(self.header):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _start(self):
+        stats = g._request_stats = RequestStats(request.endpoint, request.method, request.path)
+        if self._wants_profile():
+            stats.profile = cProfile.Profile()
+            try:
+                stats.profile.enable()
+            except ValueError:
+                # Outro profiler já ativo nesta thread
+                stats.profile = None
+
+    def _after(self, response):
+        stats = _current()
+        if stats is None:
+            return response
+        stats.status = response.status_code
+        if response.mimetype == 'text/event-stream':
+            # Conexão SSE fica aberta até o painel fechar: não é tempo de
+            # resposta, então só conta a resposta, sem duração nem log lento
+            if stats.profile is not None:
+                stats.profile.disable()
+            RESPONSES.inc(endpoint=stats.endpoint or 'not_found', status=stats.status)
+            return response
+        if response.is_streamed:
+            # Corpo em partes: fecha as medidas quando o último byte sair
+            response.response = self._counting(response.response, stats)
+            response.call_on_close(lambda: self._finish(stats))
+        else:
+            stats.bytes_sent = response.content_length or 0
+            self._finish(stats)
+        return response
+
+    def _teardown(self, exc):
+        # Exceção não tratada: o after_request não rodou
+        stats = _current()
+        if stats is not None and stats.status is None:
+            stats.status = 500
+            self._finish(stats)
+
+    @staticmethod
+    def _counting(body, stats):
+        for chunk in body:
+            stats.bytes_sent += len(chunk)
+            yield chunk
+
+    def _finish(self, stats):
+        stats.wall = time.perf_counter() - stats.start
+        if stats.profile is not None:
+            stats.profile.disable()
+            self._dump(stats)
+
+        stats.repeated = [
+            (statement, n) for statement, n in stats.statements.most_common()
+            if n >= self.n_plus_one_threshold and statement.lstrip().upper().startswith('SELECT')
+        ]
+        endpoint = stats.endpoint or 'not_found'
+        REQUEST_SECONDS.observe(stats.wall, endpoint=endpoint)
+        RESPONSES.inc(endpoint=endpoint, status=stats.status)
+        SQL_STATEMENTS.inc(stats.sql_count, endpoint=endpoint)
+        with self._lock:
+            self.routes.setdefault(endpoint, RouteStats()).add(stats)
+            if stats.wall * 1000 >= self.slow_ms or stats.repeated:
+                self.recent.append(stats.as_dict())
+
+        logging.info(
+            f"{stats.method} {stats.path} {stats.status} {stats.wall * 1000:.1f}ms "
+            f"sql={stats.sql_count}/{stats.sql_time * 1000:.1f}ms tpl={stats.template_time * 1000:.1f}ms "
+            f"http={stats.http_count}/{stats.http_time * 1000:.1f}ms bytes={stats.bytes_sent}"
+        )
+        for statement, n in stats.repeated:
+            logging.warning(f"Possível N+1 em {stats.endpoint}: {n}x {' '.join(statement.split())[:200]}")
+        if stats.wall * 1000 >= self.slow_ms:
+            logging.warning(f"Requisição lenta: {stats.method} {stats.path} {stats.wall * 1000:.0f}ms")
+
+    def _dump(self, stats):
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{stats.endpoint or 'not_found'}-{os.getpid()}-{threading.get_ident()}.prof"
+            stats.profile.dump_stats(os.path.join(self.profile_dir, name))
+        except Exception as e:
+            logging.error(f"Erro ao gravar perfil: {e}")
+
+    def snapshot(self):
+        """
+        Totais por endpoint, requisições lentas ou com N+1 recentes e os
+        contadores do cliente HTTP.
+        """
+        with self._lock:
+            routes = {name: route.as_dict() for name, route in self.routes.items()}
+            recent = list(self.recent)
+        return {'routes': routes, 'recent': recent, 'http': http_client.stats()}
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,224 @@
+import re
+import logging
+from sqlalchemy import text, bindparam, DateTime
+from db import db, Report, Rescue
+from cities import city_registry
+from geo import ServiceArea, boundingBox
+
+
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE = 50
+MAX_TERMS = 8
+
+# Peso de cada coluna no bm25: título, descrição, endereço
+RANK_WEIGHTS = (10.0, 4.0, 2.0)
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+# rowid no índice: id * 2 para denúncias, id * 2 + 1 para resgates
+_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS ftsCases USING fts5(
+        title, description, address,
+        kind UNINDEXED, case_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tbReport_fts_insert AFTER INSERT ON tbReport BEGIN
+        INSERT INTO ftsCases (rowid, title, description, address, kind, case_id)
+        VALUES (new.rep_id * 2, new.rep_title, new.rep_desc, new.rep_address, 'report', new.rep_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tbReport_fts_update AFTER UPDATE OF rep_title, rep_desc, rep_address ON tbReport BEGIN
+        UPDATE ftsCases SET title = new.rep_title, description = new.rep_desc, address = new.rep_address
+        WHERE rowid = new.rep_id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tbReport_fts_delete AFTER DELETE ON tbReport BEGIN
+        DELETE FROM ftsCases WHERE rowid = old.rep_id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tbRescues_fts_insert AFTER INSERT ON tbRescues BEGIN
+        INSERT INTO ftsCases (rowid, title, description, address, kind, case_id)
+        VALUES (new.resc_id * 2 + 1, NULL, new.resc_desc, new.resc_addr, 'rescue', new.resc_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tbRescues_fts_update AFTER UPDATE OF resc_desc, resc_addr ON tbRescues BEGIN
+        UPDATE ftsCases SET description = new.resc_desc, address = new.resc_addr
+        WHERE rowid = new.resc_id * 2 + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tbRescues_fts_delete AFTER DELETE ON tbRescues BEGIN
+        DELETE FROM ftsCases WHERE rowid = old.resc_id * 2 + 1;
+    END
+    """,
+]
+
+_BACKFILL = [
+    """
+    INSERT INTO ftsCases (rowid, title, description, address, kind, case_id)
+    SELECT rep_id * 2, rep_title, rep_desc, rep_address, 'report', rep_id FROM tbReport
+    """,
+    """
+    INSERT INTO ftsCases (rowid, title, description, address, kind, case_id)
+    SELECT resc_id * 2 + 1, NULL, resc_desc, resc_addr, 'rescue', resc_id FROM tbRescues
+    """,
+]
+
+# Colunas comuns aos dois tipos, para filtrar o resultado já unido
+_CASE_COLUMNS = {
+    'city': ('r.rep_city', 's.resc_city'),
+    'city_id': ('r.rep_city_id', 's.resc_city_id'),
+    'status': ('r.rep_status', 's.resc_status'),
+    'date': ('r.rep_date', 's.resc_date'),
+    'lat': ('r.rep_lat', 's.resc_lat'),
+    'lon': ('r.rep_lon', 's.resc_lon'),
+}
+
+
+def _column(field):
+    report_col, rescue_col = _CASE_COLUMNS[field]
+    return f'COALESCE({report_col}, {rescue_col})'
+
+
+def installSearch(conn):
+    """
+    Cria o índice FTS5 e os gatilhos que o mantêm em dia. Na primeira vez,
+    indexa os casos que já existem. Só para SQLite.
+    """
+    if conn.dialect.name != 'sqlite':
+        return
+    exists = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ftsCases'"
+    )).first()
+    for statement in _SCHEMA:
+        conn.execute(text(statement))
+    if not exists:
+        for statement in _BACKFILL:
+            conn.execute(text(statement))
+        logging.info("Índice de busca criado")
+
+def rebuildSearch():
+    """
+    Reindexa tudo do zero (ex.: depois de importar dados com os gatilhos desligados).
+    """
+    with db.engine.begin() as conn:
+        conn.execute(text('DELETE FROM ftsCases'))
+        for statement in _BACKFILL:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO ftsCases (ftsCases) VALUES ('optimize')"))
+
+
+def matchQuery(terms):
+    """
+    Converte o texto digitado em uma consulta FTS5 segura: cada palavra vira
+    um prefixo entre aspas ("gat"*), todas obrigatórias. Operadores e aspas
+    do usuário são descartados. Retorna None se não sobrar nenhuma palavra.
+    """
+    words = TERM_RE.findall(terms or '')[:MAX_TERMS]
+    if not words:
+        return None
+    return ' '.join(f'"{w}"*' for w in words)
+
+
+def searchCases(terms, kind=None, city=None, status=None, date_from=None, date_to=None, page=1, area=None):
+    """
+    Busca denúncias e resgates por relevância (bm25). Filtros opcionais por
+    tipo ('report' ou 'rescue'), cidade, status e intervalo de datas
+    (datetime). Com area (a ServiceArea da ONG), só os casos dentro dela,
+    pela mesma distância real do painel.
+    Retorna (casos da página, há próxima página). Os casos são instâncias de
+    Report e Rescue, na ordem do ranking.
+    """
+    match = matchQuery(terms)
+    if match is None:
+        return [], False
+    page = max(1, min(page, MAX_SEARCH_PAGE))
+
+    where = ['ftsCases MATCH :match']
+    params = {'match': match}
+    typed = []
+    if kind:
+        where.append('f.kind = :kind')
+        params['kind'] = kind
+    # Cidade pelo código IBGE quando ela está no registro (sem diferença de acentos)
+    code = city_registry.code(city) if city else None
+    city_filter = ('city_id', '=', code) if code is not None else ('city', '=', city)
+    filters = [city_filter, ('status', '=', status), ('date', '>=', date_from), ('date', '<', date_to)]
+    for n, (field, op, value) in enumerate(filters):
+        if value is None or value == '':
+            continue
+        where.append(f'{_column(field)} {op} :f{n}')
+        params[f'f{n}'] = value
+        if field == 'date':
+            # Mesmo formato em que o SQLAlchemy grava as colunas DateTime
+            typed.append(bindparam(f'f{n}', type_=DateTime))
+
+    if area is not None:
+        area = ServiceArea.of(area)
+        if area.city_code is not None:
+            area_city = f"{_column('city_id')} = :area_city"
+            params['area_city'] = area.city_code
+        else:
+            area_city = f"{_column('city')} = :area_city"
+            params['area_city'] = area.city
+        if area.has_coords:
+            min_lat, max_lat, min_lon, max_lon = boundingBox(area.lat, area.lon, area.radius_km)
+            where.append(f"({area_city} OR ({_column('lat')} BETWEEN :min_lat AND :max_lat "
+                         f"AND {_column('lon')} BETWEEN :min_lon AND :max_lon))")
+            params.update(min_lat=min_lat, max_lat=max_lat, min_lon=min_lon, max_lon=max_lon)
+        else:
+            where.append(area_city)
+
+    weights = ', '.join(str(w) for w in RANK_WEIGHTS)
+    stmt = text(f"""
+        SELECT f.kind, f.case_id, {_column('city')} AS city, {_column('city_id')} AS city_id,
+               {_column('lat')} AS lat, {_column('lon')} AS lon
+        FROM ftsCases f
+        LEFT JOIN tbReport r ON f.kind = 'report' AND r.rep_id = f.case_id
+        LEFT JOIN tbRescues s ON f.kind = 'rescue' AND s.resc_id = f.case_id
+        WHERE {' AND '.join(where)}
+        ORDER BY bm25(ftsCases, {weights}), f.rowid
+        LIMIT :limit OFFSET :offset
+    """).bindparams(*typed)
+
+    def fetch(limit, offset):
+        return db.session.execute(stmt, dict(params, limit=limit, offset=offset)).all()
+
+    offset = (page - 1) * SEARCH_PAGE_SIZE
+    if area is not None and area.has_coords:
+        # A caixa envolvente é refinada pela distância real, então as linhas
+        # anteriores à página também passam pelo filtro
+        wanted = offset + SEARCH_PAGE_SIZE + 1
+        rows, scanned = [], 0
+        while len(rows) < wanted:
+            batch = fetch(wanted, scanned)
+            scanned += len(batch)
+            rows += [row for row in batch if area.contains(row.city, row.lat, row.lon, row.city_id)]
+            if len(batch) < wanted:
+                break
+        rows = rows[offset:]
+    else:
+        rows = fetch(SEARCH_PAGE_SIZE + 1, offset)
+
+    has_next = len(rows) > SEARCH_PAGE_SIZE
+    rows = rows[:SEARCH_PAGE_SIZE]
+
+    ids = {'report': [], 'rescue': []}
+    for row in rows:
+        ids[row.kind].append(row.case_id)
+    loaded = {}
+    if ids['report']:
+        loaded.update((('report', r.rep_id), r) for r in Report.query.filter(Report.rep_id.in_(ids['report'])))
+    if ids['rescue']:
+        loaded.update((('rescue', r.resc_id), r) for r in Rescue.query.filter(Rescue.resc_id.in_(ids['rescue'])))
+
+    keys = [(row.kind, row.case_id) for row in rows]
+    return [loaded[key] for key in keys if key in loaded], has_next
@@ -0,0 +1,298 @@
+import os
+import re
+import time
+import secrets
+import logging
+import tempfile
+from datetime import datetime as dt
+from flask.sessions import SessionInterface, SessionMixin
+from flask.json.tag import TaggedJSONSerializer
+from sqlalchemy import select, delete
+from db import db, SessionData
+from storage import readEngine
+
+
+SID_RE = re.compile(r'^[A-Za-z0-9_-]{43}$')
+serializer = TaggedJSONSerializer()
+
+
+def loadSecretKey(app):
+    """
+    SECRET_KEY do ambiente ou de um arquivo na pasta instance, gerado uma vez
+    e compartilhado por todos os processos.
+    """
+    key = os.environ.get('SECRET_KEY')
+    if key:
+        return key
+
+    path = os.path.join(app.instance_path, 'secret_key')
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(app.instance_path, exist_ok=True)
+    key = secrets.token_hex(32)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Outro processo gerou a chave ao mesmo tempo
+        with open(path) as f:
+            return f.read().strip()
+    with os.fdopen(fd, 'w') as f:
+        f.write(key)
+    return key
+
+
+class SqlSessionStore:
+    """
+    Sessões na tabela tbSessions do próprio banco da aplicação.
+    Usa conexões separadas da db.session das rotas.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._engine = None
+        self._reader = None
+
+    def _load(self):
+        # A sessão pode ser lida fora do contexto da aplicação (ex.: test client)
+        if self._engine is None:
+            with self.app.app_context():
+                self._engine, self._reader = db.engine, readEngine()
+
+    @property
+    def engine(self):
+        self._load()
+        return self._engine
+
+    @property
+    def reader(self):
+        self._load()
+        return self._reader
+
+    def get(self, sid):
+        with self.reader.connect() as conn:
+            row = conn.execute(
+                select(SessionData.sess_data, SessionData.sess_expires_at)
+                .where(SessionData.sess_id == sid)
+            ).first()
+        if row is None or row.sess_expires_at < dt.utcnow():
+            return None
+        return row.sess_data
+
+    def set(self, sid, data, expires_at):
+        with self.engine.begin() as conn:
+            updated = conn.execute(
+                SessionData.__table__.update()
+                .where(SessionData.sess_id == sid)
+                .values(sess_data=data, sess_expires_at=expires_at)
+            ).rowcount
+            if not updated:
+                conn.execute(SessionData.__table__.insert().values(
+                    sess_id=sid, sess_data=data, sess_expires_at=expires_at
+                ))
+
+    def delete(self, sid):
+        with self.engine.begin() as conn:
+            conn.execute(delete(SessionData).where(SessionData.sess_id == sid))
+
+    def purge(self):
+        with self.engine.begin() as conn:
+            return conn.execute(
+                delete(SessionData).where(SessionData.sess_expires_at < dt.utcnow())
+            ).rowcount
+
+
+class FileSessionStore:
+    """
+    Sessões em arquivos, um por sessão, espalhados em subpastas pelo
+    início do id. A validade é guardada no mtime do arquivo.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid[:2], sid)
+
+    def get(self, sid):
+        path = self._path(sid)
+        try:
+            if os.path.getmtime(path) < time.time():
+                return None
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, sid, data, expires_at):
+        path = self._path(sid)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(data)
+        expires = (expires_at - dt.utcnow()).total_seconds() + time.time()
+        os.utime(tmp_path, (expires, expires))
+        os.replace(tmp_path, path)
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except OSError:
+            pass
+
+    def purge(self):
+        removed = 0
+        now = time.time()
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < now:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+
+class ServerSideSession(SessionMixin):
+    """
+    Sessão cujo conteúdo fica no servidor. Os dados só são buscados no
+    armazenamento na primeira vez que a rota lê a sessão.
+    """
+
+    def __init__(self, store, sid=None, new=False):
+        self.store = store
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+        self.old_sid = None
+        self._data = {} if sid is None else None
+
+    @property
+    def data(self):
+        self.accessed = True
+        if self._data is None:
+            raw = self.store.get(self.sid)
+            self._data = serializer.loads(raw) if raw else {}
+            if not raw:
+                self.sid = None
+        return self._data
+
+    def regenerate(self):
+        """
+        Troca o id mantendo os dados. Chamado no login contra fixação de sessão.
+        """
+        self.data
+        if self.sid is not None:
+            self.old_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self):
+        self.data.clear()
+        self.modified = True
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    O cookie guarda apenas um id aleatório; o conteúdo fica no armazenamento
+    configurado em SESSION_BACKEND ('sql' ou 'file').
+    """
+
+    def __init__(self, store, lifetime, gc_interval=600):
+        self.store = store
+        self.lifetime = lifetime
+        self.gc_interval = gc_interval
+        self._next_gc = time.monotonic() + gc_interval
+
+    @classmethod
+    def from_app(cls, app):
+        backend = app.config.get('SESSION_BACKEND', 'sql')
+        if backend == 'file':
+            directory = app.config.get('SESSION_FILE_DIR', os.path.join(app.instance_path, 'sessions'))
+            store = FileSessionStore(directory)
+        elif backend == 'sql':
+            store = SqlSessionStore(app)
+        else:
+            raise ValueError(f'SESSION_BACKEND inválido: {backend}')
+        return cls(store, app.permanent_session_lifetime,
+                   app.config.get('SESSION_GC_INTERVAL', 600))
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and SID_RE.match(sid):
+            return ServerSideSession(self.store, sid)
+        return ServerSideSession(self.store, new=True)
+
+    def _expires_at(self):
+        return dt.utcnow() + self.lifetime
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.old_sid:
+            self.store.delete(session.old_sid)
+
+        if not session.modified:
+            return
+
+        if not session._data:
+            if session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        set_cookie = session.sid is None
+        if set_cookie:
+            session.sid = secrets.token_urlsafe(32)
+
+        self.store.set(session.sid, serializer.dumps(dict(session._data)), self._expires_at())
+        if set_cookie or session.permanent:
+            response.set_cookie(
+                name, session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain, path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+        self._maybe_gc()
+
+    def _maybe_gc(self):
+        now = time.monotonic()
+        if now < self._next_gc:
+            return
+        self._next_gc = now + self.gc_interval
+        try:
+            removed = self.store.purge()
+            if removed:
+                logging.info(f"Sessões expiradas removidas: {removed}")
+        except Exception as e:
+            logging.error(f"Erro ao limpar sessões expiradas: {e}")
@@ -0,0 +1,130 @@
+import logging
+from functools import partial
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
+from flask_sqlalchemy.session import Session
+
+
+READER_BIND = 'reader'
+SQLITE_MODES = ('default', 'wal')
+
+
+def _isFileDatabase(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+def _writes(clause):
+    if isinstance(clause, TextClause):
+        return not clause.text.lstrip().upper().startswith(('SELECT', 'WITH'))
+    return isinstance(clause, UpdateBase)
+
+
+class RoutingSession(Session):
+    """
+    Sessão que manda as leituras para o engine de leitura, quando existe.
+    A partir da primeira escrita, tudo na mesma transação vai para o engine
+    de escrita, para a transação enxergar o que acabou de gravar.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        engines = self._db.engines
+        reader = engines.get(READER_BIND)
+        if reader is None or engine is not engines.get(None):
+            return engine
+        if self._flushing or self.info.get('wrote') or _writes(clause):
+            self.info['wrote'] = True
+            return engine
+        return reader
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _resetRouting(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('wrote', None)
+
+
+def readEngine():
+    """
+    Engine para leituras fora da db.session (ex.: exportação). Sem o modo
+    'wal', é o próprio db.engine. Precisa do contexto da aplicação.
+    """
+    engines = current_app.extensions['sqlalchemy'].engines
+    return engines.get(READER_BIND, engines[None])
+
+
+class SqliteStorage:
+    """
+    Modo de armazenamento do SQLite (SQLITE_MODE). Em 'wal': journal WAL,
+    synchronous=NORMAL, busy_timeout, mmap e cache por conexão, um pool de
+    escrita pequeno (o SQLite só aceita um escritor por vez, os demais
+    esperam no busy_timeout) e um engine de leitura separado, com pool
+    próprio e query_only, que não disputa conexões com quem grava. Em
+    'default' ou com banco em memória nada muda.
+
+    configure() roda antes do db.init_app (opções dos engines) e init_app()
+    depois dele (PRAGMAs em cada conexão nova).
+    """
+
+    def __init__(self):
+        self.mode = 'default'
+        self.pragmas = {}
+
+    def configure(self, app):
+        mode = app.config.setdefault('SQLITE_MODE', 'wal')
+        if mode not in SQLITE_MODES:
+            raise ValueError(f"SQLITE_MODE inválido: {mode}")
+        uri = app.config['SQLALCHEMY_DATABASE_URI']
+        self.mode = mode if _isFileDatabase(uri) else 'default'
+        if self.mode != 'wal':
+            return
+
+        busy_timeout = app.config.get('SQLITE_BUSY_TIMEOUT', 5000)
+        self.pragmas = {
+            'synchronous': 'NORMAL',
+            'busy_timeout': busy_timeout,
+            'cache_size': -app.config.get('SQLITE_CACHE_KB', 16384),
+            'mmap_size': app.config.get('SQLITE_MMAP_BYTES', 256 * 2 ** 20),
+            'temp_store': 'MEMORY',
+        }
+        # Quem passar do pool espera uma conexão pelo mesmo tempo do busy_timeout
+        options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        options.setdefault('pool_size', 1)
+        options.setdefault('max_overflow', app.config.get('SQLITE_WRITE_OVERFLOW', 2))
+        options.setdefault('pool_timeout', busy_timeout / 1000)
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        binds.setdefault(READER_BIND, {
+            'url': uri,
+            'pool_size': app.config.get('SQLITE_READERS', 8),
+            'max_overflow': app.config.get('SQLITE_READ_OVERFLOW', 8),
+        })
+
+    def init_app(self, app):
+        if self.mode != 'wal':
+            return
+        with app.app_context():
+            engines = app.extensions['sqlalchemy'].engines
+            event.listen(engines[None], 'connect', self._connect)
+            event.listen(engines[READER_BIND], 'connect', partial(self._connect, read_only=True))
+            with engines[None].connect() as conn:
+                journal = conn.exec_driver_sql('PRAGMA journal_mode').scalar()
+        if journal != 'wal':
+            logging.error(f"Não foi possível ativar o WAL (journal_mode={journal})")
+
+    def _connect(self, dbapi_connection, connection_record, read_only=False):
+        cursor = dbapi_connection.cursor()
+        try:
+            # Gravado no arquivo; nas conexões seguintes não faz nada
+            cursor.execute('PRAGMA journal_mode=WAL')
+            for name, value in self.pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+            if read_only:
+                cursor.execute('PRAGMA query_only=ON')
+        finally:
+            cursor.close()
+
+
+sqlite_storage = SqliteStorage()
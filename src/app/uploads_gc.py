@@ -0,0 +1,202 @@
+import os
+import re
+import time
+import logging
+import threading
+import click
+from datetime import datetime as dt
+from sqlalchemy import select, update, delete, text
+from db import db, User, Ong, Report, Rescue, Events, Blob
+from blobstore import isBlobKey
+from images import VARIANTS, DEFAULT_PHOTOS
+
+
+# Colunas que guardam nomes de arquivos da pasta de uploads
+PHOTO_COLUMNS = [
+    User.user_profile_photo,
+    Ong.ong_profile_photo,
+    Report.rep_photo,
+    Rescue.resc_photo,
+    Events.event_photo,
+]
+
+VARIANT_RE = re.compile(r'^(.*)\.(?:%s)\.\w+$' % '|'.join(VARIANTS))
+
+
+def photoStem(name):
+    """
+    Nome sem extensão, igual para o original e as suas variantes.
+    """
+    match = VARIANT_RE.match(name)
+    if match:
+        return match.group(1)
+    return os.path.splitext(name)[0]
+
+def walkUploads(root):
+    """
+    Percorre a pasta de uploads sem montar a lista inteira em memória.
+    Gera (nome relativo, DirEntry).
+    """
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(root, rel_dir)) as entries:
+                for entry in entries:
+                    rel = f'{rel_dir}/{entry.name}' if rel_dir else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(rel)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield rel, entry
+        except FileNotFoundError:
+            continue
+
+
+class UploadCollector:
+    """
+    Coletor de arquivos órfãos em UPLOAD_FOLDER. Os nomes usados no banco vão
+    para uma tabela temporária do SQLite; a pasta é lida em lotes e cada lote
+    é comparado com essa tabela. Só apaga arquivos mais velhos que o período
+    de carência, para não pegar uploads cujo registro ainda não foi gravado.
+    """
+
+    def __init__(self, grace=24 * 3600, batch_size=500, interval=0):
+        self.grace = grace
+        self.batch_size = batch_size
+        self.interval = interval
+        self.upload_folder = None
+        self._thread = None
+
+    def init_app(self, app):
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        self.grace = app.config.get('UPLOAD_GC_GRACE', self.grace)
+        self.batch_size = app.config.get('UPLOAD_GC_BATCH', self.batch_size)
+        self.interval = app.config.get('UPLOAD_GC_INTERVAL', self.interval)
+
+        @app.cli.command('gc-uploads')
+        @click.option('--dry-run', is_flag=True, help='Só lista o que seria apagado.')
+        @click.option('--grace', type=int, default=None, help='Carência em segundos.')
+        def gc_uploads(dry_run, grace):
+            """Apaga arquivos de upload que nenhum registro usa."""
+            stats = self.collect(dry_run=dry_run, grace=grace)
+            click.echo(
+                f"{stats['scanned']} arquivos lidos, {stats['removed']} órfãos "
+                f"{'encontrados' if dry_run else 'apagados'}, {stats['bytes']} bytes"
+                f"{'' if dry_run else ' recuperados'}"
+            )
+
+        if self.interval:
+            self._thread = threading.Thread(target=self._loop, args=(app,), daemon=True)
+            self._thread.start()
+
+    def _loop(self, app):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with app.app_context():
+                    self.collect()
+            except Exception as e:
+                logging.error(f"Erro na coleta de uploads órfãos: {e}")
+
+    def _loadReferences(self, conn):
+        conn.execute(text('CREATE TEMP TABLE IF NOT EXISTS gc_refs (stem TEXT PRIMARY KEY)'))
+        conn.execute(text('DELETE FROM gc_refs'))
+        insert = text('INSERT OR IGNORE INTO gc_refs (stem) VALUES (:stem)')
+        for column in PHOTO_COLUMNS:
+            result = conn.execute(
+                select(column).where(column.isnot(None)).execution_options(yield_per=self.batch_size)
+            )
+            for rows in result.partitions():
+                conn.execute(insert, [{'stem': photoStem(name)} for (name,) in rows])
+
+    def _referenced(self, conn, stems):
+        params = {f's{i}': stem for i, stem in enumerate(stems)}
+        placeholders = ', '.join(f':{key}' for key in params)
+        rows = conn.execute(text(f'SELECT stem FROM gc_refs WHERE stem IN ({placeholders})'), params)
+        return {row[0] for row in rows}
+
+    def _stillFree(self, conn, name, cutoff):
+        """
+        Confere de novo, já na transação da remoção, se o arquivo continua
+        sem uso: gc_refs e o mtime foram lidos antes, e nesse meio tempo um
+        put() que deduplicou pode ter aumentado blob_refs (e renovado o
+        mtime). O UPDATE vazio na linha do blob segura a escrita do SQLite
+        até o commit, então um put() concorrente espera e grava o arquivo
+        de novo. Apaga a linha do blob quando o arquivo é o original.
+        """
+        stem = photoStem(name)
+        limit = dt.utcfromtimestamp(cutoff)
+        rows = conn.execute(
+            update(Blob)
+            .where(Blob.blob_key.startswith(f'{stem}.'))
+            .values(blob_refs=Blob.blob_refs)
+            .returning(Blob.blob_key, Blob.blob_refs, Blob.blob_updated_at)
+        ).all()
+        if any(refs > 0 or updated >= limit for _, refs, updated in rows):
+            return False
+        try:
+            if os.stat(os.path.join(self.upload_folder, name)).st_mtime > cutoff:
+                return False
+        except FileNotFoundError:
+            return False
+        if isBlobKey(name) and not VARIANT_RE.match(name):
+            conn.execute(delete(Blob).where(Blob.blob_key == name, Blob.blob_refs == 0))
+        return True
+
+    def _sweep(self, conn, batch, dry_run, stats, cutoff):
+        referenced = self._referenced(conn, {photoStem(name) for name, _ in batch})
+        for name, size in batch:
+            if photoStem(name) in referenced:
+                continue
+            if dry_run:
+                stats['removed'] += 1
+                stats['bytes'] += size
+                logging.info(f"Órfão: {name}")
+                continue
+            if not self._stillFree(conn, name, cutoff):
+                continue
+            try:
+                os.remove(os.path.join(self.upload_folder, name))
+            except OSError as e:
+                logging.error(f"Erro ao remover {name}: {e}")
+                continue
+            stats['removed'] += 1
+            stats['bytes'] += size
+
+    def collect(self, dry_run=False, grace=None):
+        """
+        Retorna {'scanned', 'removed', 'bytes'}.
+        """
+        grace = self.grace if grace is None else grace
+        cutoff = time.time() - grace
+        stats = {'scanned': 0, 'removed': 0, 'bytes': 0}
+        if not os.path.isdir(self.upload_folder):
+            return stats
+
+        with db.engine.connect() as conn:
+            self._loadReferences(conn)
+            conn.commit()
+
+            batch = []
+            for name, entry in walkUploads(self.upload_folder):
+                stats['scanned'] += 1
+                if name in DEFAULT_PHOTOS:
+                    continue
+                info = entry.stat(follow_symlinks=False)
+                if info.st_mtime > cutoff:
+                    continue
+                batch.append((name, info.st_size))
+                if len(batch) >= self.batch_size:
+                    self._sweep(conn, batch, dry_run, stats, cutoff)
+                    conn.commit()
+                    batch = []
+            if batch:
+                self._sweep(conn, batch, dry_run, stats, cutoff)
+                conn.commit()
+            conn.execute(text('DROP TABLE IF EXISTS gc_refs'))
+
+        logging.info(f"Coleta de uploads: {stats['removed']} órfãos, {stats['bytes']} bytes")
+        return stats
+
+
+upload_gc = UploadCollector()
@@ -0,0 +1,163 @@
+import os
+import hashlib
+from flask import request, session, make_response
+from sqlalchemy import select, text
+from db import db, CacheVersion
+from cities import city_registry
+from geo import coverCells
+
+
+# Precisão do geohash dos contadores por região (~39 x 20 km)
+CELL_PRECISION = 4
+
+# Contadores de cada tabela: uma expressão por escopo, avaliada para a
+# linha nova e a antiga. Expressões nulas (caso sem ONG, sem coordenadas)
+# não contam.
+_VERSIONED_TABLES = [
+    ('tbReport', [
+        "'cases:city:' || COALESCE({row}.rep_city_id, {row}.rep_city)",
+        f"'cases:cell:' || substr({{row}}.rep_geohash, 1, {CELL_PRECISION})",
+        "'cases:ong:' || {row}.rep_ong_id",
+        "'cases:user:' || {row}.rep_user_id",
+    ]),
+    ('tbRescues', [
+        "'cases:city:' || COALESCE({row}.resc_city_id, {row}.resc_city)",
+        f"'cases:cell:' || substr({{row}}.resc_geohash, 1, {CELL_PRECISION})",
+        "'cases:ong:' || {row}.resc_ong_id",
+        "'cases:user:' || {row}.resc_user_id",
+    ]),
+    ('tbEvents', [
+        "'events:ong:' || {row}.event_ong_id",
+    ]),
+]
+
+_BUMP = """
+    INSERT INTO tbCacheVersions (cv_name, cv_version)
+    SELECT name, 1 FROM ({names}) WHERE name IS NOT NULL
+    ON CONFLICT (cv_name) DO UPDATE SET cv_version = cv_version + 1;
+"""
+
+
+def _bump(expressions, rows):
+    names = ' UNION '.join(f'SELECT {e.format(row=row)} AS name' for row in rows for e in expressions)
+    return _BUMP.format(names=names)
+
+def installValidators(conn):
+    """
+    Cria os gatilhos que incrementam os contadores de mudança por cidade,
+    região, ONG e usuário em tbCacheVersions. Só para SQLite.
+    """
+    if conn.dialect.name != 'sqlite':
+        return
+    for table, expressions in _VERSIONED_TABLES:
+        for event, rows in (('insert', ['new']), ('delete', ['old']), ('update', ['old', 'new'])):
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_versions_{event} AFTER {event.upper()} ON {table} "
+                f"BEGIN {_bump(expressions, rows)} END"
+            ))
+
+
+def areaCounters(area):
+    """
+    Contadores dos casos que podem aparecer no painel de uma ONG: os da
+    cidade e os das regiões que cobrem o círculo de atuação.
+    """
+    code = city_registry.code(area.city)
+    names = [f'cases:city:{code if code is not None else area.city}']
+    if area.has_coords:
+        names += [f'cases:cell:{cell}'
+                  for cell in coverCells(area.lat, area.lon, area.radius_km, precision=CELL_PRECISION)]
+    return names
+
+def ongCounters(ong_id):
+    return [f'cases:ong:{ong_id}']
+
+def userCounters(user_id):
+    return [f'cases:user:{user_id}']
+
+def eventCounters(ong_id):
+    return [f'events:ong:{ong_id}']
+
+
+def _buildStamp(*folders):
+    """
+    Resumo dos arquivos de código e templates (caminho, tamanho e data):
+    uma versão nova da aplicação muda todos os ETags.
+    """
+    digest = hashlib.sha1()
+    for folder in folders:
+        for root, dirs, files in os.walk(folder):
+            dirs[:] = sorted(d for d in dirs if d not in ('__pycache__', 'instance'))
+            for name in sorted(files):
+                if name.endswith(('.py', '.html')):
+                    path = os.path.join(root, name)
+                    info = os.stat(path)
+                    digest.update(f'{os.path.relpath(path, folder)}:{info.st_size}:{info.st_mtime_ns};'.encode())
+    return digest.hexdigest()[:12]
+
+
+class PageValidators:
+    """
+    ETags das páginas de listagem calculados a partir de contadores de
+    mudança (tbCacheVersions, mantidos por gatilhos) em vez do HTML: uma
+    consulta por chave primária decide se o navegador já tem a página, e
+    aí a rota responde 304 sem rodar as consultas da listagem nem os
+    templates. O ETag também leva quem está logado e a versão do código.
+    Páginas com mensagens flash pendentes não usam ETag.
+
+    Os contadores são lidos antes da listagem: uma escrita no meio deixa o
+    ETag velho, e a próxima requisição recebe a página de novo.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stamp = ''
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PAGE_VALIDATORS_ENABLED', self.enabled)
+        with app.app_context():
+            # Sem os gatilhos (fora do SQLite) os contadores nunca mudariam
+            if db.engine.dialect.name != 'sqlite':
+                self.enabled = False
+        self.stamp = app.config.get('ETAG_SALT') or _buildStamp(
+            app.root_path, os.path.join(app.root_path, app.template_folder or 'templates'))
+
+    @staticmethod
+    def versions(names):
+        if not names:
+            return ()
+        rows = db.session.execute(
+            select(CacheVersion.cv_name, CacheVersion.cv_version).where(CacheVersion.cv_name.in_(names))
+        ).all()
+        return tuple(sorted(rows))
+
+    def etag(self, names, scope):
+        identity = (session.get('logged'), session.get('user_id'), session.get('ong_logged'), session.get('ong_id'))
+        key = repr((self.stamp, request.full_path, identity, scope, self.versions(names)))
+        return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+    def conditional(self, names, *scope):
+        """
+        (etag, resposta) de uma página de listagem. A resposta é um 304
+        quando o If-None-Match já traz essa versão; senão é None e a rota
+        renderiza e devolve por tagged(). Sem ETag (None, None) fora de GET,
+        com flash pendente ou desligado.
+        """
+        if not self.enabled or request.method != 'GET' or session.get('_flashes'):
+            return None, None
+        etag = self.etag(names, scope)
+        if request.if_none_match.contains_weak(etag):
+            return etag, self.tagged('', etag, 304)
+        return etag, None
+
+    @staticmethod
+    def tagged(body, etag, status=200):
+        response = make_response(body, status)
+        if etag is not None:
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Cookie')
+        return response
+
+
+page_validators = PageValidators()
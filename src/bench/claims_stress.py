@@ -0,0 +1,128 @@
+"""
+Teste de contenção do motor de aceite (claims.py).
+
+Várias threads, cada uma representando uma ONG diferente, tentam aceitar as
+mesmas denúncias e resgates ao mesmo tempo num banco SQLite em arquivo.
+O script falha se algum caso tiver mais de um vencedor ou se o dono gravado
+no banco não for o vencedor reportado.
+
+Uso: python src/bench/claims_stress.py --threads 32 --rows 200
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+from datetime import datetime as dt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+from flask import Flask
+from db import db, Report, Rescue, Ong
+from claims import claimReports, claimRescue, CLAIM_OK, CLAIM_TAKEN
+
+
+def build_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 60}}
+    db.init_app(app)
+    return app
+
+
+def seed(app, threads, rows, city):
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(
+            Ong(ong_name=f'ONG {i}', ong_email=f'ong{i}@teste', ong_pass='x', ong_city=city)
+            for i in range(1, threads + 1)
+        )
+        db.session.add_all(
+            Report(rep_title=f'Denúncia {i}', rep_city=city, rep_date=dt.utcnow(), rep_phone='0')
+            for i in range(rows)
+        )
+        db.session.add_all(
+            Rescue(resc_desc=f'Resgate {i}', resc_author='x', resc_phone='0', resc_city=city)
+            for i in range(rows)
+        )
+        db.session.commit()
+        report_ids = [r.rep_id for r in Report.query.all()]
+        rescue_ids = [r.resc_id for r in Rescue.query.all()]
+    return report_ids, rescue_ids
+
+
+def run(args):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    city = 'Jundiaí'
+    app = build_app(path)
+    report_ids, rescue_ids = seed(app, args.threads, args.rows, city)
+
+    barrier = threading.Barrier(args.threads)
+    wins = defaultdict(list)
+    errors = []
+    lock = threading.Lock()
+
+    def worker(ong_id):
+        with app.app_context():
+            barrier.wait()
+            try:
+                # Denúncias em lote, na ordem inversa para algumas ONGs
+                ids = report_ids if ong_id % 2 else list(reversed(report_ids))
+                results = claimReports(ids, ong_id, city)
+                # Resgates um a um
+                for rescue_id in rescue_ids:
+                    if claimRescue(rescue_id, ong_id, city) == CLAIM_OK:
+                        with lock:
+                            wins[('rescue', rescue_id)].append(ong_id)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                return
+            with lock:
+                for rep_id, result in results.items():
+                    if result == CLAIM_OK:
+                        wins[('report', rep_id)].append(ong_id)
+                    elif result != CLAIM_TAKEN:
+                        errors.append(f'denúncia {rep_id}: {result}')
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(1, args.threads + 1)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        owners = {('report', r.rep_id): r.rep_ong_id for r in Report.query.all()}
+        owners.update({('rescue', r.resc_id): r.resc_ong_id for r in Rescue.query.all()})
+        db.engine.dispose()
+    os.remove(path)
+
+    problems = list(errors)
+    for key, owner in owners.items():
+        winners = wins.get(key, [])
+        if len(winners) != 1:
+            problems.append(f'{key}: {len(winners)} vencedores')
+        elif winners[0] != owner:
+            problems.append(f'{key}: vencedor {winners[0]}, dono no banco {owner}')
+
+    claims = args.threads * len(owners)
+    print(f'{args.threads} threads, {len(owners)} casos, {claims} tentativas em {elapsed:.2f}s')
+    if problems:
+        print(f'FALHOU: {len(problems)} problemas')
+        for p in problems[:20]:
+            print(' ', p)
+        return 1
+    print('OK: exatamente um vencedor por caso')
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--rows', type=int, default=200)
+    sys.exit(run(parser.parse_args()))
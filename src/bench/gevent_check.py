@@ -0,0 +1,214 @@
+"""
+Confere a aplicação nos workers gevent do gunicorn.conf.py.
+
+Gera um banco temporário com seed_data.py e sobe o gunicorn de verdade
+(-c src/app/gunicorn.conf.py, com o monkey-patch do gevent) servindo este
+módulo, que aponta a aplicação para o banco, a pasta de uploads e as
+cidades geradas. Com o servidor no ar:
+
+- abre --streams conexões /ong_stream de uma ONG e as mantém abertas;
+- faz --logins logins concorrentes (Argon2 no pool de threads nativas, com
+  os slots do AuthService liberados pelo callback do gevent) e mede a
+  página inicial enquanto eles rodam;
+- envia uma denúncia com foto e espera as variantes geradas pelo
+  ProcessPoolExecutor do images.py.
+
+Falha se algum login válido for recusado, se o envio não for aceito, se
+as variantes não aparecerem ou se a página inicial travar durante os logins.
+
+Uso: python src/bench/gevent_check.py [--logins 40] [--streams 500]
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime as dt
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BENCH_DIR, '..', 'app'))
+sys.path.insert(0, APP_DIR)
+
+# Dentro do worker do gunicorn: este módulo é a aplicação
+if os.environ.get('GEVENT_CHECK_DIR'):
+    _workdir = os.environ['GEVENT_CHECK_DIR']
+    import app as _animal_aider
+    from blobstore import blob_store
+    from images import image_pipeline
+    from cities import city_registry
+
+    blob_store.root = image_pipeline.upload_folder = os.path.join(_workdir, 'uploads')
+    with open(os.path.join(_workdir, 'municipios.json'), encoding='utf-8') as _f:
+        city_registry._apply(json.load(_f), time.time())
+    application = _animal_aider.app
+
+
+def samplePhoto():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.effect_noise((1200, 900), 40).convert('RGB').save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def freePort():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def waitPort(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def openStreams(base, port, cookie, count):
+    streams = []
+    for _ in range(count):
+        conn = socket.create_connection(('127.0.0.1', port))
+        conn.sendall(f'GET /ong_stream HTTP/1.1\r\nHost: {base}\r\nCookie: {cookie}\r\n\r\n'.encode())
+        streams.append(conn)
+    opened = 0
+    for conn in streams:
+        conn.settimeout(10)
+        received = b''
+        try:
+            # Cabeçalhos e o começo do corpo podem chegar em pacotes separados
+            while b'retry: 5000' not in received:
+                chunk = conn.recv(4096)
+                if not chunk:
+                    break
+                received += chunk
+        except OSError:
+            pass
+        opened += b'retry: 5000' in received
+    return streams, opened
+
+
+def main(args):
+    import requests
+    from seed_data import generate, PASSWORD
+
+    workdir = tempfile.mkdtemp(prefix='animal_aider_gevent_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    logging.disable(logging.CRITICAL)
+
+    import app as animal_aider
+    from blobstore import blob_store
+    from images import image_pipeline
+    from cities import city_registry
+    blob_store.root = image_pipeline.upload_folder = os.path.join(workdir, 'uploads')
+    data = generate(animal_aider.app, users=args.logins, ongs=5, reports=50, rescues=50,
+                    events=0, photos=0, cities=3, seed=42)
+    with open(os.path.join(workdir, 'municipios.json'), 'w', encoding='utf-8') as f:
+        json.dump([{'id': city_registry.code(c) or 3500000 + i, 'nome': c}
+                   for i, c in enumerate(data['cities'])], f, ensure_ascii=False)
+    with animal_aider.app.app_context():
+        for engine in animal_aider.db.engines.values():
+            engine.dispose()
+
+    port = freePort()
+    base = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, GEVENT_CHECK_DIR=workdir, GUNICORN_BIND=f'127.0.0.1:{port}')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(APP_DIR, 'gunicorn.conf.py'),
+         '--chdir', APP_DIR, '--pythonpath', BENCH_DIR, 'gevent_check:application'],
+        env=env, stdout=subprocess.DEVNULL, stderr=open(os.path.join(workdir, 'gunicorn.log'), 'w'))
+
+    failures = []
+    streams = []
+    try:
+        if not waitPort(port):
+            failures.append('gunicorn não subiu')
+            return 1
+
+        # Primeira requisição fora da conta: carrega o diretório e os templates
+        requests.get(f'{base}/')
+        ong = requests.Session()
+        ong.post(f'{base}/ong_login', data={'email': 'ong1@exemplo.com', 'password': PASSWORD})
+        cookie = '; '.join(f'{k}={v}' for k, v in ong.cookies.items())
+        streams, opened = openStreams(f'127.0.0.1:{port}', port, cookie, args.streams)
+        print(f'{opened}/{args.streams} conexões SSE abertas')
+        if opened != args.streams:
+            failures.append('conexões SSE recusadas')
+
+        results = []
+        lock = threading.Lock()
+
+        def login(n):
+            response = requests.post(f'{base}/login', allow_redirects=False, data={
+                'email': f'u{n % args.logins + 1}@exemplo.com', 'password': PASSWORD})
+            with lock:
+                results.append(response.status_code)
+
+        threads = [threading.Thread(target=login, args=(n,)) for n in range(args.logins)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        index_ms = []
+        while any(t.is_alive() for t in threads):
+            t0 = time.perf_counter()
+            requests.get(f'{base}/')
+            index_ms.append((time.perf_counter() - t0) * 1000)
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        refused = sum(1 for status in results if status != 302)
+        worst = max(index_ms, default=0)
+        print(f'{args.logins} logins em {elapsed:.2f}s, {refused} recusados; '
+              f'página inicial durante os logins: {len(index_ms)} chamadas, pior {worst:.0f} ms')
+        if refused:
+            failures.append('logins recusados')
+        if worst > args.max_index_ms:
+            failures.append('página inicial travou durante os logins')
+
+        response = requests.post(f'{base}/report', allow_redirects=False, data={
+            'title': 'Cachorro abandonado', 'desc': 'Está no local há vários dias.',
+            'date': dt.today().strftime('%Y-%m-%d'), 'city': data['cities'][1],
+            'phone': '(11) 99999-0000', 'lat': '-23.18', 'lon': '-46.89',
+        }, files={'photo': ('foto.jpg', samplePhoto(), 'image/jpeg')})
+        uploads = os.path.join(workdir, 'uploads')
+        variants = []
+        deadline = time.time() + 30
+        while time.time() < deadline and len(variants) < 3:
+            variants = [name for _, _, files in os.walk(uploads) for name in files
+                        if name.count('.') == 2 and not name.endswith('.tmp')]
+            time.sleep(0.2)
+        print(f'envio com foto: status {response.status_code}, {len(variants)} variantes geradas')
+        if response.status_code != 302:
+            failures.append('envio com foto recusado')
+        if len(variants) < 3:
+            failures.append('variantes não geradas')
+    finally:
+        for conn in streams:
+            conn.close()
+        server.terminate()
+        server.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        print(f"FALHOU: {', '.join(failures)}")
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--logins', type=int, default=40)
+    parser.add_argument('--streams', type=int, default=500)
+    parser.add_argument('--max-index-ms', type=float, default=1000,
+                        help='pior tempo aceito da página inicial durante os logins')
+    sys.exit(main(parser.parse_args()))
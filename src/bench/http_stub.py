@@ -0,0 +1,194 @@
+"""
+Servidor HTTP local que imita o IBGE e o ViaCEP, para testar o cliente
+compartilhado (http_client.py) sem depender da internet.
+
+Sem argumentos, roda as verificações do cliente contra o stub: pool de
+conexões, timeout, novas tentativas, disjuntor e limite de concorrência.
+Com --serve, só sobe o servidor; aponte CITIES_URL e CEP_URL para ele.
+
+Rotas:
+  /municipios                lista de municípios no formato do IBGE
+  /ws/<cep>/json/            endereço no formato do ViaCEP (00000000 = erro)
+  /slow?delay=S              responde depois de S segundos
+  /flaky?fail=N&key=K        N primeiras chamadas com a chave K dão 503
+  /down                      sempre 503
+
+Uso: python src/bench/http_stub.py [--serve] [--port 8765]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+MUNICIPIOS = [
+    {'id': 3525904, 'nome': 'Jundiaí'},
+    {'id': 3550308, 'nome': 'São Paulo'},
+    {'id': 3509502, 'nome': 'Campinas'},
+]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    municipios = MUNICIPIOS
+    calls = Counter()
+    connections = set()
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with self.lock:
+            self.connections.add(self.client_address)
+            self.calls[url.path] += 1
+
+        if url.path == '/municipios':
+            return self._send(200, self.municipios)
+        if url.path.startswith('/ws/'):
+            cep = url.path.split('/')[2]
+            if cep == '00000000':
+                return self._send(200, {'erro': True})
+            return self._send(200, {'cep': cep, 'logradouro': 'Rua Teste', 'localidade': 'Jundiaí', 'uf': 'SP'})
+        if url.path == '/slow':
+            time.sleep(float(query.get('delay', 1)))
+            return self._send(200, {'ok': True})
+        if url.path == '/flaky':
+            key = f"flaky:{query.get('key', '')}"
+            with self.lock:
+                self.calls[key] += 1
+                count = self.calls[key]
+            if count <= int(query.get('fail', 1)):
+                return self._send(503, {'erro': 'indisponível'})
+            return self._send(200, {'ok': True})
+        if url.path == '/down':
+            return self._send(503, {'erro': 'indisponível'})
+        return self._send(404, {'erro': 'não encontrado'})
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Cliente que desistiu por timeout fecha a conexão antes da resposta
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start(port=0):
+    server = StubServer(('127.0.0.1', port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def check():
+    logging.disable(logging.CRITICAL)
+    import requests
+    from http_client import HttpClient, CircuitOpen, UpstreamBusy
+
+    server, base = start()
+    failures = []
+
+    def expect(label, condition):
+        print(f"{'ok   ' if condition else 'FALHA'} {label}")
+        if not condition:
+            failures.append(label)
+
+    client = HttpClient()
+    client.configure_host('127.0.0.1', connect_timeout=1, read_timeout=0.5, retries=2, backoff=0.01,
+                          max_concurrency=4, failure_threshold=3, reset_timeout=0.5)
+
+    StubHandler.connections.clear()
+    for _ in range(20):
+        client.get(f'{base}/municipios').json()
+    expect('keep-alive: 20 chamadas em uma conexão', len(StubHandler.connections) == 1)
+
+    data = client.get(f'{base}/ws/13201000/json/').json()
+    expect('resposta no formato do ViaCEP', data['localidade'] == 'Jundiaí')
+
+    response = client.get(f'{base}/flaky?fail=2&key=a')
+    expect('503 duas vezes e depois 200 com novas tentativas', response.status_code == 200)
+
+    start_time = time.perf_counter()
+    try:
+        client.get(f'{base}/slow?delay=2')
+        timed_out = False
+    except requests.Timeout:
+        timed_out = True
+    expect('timeout de leitura respeitado', timed_out and time.perf_counter() - start_time < 2)
+
+    try:
+        client.get(f'{base}/down')
+    except CircuitOpen:
+        pass
+    calls_before = StubHandler.calls['/down']
+    try:
+        client.get(f'{base}/down')
+        short_circuited = False
+    except CircuitOpen:
+        short_circuited = True
+    expect('circuito aberto falha sem chamar o host', short_circuited and StubHandler.calls['/down'] == calls_before)
+
+    time.sleep(0.6)
+    response = client.get(f'{base}/municipios')
+    expect('meio aberto: uma chamada boa fecha o circuito',
+           response.status_code == 200 and client.stats()['127.0.0.1']['circuit'] == 'closed')
+
+    client.configure_host('127.0.0.1', connect_timeout=0.2, read_timeout=2, retries=0, max_concurrency=2)
+    errors = []
+
+    def slow():
+        try:
+            client.get(f'{base}/slow?delay=0.5')
+        except UpstreamBusy:
+            errors.append('busy')
+
+    threads = [threading.Thread(target=slow) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    expect('limite de concorrência recusa o excesso', errors.count('busy') == 3)
+
+    stats = client.stats()['127.0.0.1']
+    expect('contadores de latência', stats['requests'] == 2 and stats['latency_avg'] > 0.4)
+
+    server.shutdown()
+    if failures:
+        print(f'FALHOU: {len(failures)} verificações')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--serve', action='store_true', help='só sobe o servidor')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    if args.serve:
+        server, base = start(args.port)
+        print(f'Stub em {base} (CITIES_URL={base}/municipios, CEP_URL={base}/ws/{{cep}}/json/)')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+        sys.exit(0)
+    sys.exit(check())
@@ -0,0 +1,369 @@
+"""
+Teste de carga das rotas principais.
+
+Sobe a aplicação num servidor WSGI local com o IBGE e o ViaCEP trocados
+pelo stub (http_stub.py) e dispara requisições concorrentes por HTTP em
+cada rota: páginas iniciais, painel da ONG (também recarregado com
+If-None-Match) e aceite, busca, envio de denúncia com foto, login,
+consulta de CEP e a API JSON (/api/v1). Para cada rota mostra p50, p95
+e p99 de latência, vazão e pico de RSS do processo, e grava tudo em JSON
+para comparar commits (--compare).
+
+Sem --db, gera um banco temporário pequeno com seed_data.py.
+
+Uso: python src/bench/load_test.py [--db /tmp/animal_aider.db] --requests 200 --concurrency 8 [--out resultado.json] [--compare anterior.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime as dt
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'app'))
+
+import requests
+
+from http_stub import StubHandler, start as start_stub
+from seed_data import generate, PASSWORD
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler:
+    """
+    Lê o RSS do processo a cada intervalo e guarda o maior valor.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = rss_bytes()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def samplePhoto():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.effect_noise((1200, 900), 40).convert('RGB').save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+class Scenario:
+    """
+    Uma rota sob carga. setup(sessão) roda uma vez por thread, fora da
+    medição (ex.: login); call(sessão, n) faz a requisição medida.
+    """
+
+    def __init__(self, name, call, expect=(200,), setup=None):
+        self.name = name
+        self.call = call
+        self.expect = expect
+        self.setup = setup
+
+
+def buildScenarios(base, data):
+    from sqlalchemy import text
+    from db import db
+
+    ong_city = data['cities'][0]
+    user_city = data['cities'][1]
+    photo = samplePhoto()
+    today = dt.today().strftime('%Y-%m-%d')
+
+    with data['app'].app_context():
+        ong_ids = db.session.execute(text(
+            'SELECT ong_id FROM tbOngs WHERE ong_city = :city ORDER BY ong_id'
+        ), {'city': ong_city}).scalars().all()
+        pending = db.session.execute(text(
+            "SELECT rep_id FROM tbReport WHERE rep_status = 'pendente' AND rep_city = :city"
+        ), {'city': ong_city}).scalars().all()
+    pending_ids = iter(pending)
+    lock = threading.Lock()
+    ong_numbers = iter(ong_ids * 100)
+    user_numbers = iter(range(1, 10 ** 9))
+    users = max(1, data['counts']['users'])
+
+    def login_ong(session):
+        with lock:
+            n = next(ong_numbers)
+        session.post(f'{base}/ong_login', data={'email': f'ong{n}@exemplo.com', 'password': PASSWORD})
+
+    def login_user(session):
+        with lock:
+            n = next(user_numbers) % users + 1
+        session.post(f'{base}/login', data={'email': f'u{n}@exemplo.com', 'password': PASSWORD})
+
+    def accept(session, n):
+        with lock:
+            report_id = next(pending_ids, None)
+        return session.post(f'{base}/accept_report/{report_id or 0}')
+
+    def report(session, n):
+        session.cookies.clear()
+        return session.post(f'{base}/report', allow_redirects=False, data={
+            'title': f'Cachorro abandonado {n}', 'desc': 'Está no local há vários dias.',
+            'date': today, 'city': user_city, 'phone': '(11) 99999-0000',
+            'lat': '-23.18', 'lon': '-46.89',
+        }, files={'photo': ('foto.jpg', photo, 'image/jpeg')})
+
+    def revalidate(session, n):
+        # Painel deixado aberto e recarregado: o navegador manda o último ETag
+        etag = getattr(session, 'etag', None)
+        response = session.get(f'{base}/', headers={'If-None-Match': etag} if etag else {})
+        session.etag = response.headers.get('ETag', etag)
+        return response
+
+    def login(session, n):
+        session.cookies.clear()
+        return session.post(f'{base}/login', allow_redirects=False, data={
+            'email': f'u{n % users + 1}@exemplo.com', 'password': PASSWORD,
+        })
+
+    return [
+        Scenario('index_anonimo', lambda s, n: s.get(f'{base}/')),
+        Scenario('index_usuario', lambda s, n: s.get(f'{base}/'), setup=login_user),
+        Scenario('index_ong', lambda s, n: s.get(f'{base}/'), setup=login_ong),
+        Scenario('index_ong_304', revalidate, expect=(200, 304), setup=login_ong),
+        Scenario('ong_cases', lambda s, n: s.get(f'{base}/ong_cases/report'), setup=login_ong),
+        Scenario('search_cases', lambda s, n: s.get(f'{base}/search_cases', params={'q': random.choice(['cach', 'gato ferido', 'abandon'])}),
+                 setup=login_ong),
+        Scenario('accept_report', accept, expect=(200, 409), setup=login_ong),
+        Scenario('report', report, expect=(302,)),
+        Scenario('login', login, expect=(302,)),
+        Scenario('get_address', lambda s, n: s.get(f'{base}/get_address/{13200000 + n:08d}')),
+        Scenario('api_reports', lambda s, n: s.get(f'{base}/api/v1/reports', params={'city': ong_city, 'status': 'pendente'},
+                                                   headers={'Accept-Encoding': 'gzip'}), setup=login_ong),
+        Scenario('api_ongs', lambda s, n: s.get(f'{base}/api/v1/ongs', params={'city': user_city, 'fields': 'name,city,photo'},
+                                                headers={'Accept-Encoding': 'gzip'})),
+    ]
+
+
+def runScenario(scenario, requests_count, concurrency):
+    latencies = []
+    errors = []
+    counter = iter(range(requests_count))
+    lock = threading.Lock()
+    ready = threading.Barrier(concurrency + 1)
+
+    def worker():
+        session = requests.Session()
+        try:
+            if scenario.setup:
+                scenario.setup(session)
+        finally:
+            ready.wait()
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            start = time.perf_counter()
+            try:
+                response = scenario.call(session, n)
+                ok = response.status_code in scenario.expect
+                detail = response.status_code
+            except requests.RequestException as e:
+                ok, detail = False, type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors.append(detail)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    ready.wait()
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'error_codes': sorted({str(e) for e in errors}),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'peak_rss_mb': round(rss.peak / 2 ** 20, 1),
+    }
+
+
+def gitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous):
+    print(f"\nComparação com {previous.get('commit')} ({previous.get('date')}):")
+    for name, now in current['routes'].items():
+        before = previous.get('routes', {}).get(name)
+        if not before:
+            continue
+
+        def delta(key):
+            old = before[key]
+            return f'{(now[key] - old) / old * 100:+.0f}%' if old else 'n/a'
+        print(f"  {name:15} p95 {before['p95_ms']:>8.1f} -> {now['p95_ms']:>8.1f} ms ({delta('p95_ms')})  "
+              f"vazão {before['rps']:>7.1f} -> {now['rps']:>7.1f}/s ({delta('rps')})")
+
+
+def serve(app, cities, workdir):
+    """
+    Aponta o IBGE e o ViaCEP para o stub, com as mesmas cidades do banco, e
+    sobe a aplicação num servidor local. Retorna (servidor, stub, url base).
+    """
+    from werkzeug.serving import make_server
+    from cities import city_registry
+    from cep import cep_resolver
+
+    stub, stub_base = start_stub()
+    # Mesmos códigos gravados pelo seed (lista embutida); sintéticos para os nomes fora dela
+    StubHandler.municipios = [{'id': city_registry.code(c) or 3500000 + i, 'nome': c} for i, c in enumerate(cities)]
+    city_registry.url = f'{stub_base}/municipios'
+    city_registry.snapshot_path = os.path.join(workdir, 'municipios.json')
+    city_registry.refresh()
+    cep_resolver.url = f'{stub_base}/ws/{{cep}}/json/'
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stub, f'http://127.0.0.1:{server.server_port}'
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix='animal_aider_bench_')
+    db_path = os.path.abspath(args.db) if args.db else os.path.join(workdir, 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    logging.disable(logging.CRITICAL)
+
+    import app as animal_aider
+    from blobstore import blob_store
+    from images import image_pipeline
+    from auth import auth_service
+
+    app = animal_aider.app
+    blob_store.root = image_pipeline.upload_folder = os.path.join(workdir, 'uploads')
+    auth_service.resize(auth_service.workers, max(auth_service.queue_size, args.concurrency * 2))
+    if args.time_cost:
+        auth_service.configure(args.time_cost, args.memory_cost, auth_service.hasher.parallelism)
+
+    if args.db:
+        from sqlalchemy import text
+        with app.app_context():
+            cities = animal_aider.db.session.execute(text(
+                'SELECT rep_city FROM tbReport GROUP BY rep_city ORDER BY count(*) DESC'
+            )).scalars().all()
+            counts = {'users': animal_aider.User.query.count()}
+        data = {'cities': cities, 'counts': counts}
+    else:
+        print('Gerando dados...', flush=True)
+        data = generate(app, users=args.users, ongs=args.ongs, reports=args.reports,
+                        rescues=args.reports, events=1000, photos=10, cities=100, seed=args.seed)
+    data['app'] = app
+    server, stub, base = serve(app, data['cities'], workdir)
+
+    random.seed(args.seed)
+    scenarios = buildScenarios(base, data)
+    if args.routes:
+        scenarios = [s for s in scenarios if s.name in args.routes]
+
+    results = {
+        'commit': gitCommit(),
+        'date': dt.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'params': {'requests': args.requests, 'concurrency': args.concurrency, 'seed': args.seed,
+                   'db': args.db, 'counts': data['counts']},
+        'routes': {},
+    }
+    print(f"{'rota':15} {'reqs':>6} {'erros':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'RSS MB':>8}")
+    failed = False
+    for scenario in scenarios:
+        r = runScenario(scenario, args.requests, args.concurrency)
+        results['routes'][scenario.name] = r
+        failed |= r['errors'] > 0
+        print(f"{scenario.name:15} {r['requests']:>6} {r['errors']:>6} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+              f"{r['p99_ms']:>9.1f} {r['rps']:>8.1f} {r['peak_rss_mb']:>8.1f}"
+              + (f"  ({', '.join(r['error_codes'])})" if r['errors'] else ''), flush=True)
+
+    server.shutdown()
+    stub.shutdown()
+    with app.app_context():
+        animal_aider.db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f'Resultados em {args.out}')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+    if failed:
+        print('FALHOU: respostas inesperadas')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--db', default=None, help='banco já gerado por seed_data.py')
+    parser.add_argument('--requests', type=int, default=200, help='requisições por rota')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--routes', nargs='*', default=None, help='só estas rotas')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--users', type=int, default=2000, help='sem --db: usuários gerados')
+    parser.add_argument('--ongs', type=int, default=200, help='sem --db: ONGs geradas')
+    parser.add_argument('--reports', type=int, default=20000, help='sem --db: denúncias e resgates gerados')
+    parser.add_argument('--time-cost', type=int, default=None, help='custo do Argon2 (padrão: o da aplicação)')
+    parser.add_argument('--memory-cost', type=int, default=65536)
+    parser.add_argument('--out', default=None, help='grava os resultados neste JSON')
+    parser.add_argument('--compare', default=None, help='JSON de uma execução anterior')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,109 @@
+"""
+Benchmark de login (auth.py).
+
+Cria usuários num banco SQLite temporário e dispara logins concorrentes pela
+rota /login do cliente de teste do Flask. Mostra logins/s no total e por
+núcleo usado pelo pool do Argon2, com os parâmetros de custo em uso.
+Falha se algum login válido for recusado.
+
+Uso: python src/bench/login_bench.py --threads 16 --logins 200 [--time-cost 3 --memory-cost 65536]
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+_fd, DB_PATH = tempfile.mkstemp(suffix='.db')
+os.close(_fd)
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+logging.disable(logging.CRITICAL)
+
+import app as animal_aider
+from db import db, User
+from auth import auth_service
+
+
+app = animal_aider.app
+app.config['TESTING'] = True
+
+USERS = 50
+PASSWORD = 'senha-de-teste'
+
+
+def seed():
+    stored = auth_service.hasher.hash(PASSWORD)
+    with app.app_context():
+        db.session.add_all(
+            User(user_name=f'u{i}', user_email=f'u{i}@teste', user_pass=stored, user_phone='0', user_city='X')
+            for i in range(USERS)
+        )
+        db.session.commit()
+
+
+def run(threads, logins, time_cost, memory_cost, parallelism, workers):
+    auth_service.resize(workers or auth_service.workers, max(auth_service.queue_size, threads))
+    auth_service.configure(
+        time_cost or auth_service.hasher.time_cost,
+        memory_cost or auth_service.hasher.memory_cost,
+        parallelism or auth_service.hasher.parallelism,
+    )
+    seed()
+
+    counter = iter(range(logins))
+    lock = threading.Lock()
+    results = {'ok': 0, 'fail': 0, 'busy': 0}
+
+    def worker():
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            client = app.test_client()
+            response = client.post('/login', data={'email': f'u{n % USERS}@teste', 'password': PASSWORD})
+            key = 'ok' if response.status_code == 302 else 'busy' if response.status_code == 503 else 'fail'
+            with lock:
+                results[key] += 1
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    cores = min(auth_service.workers, os.cpu_count() or 1)
+    rate = logins / elapsed
+    h = auth_service.hasher
+    print(f'argon2 t={h.time_cost} m={h.memory_cost} p={h.parallelism}, '
+          f'{auth_service.workers} workers, {cores} núcleos, {threads} threads')
+    print(f'{logins} logins em {elapsed:.2f}s: {rate:.1f} logins/s, {rate / cores:.1f} logins/s por núcleo')
+    print(f"ok={results['ok']} recusados={results['fail']} ocupado={results['busy']}")
+
+    with app.app_context():
+        db.engine.dispose()
+    os.remove(DB_PATH)
+    if results['ok'] != logins:
+        print('FALHOU: logins válidos recusados')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=None, help='tamanho do pool do Argon2')
+    parser.add_argument('--time-cost', type=int, default=None)
+    parser.add_argument('--memory-cost', type=int, default=None)
+    parser.add_argument('--parallelism', type=int, default=None)
+    args = parser.parse_args()
+    sys.exit(run(args.threads, args.logins, args.time_cost, args.memory_cost, args.parallelism, args.workers))
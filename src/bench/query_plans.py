@@ -0,0 +1,183 @@
+"""
+Verificação dos planos de consulta das rotas.
+
+Popula um banco SQLite temporário, chama cada rota pelo cliente de teste do
+Flask, captura todo SELECT/UPDATE/DELETE emitido e roda EXPLAIN QUERY PLAN
+com os mesmos parâmetros. Falha se alguma consulta varrer uma tabela inteira
+(SCAN tbX) fora das exceções listadas em ALLOWED_SCANS.
+
+Uso: python src/bench/query_plans.py [-v]
+"""
+import os
+import re
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+from datetime import datetime as dt, timedelta
+
+APP_DIR = os.path.join(os.path.dirname(__file__), '..', 'app')
+sys.path.insert(0, APP_DIR)
+
+_fd, DB_PATH = tempfile.mkstemp(suffix='.db')
+os.close(_fd)
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+logging.disable(logging.CRITICAL)
+
+from sqlalchemy import event, text
+import app as animal_aider
+from db import db, User, Ong, Report, Rescue, Events
+from geo import ong_index, geohashEncode
+from cities import city_registry
+
+
+app = animal_aider.app
+app.config['TESTING'] = True
+
+CITIES = [f'Cidade {i}' for i in range(40)]
+ROWS = 20000
+
+# Varreduras completas aceitas de propósito: listagens sem filtro
+ALLOWED_SCANS = {
+    ('index_anonimo', 'tbOngs'),
+    ('ver_dados', 'tbReport'),
+    # Mais recentes primeiro pela chave primária, parando no limite da página
+    ('api_ongs', 'tbOngs'),
+}
+
+SCAN_RE = re.compile(r'^SCAN (tb\w+)')
+
+
+def seed():
+    random.seed(42)
+    # Cidades no registro para os filtros usarem o código IBGE
+    city_registry._apply([{'id': 3500000 + i, 'nome': c} for i, c in enumerate(CITIES)], time.time())
+    with app.app_context():
+        db.session.add_all(
+            User(user_name=f'u{i}', user_email=f'u{i}@teste', user_pass='x', user_phone='0',
+                 user_city=random.choice(CITIES))
+            for i in range(1, 501)
+        )
+        db.session.add_all(
+            Ong(ong_name=f'o{i}', ong_email=f'o{i}@teste', ong_pass='x', ong_city=random.choice(CITIES),
+                ong_lat=-23 + random.uniform(-1, 1), ong_lon=-47 + random.uniform(-1, 1))
+            for i in range(1, 201)
+        )
+        statuses = ['pendente', 'andamento', 'finalizado', 'rejeitado']
+        base = dt(2025, 1, 1)
+        for i in range(ROWS):
+            lat, lon = -23 + random.uniform(-1, 1), -47 + random.uniform(-1, 1)
+            when = base + timedelta(minutes=i * 7)
+            db.session.add(Report(
+                rep_title=f'Denúncia {i}', rep_desc='desc', rep_city=random.choice(CITIES),
+                rep_date=when, rep_phone='0', rep_status=random.choice(statuses),
+                rep_user_id=random.randint(1, 500), rep_ong_id=random.randint(1, 200),
+                rep_created_at=when, rep_lat=lat, rep_lon=lon, rep_geohash=geohashEncode(lat, lon)
+            ))
+            db.session.add(Rescue(
+                resc_desc='desc', resc_author='a', resc_phone='0', resc_city=random.choice(CITIES),
+                resc_status=random.choice(statuses), resc_user_id=random.randint(1, 500),
+                resc_ong_id=random.randint(1, 200), resc_created_at=when,
+                resc_lat=lat, resc_lon=lon, resc_geohash=geohashEncode(lat, lon)
+            ))
+        db.session.add_all(
+            Events(event_title=f'e{i}', event_description='desc', event_location='x', event_ong_id=random.randint(1, 200))
+            for i in range(2000)
+        )
+        db.session.commit()
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+        ong_index.reload()
+        ong_index._next_reload = float('inf')
+
+
+def routes():
+    ong = {'ong_logged': 1, 'ong_id': 7, 'ong_city': CITIES[3], 'ong_email': 'o7@teste'}
+    user = {'logged': 1, 'user_id': 11, 'user_city': CITIES[5], 'user_email': 'u11@teste'}
+    return [
+        ('index_anonimo', 'GET', '/', {}, None),
+        ('index_usuario', 'GET', '/', user, None),
+        ('index_ong', 'GET', '/', ong, None),
+        ('ong_cases', 'GET', '/ong_cases/report', ong, None),
+        ('user_reports', 'GET', '/user_reports', user, None),
+        ('user_rescues', 'GET', '/user_rescues', user, None),
+        ('user_cases', 'GET', '/user_cases/rescue', user, None),
+        ('ong_ongoing', 'GET', '/ong_ongoing/7', ong, None),
+        ('ong_events', 'GET', '/ong_events/7', ong, None),
+        ('ong_profile', 'GET', '/ong_profile', ong, None),
+        ('user', 'GET', '/user', user, None),
+        ('accept_report', 'POST', '/accept_report/15', ong, None),
+        ('accept_rescues', 'POST', '/accept_rescues', ong, {'ids': [1, 2, 3, 4]}),
+        ('reject_report', 'POST', '/reject_report/16', ong, None),
+        ('finish_report', 'POST', '/finish_report/17', ong, None),
+        ('delReport', 'POST', '/delReport/18', user, None),
+        ('search_cases', 'GET', f'/search_cases?q=denun&city={CITIES[3]}&status=pendente', ong, None),
+        ('ong_search', 'GET', '/ong_search?q=desc&kind=rescue&date_from=2025-01-01', ong, None),
+        ('nearby_ongs', 'GET', '/nearby_ongs?lat=-23.1&lon=-47.1&km=20', {}, None),
+        ('api_reports', 'GET', f'/api/v1/reports?city={CITIES[3]}&status=pendente&fields=title,date', ong, None),
+        ('api_rescues_since', 'GET', '/api/v1/rescues?since=2025-03-01&cursor=MjAwMDA', ong, None),
+        ('api_ongs', 'GET', '/api/v1/ongs?fields=name,city', {}, None),
+        ('api_events', 'GET', '/api/v1/events?ong=7', {}, None),
+    ]
+
+
+def explain(statement, parameters):
+    with db.engine.connect() as conn:
+        cursor = conn.connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return [row[3] for row in cursor.fetchall()]
+
+
+def run(verbose):
+    seed()
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+            captured.append((statement, parameters))
+
+    failures = 0
+    with app.app_context():
+        engines = set(db.engines.values())
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', capture)
+        for label, method, path, session, payload in routes():
+            client = app.test_client()
+            with client.session_transaction() as s:
+                s.update(session)
+
+            captured.clear()
+            response = client.open(path, method=method, json=payload)
+            statements = list(captured)
+
+            print(f'{label:16} {method:4} {path:45} {response.status_code} {len(statements)} consultas')
+            for statement, parameters in statements:
+                plan = explain(statement, parameters)
+                scans = [m.group(1) for m in map(SCAN_RE.match, plan) if m]
+                bad = [t for t in scans if (label, t) not in ALLOWED_SCANS]
+                if bad or verbose:
+                    print('   ', ' '.join(statement.split())[:160])
+                    for line in plan:
+                        print('       ', line)
+                if bad:
+                    failures += 1
+                    print(f'    VARREDURA COMPLETA: {", ".join(bad)}')
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', capture)
+            engine.dispose()
+
+    os.remove(DB_PATH)
+    if failures:
+        print(f'FALHOU: {failures} consultas sem índice')
+        return 1
+    print('OK: nenhuma consulta varre tabela inteira')
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('-v', '--verbose', action='store_true', help='mostra todos os planos')
+    sys.exit(run(parser.parse_args().verbose))
@@ -0,0 +1,119 @@
+"""
+Tempo de renderização das páginas mais acessadas, com e sem o cache de
+trechos de HTML (fragments.py).
+
+Gera um banco temporário com seed_data.py, carrega a lista completa de
+municípios (645, como a do IBGE para SP) e chama cada página pelo cliente
+de teste do Flask, primeiro com FRAGMENT_CACHE_ENABLED desligado e depois
+ligado. Mostra, por página, o tempo médio total e o tempo dos templates
+(medido pelo request_profiler) e a diferença entre os dois modos. O HTML
+das duas rodadas precisa ser idêntico.
+
+Uso: python src/bench/render_bench.py --rounds 200 [--ongs 300] [--reports 5000]
+"""
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'app'))
+
+from seed_data import generate
+
+SP_MUNICIPIOS = 645
+
+
+def pages(data):
+    ong = {'ong_logged': 1, 'ong_id': 1, 'ong_city': data['cities'][0], 'ong_email': 'ong1@exemplo.com'}
+    user = {'logged': 1, 'user_id': 1, 'user_city': data['cities'][0], 'user_email': 'usuario1@exemplo.com'}
+    return [
+        ('index_anonimo', '/', {}),
+        ('index_usuario', '/', user),
+        ('index_ong', '/', ong),
+        ('ong_cases', '/ong_cases/report', ong),
+        ('register', '/register', {}),
+        ('report', '/report', {}),
+        ('ong_profile', '/ong_profile', ong),
+    ]
+
+
+def measure(app, profiler, label, path, session, rounds):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s.update(session)
+    # Primeira chamada fora da conta: enche o cache e os caches do Jinja
+    first = client.get(path).data
+    profiler.routes.clear()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        response = client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f'{label}: status {response.status_code}')
+    wall = (time.perf_counter() - start) / rounds
+    route = next(iter(profiler.routes.values())).as_dict()
+    return first, wall * 1000, route['template_ms_avg']
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix='animal_aider_render_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    logging.disable(logging.CRITICAL)
+
+    import app as animal_aider
+    from auth import auth_service
+    from cities import city_registry
+    from fragments import fragment_cache
+    from profiling import request_profiler
+    from http_stub import MUNICIPIOS
+
+    app = animal_aider.app
+    app.config['TESTING'] = True
+    auth_service.configure(1, 8192, 1)
+    municipios = list(MUNICIPIOS) + [
+        {'id': 3600000 + i, 'nome': f'Município {i:03d}'} for i in range(len(MUNICIPIOS), SP_MUNICIPIOS)
+    ]
+    city_registry._apply(municipios, time.time())
+    data = generate(app, users=200, ongs=args.ongs, reports=args.reports, rescues=args.reports,
+                    events=0, photos=0, cities=20, seed=args.seed)
+
+    results = {}
+    for enabled in (False, True):
+        fragment_cache.enabled = enabled
+        fragment_cache.clear()
+        for label, path, session in pages(data):
+            results[label, enabled] = measure(app, request_profiler, label, path, session, args.rounds)
+
+    failures = 0
+    print(f"{'página':14} {'sem cache ms':>12} {'tpl ms':>8} {'com cache ms':>12} {'tpl ms':>8} {'tpl':>6}")
+    for label, _, _ in pages(data):
+        html_off, wall_off, tpl_off = results[label, False]
+        html_on, wall_on, tpl_on = results[label, True]
+        delta = f'{(tpl_on - tpl_off) / tpl_off * 100:+.0f}%' if tpl_off else 'n/a'
+        print(f'{label:14} {wall_off:>12.2f} {tpl_off:>8.2f} {wall_on:>12.2f} {tpl_on:>8.2f} {delta:>6}')
+        if html_off != html_on:
+            failures += 1
+            print(f'    HTML diferente com o cache ligado')
+    print(f"cache: {fragment_cache.stats()}")
+
+    with app.app_context():
+        for engine in animal_aider.db.engines.values():
+            engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    if failures:
+        print('FALHOU: o cache mudou o HTML')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rounds', type=int, default=200, help='requisições por página e modo')
+    parser.add_argument('--ongs', type=int, default=300)
+    parser.add_argument('--reports', type=int, default=5000, help='denúncias e resgates no banco')
+    parser.add_argument('--seed', type=int, default=42)
+    sys.exit(main(parser.parse_args()))
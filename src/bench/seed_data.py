@@ -0,0 +1,263 @@
+"""
+Gerador de dados sintéticos para benchmarks.
+
+Preenche um banco SQLite com volumes realistas: usuários, ONGs espalhadas
+pelos municípios (cidades grandes concentram mais casos), milhões de
+denúncias e resgates com coordenadas, status e datas variados, eventos e
+fotos de exemplo gravadas no blob store. Com a mesma semente o resultado é
+sempre o mesmo. Todas as contas usam a senha PASSWORD.
+
+Uso: python src/bench/seed_data.py --db /tmp/animal_aider.db --reports 1000000 --rescues 1000000 --ongs 5000 [--seed 42]
+"""
+import io
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+from collections import Counter
+from datetime import datetime as dt, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+PASSWORD = 'senha-de-teste'
+BATCH = 10000
+
+# Limites aproximados do estado de SP
+LAT_RANGE = (-25.3, -19.8)
+LON_RANGE = (-53.1, -44.2)
+
+STATUSES = ['pendente', 'andamento', 'finalizado', 'rejeitado']
+STATUS_WEIGHTS = [20, 15, 55, 10]
+
+ANIMALS = ['Cachorro', 'Gato', 'Cavalo', 'Filhote', 'Cadela', 'Gata', 'Pássaro', 'Vaca']
+SITUATIONS = ['abandonado', 'ferido', 'preso sem água', 'em maus-tratos', 'atropelado',
+              'acorrentado', 'desnutrido', 'perdido', 'no telhado', 'em situação de rua']
+DETAILS = ['Está no local há vários dias.', 'Os vizinhos confirmaram a situação.',
+           'Parece estar com a pata machucada.', 'Fica perto do portão da casa.',
+           'Já tentamos contato com o dono.', 'Precisa de atendimento urgente.',
+           'Aparece sempre no fim da tarde.', 'Está muito magro e assustado.']
+STREETS = ['Rua das Flores', 'Av. Brasil', 'Rua São João', 'Rua XV de Novembro',
+           'Av. Paulista', 'Rua Sete de Setembro', 'Rua Barão de Jundiaí', 'Av. Independência']
+
+
+def cityList(count):
+    """
+    Municípios do snapshot do IBGE (ou da lista embutida); sem eles, os do stub completados
+    com nomes sintéticos até count.
+    """
+    from cities import city_registry
+    cities = list(city_registry.cities)
+    if not cities:
+        from http_stub import MUNICIPIOS
+        cities = [m['nome'] for m in MUNICIPIOS]
+        cities += [f'Município {i:03d}' for i in range(len(cities), count)]
+    return cities[:count]
+
+
+def samplePhotos(count, rng):
+    """
+    Gera fotos JPEG simples (gradiente e ruído) e grava no blob store.
+    """
+    from PIL import Image
+    from blobstore import blob_store
+    keys = []
+    for _ in range(count):
+        w, h = rng.choice([(1600, 1200), (1200, 1600), (800, 600), (1024, 768)])
+        base = tuple(rng.randrange(256) for _ in range(3))
+        image = Image.new('RGB', (w, h), base)
+        image.paste(Image.effect_noise((w // 2, h // 2), rng.randrange(20, 80)).convert('RGB'), (w // 4, h // 4))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        buffer.seek(0)
+        key, _ = blob_store.put(buffer, 'jpg')
+        keys.append(key)
+    return keys
+
+
+def _insert(conn, model, rows):
+    from sqlalchemy import insert
+    conn.execute(insert(model), rows)
+    conn.commit()
+
+def _batched(conn, model, generator):
+    total = 0
+    batch = []
+    for row in generator:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            _insert(conn, model, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        _insert(conn, model, batch)
+        total += len(batch)
+    return total
+
+
+def generate(app, users=10000, ongs=1000, reports=100000, rescues=100000, events=5000,
+             photos=50, cities=200, seed=42):
+    """
+    Preenche o banco da aplicação. Retorna um resumo com as cidades usadas e
+    as contagens, para o driver de carga escolher dados existentes.
+    """
+    from sqlalchemy import update, text
+    from db import db, User, Ong, Report, Rescue, Events, Blob
+    from geo import geohashEncode, ong_index
+    from auth import auth_service
+    from cities import city_registry
+
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    stored = auth_service.hasher.hash(PASSWORD)
+    now = dt(2025, 6, 1)
+
+    with app.app_context():
+        city_names = cityList(cities)
+        # Centro de cada cidade e peso (lei de Zipf: poucas cidades grandes)
+        centers = {c: (rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for c in city_names}
+        weights = [1 / (rank + 1) ** 0.9 for rank in range(len(city_names))]
+        # Sem o registro carregado os códigos ficam nulos e o backfill preenche depois
+        codes = {c: city_registry.code(c) for c in city_names}
+        photo_keys = samplePhotos(photos, rng) if photos else []
+        photo_refs = Counter()
+
+        def city():
+            return rng.choices(city_names, weights)[0]
+
+        def near(name, spread=0.08):
+            lat, lon = centers[name]
+            return lat + rng.uniform(-spread, spread), lon + rng.uniform(-spread, spread)
+
+        def photo(chance):
+            if not photo_keys or rng.random() > chance:
+                return None
+            key = rng.choice(photo_keys)
+            photo_refs[key] += 1
+            return key
+
+        def phone():
+            return f'(11) 9{rng.randrange(10000000, 99999999)}'
+
+        def userRows():
+            for i in range(1, users + 1):
+                name = city()
+                yield {
+                    'user_name': f'Usuário {i}', 'user_email': f'u{i}@exemplo.com', 'user_pass': stored,
+                    'user_phone': phone(), 'user_city': name, 'user_city_id': codes[name],
+                    'user_address': rng.choice(STREETS), 'user_num': str(rng.randrange(1, 3000)),
+                    'user_profile_photo': photo(0.2),
+                }
+
+        def ongRows():
+            for i in range(1, ongs + 1):
+                name = city()
+                lat, lon = near(name, 0.05)
+                yield {
+                    'ong_name': f'ONG Amigos dos Animais {i}', 'ong_email': f'ong{i}@exemplo.com',
+                    'ong_pass': stored, 'ong_phone': phone(), 'ong_city': name, 'ong_city_id': codes[name],
+                    'ong_address': rng.choice(STREETS), 'ong_num': str(rng.randrange(1, 3000)),
+                    'ong_desc': 'Resgate e adoção responsável.', 'ong_profile_photo': photo(0.5),
+                    'ong_lat': lat, 'ong_lon': lon, 'ong_radius_km': rng.choice([5, 10, 20, 30]),
+                }
+
+        def caseFields():
+            name = city()
+            lat, lon = near(name)
+            status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+            when = now - timedelta(minutes=rng.randrange(3 * 365 * 24 * 60))
+            ong_id = rng.randrange(1, ongs + 1) if status != 'pendente' and ongs else None
+            user_id = rng.randrange(1, users + 1) if users and rng.random() < 0.7 else None
+            text = f'{rng.choice(ANIMALS)} {rng.choice(SITUATIONS)}'
+            desc = ' '.join(rng.sample(DETAILS, 2))
+            addr = f'{rng.choice(STREETS)}, {rng.randrange(1, 3000)}'
+            return name, lat, lon, status, when, ong_id, user_id, text, desc, addr
+
+        def reportRows():
+            for _ in range(reports):
+                name, lat, lon, status, when, ong_id, user_id, text, desc, addr = caseFields()
+                yield {
+                    'rep_title': text, 'rep_desc': f'{text}. {desc}', 'rep_city': name,
+                    'rep_city_id': codes[name], 'rep_address': addr,
+                    'rep_date': when, 'rep_phone': phone(), 'rep_status': status, 'rep_photo': photo(0.6),
+                    'rep_user_id': user_id, 'rep_ong_id': ong_id, 'rep_created_at': when,
+                    'rep_lat': lat, 'rep_lon': lon, 'rep_geohash': geohashEncode(lat, lon),
+                }
+
+        def rescueRows():
+            for _ in range(rescues):
+                name, lat, lon, status, when, ong_id, user_id, text, desc, addr = caseFields()
+                yield {
+                    'resc_desc': f'{text}. {desc}', 'resc_author': f'Pessoa {rng.randrange(100000)}',
+                    'resc_phone': phone(), 'resc_city': name, 'resc_city_id': codes[name], 'resc_addr': addr,
+                    'resc_num': str(rng.randrange(1, 3000)), 'resc_status': status, 'resc_photo': photo(0.6),
+                    'resc_user_id': user_id, 'resc_ong_id': ong_id, 'resc_date': when, 'resc_created_at': when,
+                    'resc_lat': lat, 'resc_lon': lon, 'resc_geohash': geohashEncode(lat, lon),
+                }
+
+        def eventRows():
+            for i in range(events):
+                when = now + timedelta(days=rng.randrange(-365, 90))
+                name = city()
+                yield {
+                    'event_title': f'Feira de adoção {i}', 'event_description': 'Venha conhecer nossos animais.',
+                    'event_date': when, 'event_location': rng.choice(STREETS),
+                    'event_city': name, 'event_city_id': codes[name],
+                    'event_photo': photo(0.5), 'event_created_at': when,
+                    'event_ong_id': rng.randrange(1, ongs + 1),
+                }
+
+        counts = {}
+        with db.engine.connect() as conn:
+            counts['users'] = _batched(conn, User, userRows())
+            counts['ongs'] = _batched(conn, Ong, ongRows())
+            counts['reports'] = _batched(conn, Report, reportRows())
+            counts['rescues'] = _batched(conn, Rescue, rescueRows())
+            counts['events'] = _batched(conn, Events, eventRows()) if ongs else 0
+            # Cada foto foi gravada uma vez; a contagem passa a ser o número de usos
+            for key in photo_keys:
+                conn.execute(update(Blob).where(Blob.blob_key == key).values(blob_refs=photo_refs[key] or 1))
+            conn.execute(text('ANALYZE'))
+            conn.commit()
+        ong_index.reload()
+
+    elapsed = time.perf_counter() - start
+    return {
+        'seed': seed,
+        'cities': city_names,
+        'counts': counts,
+        'photos': photo_keys,
+        'elapsed': elapsed,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--db', required=True, help='arquivo SQLite (criado se não existir)')
+    parser.add_argument('--uploads', default=None, help='pasta das fotos (padrão: <db>.uploads)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--ongs', type=int, default=1000)
+    parser.add_argument('--reports', type=int, default=100000)
+    parser.add_argument('--rescues', type=int, default=100000)
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--photos', type=int, default=50)
+    parser.add_argument('--cities', type=int, default=645)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.db)}'
+    logging.disable(logging.CRITICAL)
+    import app as animal_aider
+    from blobstore import blob_store
+    from images import image_pipeline
+    blob_store.root = image_pipeline.upload_folder = args.uploads or os.path.abspath(args.db) + '.uploads'
+
+    summary = generate(animal_aider.app, users=args.users, ongs=args.ongs, reports=args.reports,
+                       rescues=args.rescues, events=args.events, photos=args.photos,
+                       cities=args.cities, seed=args.seed)
+    total = sum(summary['counts'].values())
+    print(', '.join(f'{n} {name}' for name, n in summary['counts'].items()))
+    print(f"{len(summary['cities'])} cidades, {len(summary['photos'])} fotos em {blob_store.root}")
+    print(f"{total} linhas em {summary['elapsed']:.1f}s ({total / summary['elapsed']:.0f} linhas/s)")
+    print('OK')
@@ -0,0 +1,199 @@
+"""
+Escritas e leituras concorrentes no SQLite, por modo de armazenamento.
+
+Para cada SQLITE_MODE (padrão: default e wal) sobe a aplicação num processo
+separado, com um banco gerado por seed_data.py, e durante o mesmo intervalo
+põe threads enviando denúncias e aceitando casos enquanto outras abrem o
+painel da ONG. Mostra a vazão das escritas, a latência das leituras
+(p50/p95/p99) e quantas respostas falharam (ex.: "database is locked").
+
+Uso: python src/bench/storage_bench.py [--modes default wal] --writers 4 --readers 4 --seconds 10
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime as dt
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'app'))
+
+import requests
+
+from load_test import serve, percentile
+from seed_data import generate, PASSWORD
+
+
+def smallPhoto():
+    # Foto pequena: o custo medido é o do banco, não o do Pillow
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.effect_noise((64, 64), 40).convert('RGB').save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def workload(base, data, writers, readers, seconds):
+    photo = smallPhoto()
+    today = dt.today().strftime('%Y-%m-%d')
+    city = data['cities'][0]
+    stop = threading.Event()
+    lock = threading.Lock()
+    writes, write_errors, reads, read_errors = [], [], [], []
+
+    def login_ong(session, n):
+        session.post(f'{base}/ong_login', data={'email': f'ong{n}@exemplo.com', 'password': PASSWORD})
+
+    def writer(n):
+        session = requests.Session()
+        ong = requests.Session()
+        login_ong(ong, n % data['ongs'] + 1)
+        i = 0
+        while not stop.is_set():
+            i += 1
+            try:
+                response = session.post(f'{base}/report', allow_redirects=False, data={
+                    'title': f'Gato abandonado {n}-{i}', 'desc': 'Está no local há vários dias.',
+                    'date': today, 'city': city, 'phone': '(11) 99999-0000',
+                }, files={'photo': ('foto.jpg', photo, 'image/jpeg')})
+                ok = response.status_code == 302
+                if ok:
+                    with lock:
+                        report_id = data['next_report']
+                        data['next_report'] += 1
+                    response = ong.post(f'{base}/accept_report/{report_id}')
+                    ok = response.status_code in (200, 403, 404, 409)
+                detail = response.status_code
+            except requests.RequestException as e:
+                ok, detail = False, type(e).__name__
+            with lock:
+                (writes if ok else write_errors).append(detail)
+
+    def reader(n):
+        session = requests.Session()
+        login_ong(session, n % data['ongs'] + 1)
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                response = session.get(f'{base}/' if random.random() < 0.5 else f'{base}/ong_cases/report')
+                ok, detail = response.status_code == 200, response.status_code
+            except requests.RequestException as e:
+                ok, detail = False, type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                reads.append(elapsed)
+                if not ok:
+                    read_errors.append(detail)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    threads += [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    return {
+        'writes': len(writes),
+        'writes_per_s': round(len(writes) / seconds, 1),
+        'write_errors': len(write_errors),
+        'reads': len(reads),
+        'read_p50_ms': round(percentile(reads, 50) * 1000, 2),
+        'read_p95_ms': round(percentile(reads, 95) * 1000, 2),
+        'read_p99_ms': round(percentile(reads, 99) * 1000, 2),
+        'read_errors': len(read_errors),
+        'error_codes': sorted({str(e) for e in write_errors + read_errors}),
+    }
+
+
+def child(args):
+    """
+    Um modo por processo: a aplicação lê SQLITE_MODE quando é importada.
+    """
+    workdir = tempfile.mkdtemp(prefix='animal_aider_storage_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['SQLITE_MODE'] = args.child
+    logging.disable(logging.CRITICAL)
+
+    import app as animal_aider
+    from sqlalchemy import func
+    from blobstore import blob_store
+    from images import image_pipeline
+    from auth import auth_service
+
+    app = animal_aider.app
+    blob_store.root = image_pipeline.upload_folder = os.path.join(workdir, 'uploads')
+    auth_service.configure(1, 8192, 1)
+    summary = generate(app, users=200, ongs=args.writers + args.readers, reports=args.reports,
+                       rescues=args.reports, events=0, photos=0, cities=20, seed=args.seed)
+    with app.app_context():
+        last = animal_aider.db.session.query(func.max(animal_aider.Report.rep_id)).scalar() or 0
+    data = {'cities': summary['cities'], 'ongs': summary['counts']['ongs'], 'next_report': last + 1}
+
+    server, stub, base = serve(app, data['cities'], workdir)
+    random.seed(args.seed)
+    result = workload(base, data, args.writers, args.readers, args.seconds)
+    server.shutdown()
+    stub.shutdown()
+    with app.app_context():
+        for engine in animal_aider.db.engines.values():
+            engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(result))
+
+
+def main(args):
+    results = {}
+    print(f"{'modo':8} {'escritas/s':>10} {'erros esc':>9} {'leituras':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erros leit':>10}")
+    for mode in args.modes:
+        out = subprocess.run(
+            [sys.executable, __file__, '--child', mode, '--writers', str(args.writers),
+             '--readers', str(args.readers), '--seconds', str(args.seconds),
+             '--reports', str(args.reports), '--seed', str(args.seed)],
+            capture_output=True, text=True,
+        )
+        if out.returncode != 0:
+            print(out.stderr)
+            return 1
+        r = results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{mode:8} {r['writes_per_s']:>10.1f} {r['write_errors']:>9} {r['reads']:>9} {r['read_p50_ms']:>8.1f} "
+              f"{r['read_p95_ms']:>8.1f} {r['read_p99_ms']:>8.1f} {r['read_errors']:>10}"
+              + (f"  ({', '.join(r['error_codes'])})" if r['error_codes'] else ''), flush=True)
+
+    if len(args.modes) > 1:
+        first, last = results[args.modes[0]], results[args.modes[-1]]
+
+        def delta(key):
+            return f'{(last[key] - first[key]) / first[key] * 100:+.0f}%' if first[key] else 'n/a'
+        print(f"\n{args.modes[0]} -> {args.modes[-1]}: escritas/s {delta('writes_per_s')}, "
+              f"leitura p95 {delta('read_p95_ms')}, p99 {delta('read_p99_ms')}")
+
+    if any(r['write_errors'] or r['read_errors'] for r in results.values()):
+        print('FALHOU: respostas inesperadas')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--modes', nargs='*', default=['default', 'wal'], help='valores de SQLITE_MODE')
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--reports', type=int, default=20000, help='denúncias e resgates no banco')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        sys.exit(0)
+    sys.exit(main(args))
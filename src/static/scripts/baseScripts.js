@@ -526,6 +526,72 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+// ========================================
+// GEOLOCALIZAÇÃO
+// ========================================
+
+/**
+ * Preenche os campos ocultos lat/lon (marcados com data-geolocate) com a
+ * posição do navegador, usada para encontrar ONGs próximas.
+ * Campos que já têm valor não são alterados.
+ */
+document.addEventListener('DOMContentLoaded', function() {
+    const latInput = document.querySelector('input[name="lat"][data-geolocate]');
+    const lonInput = document.querySelector('input[name="lon"][data-geolocate]');
+
+    if (!latInput || !lonInput || latInput.value || !navigator.geolocation) {
+        return;
+    }
+
+    navigator.geolocation.getCurrentPosition(function(position) {
+        latInput.value = position.coords.latitude.toFixed(6);
+        lonInput.value = position.coords.longitude.toFixed(6);
+    }, function(error) {
+        console.warn('Localização indisponível:', error.message);
+    }, { enableHighAccuracy: false, timeout: 10000, maximumAge: 600000 });
+});
+
+// ========================================
+// PAGINAÇÃO ("CARREGAR MAIS")
+// ========================================
+
+/**
+ * Botões com data-load-more buscam a próxima página em JSON
+ * ({html, next_url}) e acrescentam os cards no elemento data-target.
+ */
+document.addEventListener('click', function(e) {
+    const button = e.target.closest('[data-load-more]');
+    if (!button) {
+        return;
+    }
+
+    button.disabled = true;
+    fetch(button.dataset.loadMore, { headers: { 'Accept': 'application/json' } })
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                throw new Error(data.message);
+            }
+            const target = document.getElementById(button.dataset.target);
+            if (target) {
+                target.insertAdjacentHTML('beforeend', data.html);
+            }
+            if (data.next_url) {
+                button.dataset.loadMore = data.next_url;
+                button.disabled = false;
+            } else {
+                button.remove();
+            }
+            if (typeof updateCounters === 'function') {
+                updateCounters();
+            }
+        })
+        .catch(error => {
+            console.error('Erro ao carregar mais itens:', error);
+            button.disabled = false;
+        });
+});
+
 function previewImage(event) {
     const file = event.target.files[0];
     const reader = new FileReader();